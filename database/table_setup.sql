@@ -1,4 +1,39 @@
-CREATE TABLE IF NOT EXISTS images(
-    id serial PRIMARY KEY,
-    image bytea NOT NULL
-);
\ No newline at end of file
+-- События обнаружения позы. Изображение человека хранится в файловом хранилище по ключу blob_key.
+CREATE TABLE IF NOT EXISTS events(
+    id bigserial PRIMARY KEY,
+    created_at timestamptz NOT NULL,
+    -- Источник видео и номер кадра в нём
+    stream_id text NOT NULL,
+    frame_index integer NOT NULL,
+    -- Номер трека (Person.index), уникален в пределах источника
+    track_index integer NOT NULL,
+    min_x integer NOT NULL,
+    min_y integer NOT NULL,
+    max_x integer NOT NULL,
+    max_y integer NOT NULL,
+    score real NOT NULL,
+    pose text NOT NULL,
+    -- SHA-256 изображения в файловом хранилище
+    blob_key char(64) NOT NULL
+);
+
+-- Последние изображения выбираются по первичному ключу, отдельный индекс по id не нужен
+DROP INDEX IF EXISTS events_id_blob_key_idx;
+-- Постраничное чтение по ключу (created_at, id): по времени, по источнику, по треку в источнике и по треку
+-- без источника
+CREATE INDEX IF NOT EXISTS events_created_at_idx ON events (created_at, id);
+CREATE INDEX IF NOT EXISTS events_stream_created_at_idx ON events (stream_id, created_at, id);
+CREATE INDEX IF NOT EXISTS events_stream_track_created_at_idx ON events (stream_id, track_index, created_at, id);
+CREATE INDEX IF NOT EXISTS events_track_created_at_idx ON events (track_index, created_at, id);
+
+-- Уведомление веб-приложения о новых событиях для обновления кэша последних изображений
+CREATE OR REPLACE FUNCTION notify_events_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('events', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS events_inserted ON events;
+CREATE TRIGGER events_inserted AFTER INSERT ON events
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_events_inserted();
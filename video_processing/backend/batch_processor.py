@@ -0,0 +1,169 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from .detection_stage import DetectionStage
+from .detectors import RaisingArmsMomentDetector
+from .event_sinks import EventSink
+from .frame_encoder import FrameEncoder
+from .frame_reader import FrameReader
+from .metrics import pipeline_metrics
+from .pose_estimator import PoseEstimator
+from .pose_estimator.decoder_pool import DecoderPool
+from .trackers import SkeletonTracker
+
+logging.basicConfig(level=logging.DEBUG)
+
+# Фабрика приемника событий: видеофайл -> приемник (должна передаваться в другой процесс, например functools.partial)
+SinkFactory = Callable[[str], EventSink]
+
+
+class BatchResult(NamedTuple):
+    """Итог обработки видеофайла: число кадров, число событий и длительность обработки, с."""
+    video_file: str
+    frames: int
+    events: int
+    elapsed: float
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.elapsed if self.elapsed else 0.
+
+
+class BatchProcessor:
+    """
+    Класс пакетной обработки видеофайлов (архивов записей) без стриминга и отрисовки.
+    Каждый файл читается один раз от начала до конца, каждый кадр проходит через нейронную сеть
+    (асинхронно, пакетами по batch_size кадров) и DetectionStage (трекер, правила поз и детектор момента,
+    как при обработке видео); изображения людей в искомой позе передаются в приемник событий,
+    который записывает их разом.
+    Нейронная сеть загружается один раз на размер кадра и используется для всех файлов этого размера.
+    """
+
+    def __init__(self, sink_factory: SinkFactory, num_infer_requests: int = 2, batch_size: int = 1,
+                 cpu_threads: int = 0, reader_queue_size: int = 8, target_pose: str = 'raised_arms',
+                 jpeg_quality: int = 95, decode_workers: int = 0):
+        """
+        sink_factory - функция создания приемника событий для видеофайла.
+        num_infer_requests - число одновременно выполняемых запросов инференса.
+        batch_size - число кадров файла в одном запросе инференса.
+        cpu_threads - число потоков инференса на CPU (0 - по числу ядер).
+        reader_queue_size - число заранее декодированных кадров.
+        target_pose - правило PoseRuleEngine, при первом срабатывании которого изображение человека сохраняется.
+        decode_workers - число процессов декодирования поз (0 - декодирование в процессе обработки).
+        """
+        self._sink_factory = sink_factory
+        self._num_infer_requests = max(num_infer_requests, 1)
+        self._batch_size = batch_size
+        self._cpu_threads = cpu_threads
+        self._decode_workers = decode_workers
+        self._reader_queue_size = reader_queue_size
+        self._detection_stage = DetectionStage(FrameEncoder(num_workers=0, quality=jpeg_quality), target_pose)
+        self._pose_estimators: Dict[tuple, PoseEstimator] = {}
+
+    def _pose_estimator(self, frame_shape: tuple) -> PoseEstimator:
+        pose_estimator = self._pose_estimators.get(frame_shape)
+        if pose_estimator is None:
+            pose_estimator = PoseEstimator(frame_shape, num_requests=self._num_infer_requests,
+                                           batch_size=self._batch_size, cpu_threads=self._cpu_threads,
+                                           decode_workers=self._decode_workers)
+            self._pose_estimators[frame_shape] = pose_estimator
+        return pose_estimator
+
+    def process(self, video_file: str) -> BatchResult:
+        """Метод обработки видеофайла от начала до конца. События записываются по окончании файла."""
+        start = time.perf_counter()
+        # Кадры, удерживаемые обработкой: пакеты на инференсе и декодировании и набираемый пакет.
+        decode_slots = self._decode_workers * DecoderPool.slots_per_worker
+        reserve = (self._num_infer_requests + 1 + decode_slots) * self._batch_size
+        frame_reader = FrameReader(video_file, self._reader_queue_size, 'all', reserve, loop=False,
+                                   name=f'frame_reader_thread_{video_file}', daemon=True)
+        pose_estimator = self._pose_estimator(frame_reader.frame_shape)
+        skeleton_tracker = SkeletonTracker()
+        unique_detector = RaisingArmsMomentDetector()
+        frames = 0
+        frame_reader.start()
+        try:
+            with self._sink_factory(video_file) as sink:
+                def process_results(results: List[Tuple[List[Tuple[int, np.ndarray]], list]]) -> None:
+                    for batch, batch_results in results:
+                        for (frame_index, frame), (poses, _) in zip(batch, batch_results):
+                            detection = self._detection_stage.process(video_file, frame, frame_index, poses,
+                                                                      pose_estimator, skeleton_tracker, unique_detector)
+                            for crop in detection.crops:
+                                sink.put(crop)
+                            frame_reader.release(frame)
+
+                batch = []
+                while True:
+                    frame_data = frame_reader.get()
+                    if frame_data is not None:
+                        batch.append(frame_data)
+                        frames += 1
+                    if batch and (frame_data is None or len(batch) == self._batch_size):
+                        process_results(pose_estimator.submit_batch([frame for _, frame in batch], context=batch))
+                        batch = []
+                    if frame_data is None:
+                        break
+                process_results(pose_estimator.flush())
+        finally:
+            frame_reader.stop()
+            frame_reader.join()
+            # После ошибки запросы могли остаться в работе, их результаты не нужны.
+            pose_estimator.flush()
+        result = BatchResult(video_file, frames, sink.events_count, time.perf_counter() - start)
+        logging.info(f'{video_file}: {result.frames} frames, {result.events} events, '
+                     f'{result.elapsed:.1f} s ({result.fps:.1f} fps); {pipeline_metrics.summary()}')
+        return result
+
+
+# Обработчик процесса пула, создается при запуске процесса
+_worker_processor: BatchProcessor = None
+
+
+def _init_worker(sink_factory: SinkFactory, processor_kwargs: dict) -> None:
+    global _worker_processor
+    _worker_processor = BatchProcessor(sink_factory, **processor_kwargs)
+
+
+def _process_in_worker(video_file: str) -> BatchResult:
+    return _worker_processor.process(video_file)
+
+
+def process_files(video_files: Sequence[str], sink_factory: SinkFactory, workers: int = 1,
+                  **processor_kwargs) -> List[BatchResult]:
+    """
+    Функция обработки видеофайлов в пуле из workers процессов (при workers <= 1 - в текущем процессе).
+    Каждый процесс загружает свою нейронную сеть и обрабатывает файлы целиком; если число потоков инференса
+    (cpu_threads) не задано, ядра делятся между процессами поровну.
+    Параметры processor_kwargs передаются в BatchProcessor. Возвращает итоги в порядке файлов.
+    Ошибка обработки файла записывается в лог и не останавливает обработку остальных файлов.
+    """
+    # Итоги хранятся по номеру файла: одно имя может встречаться несколько раз (приемник в БД это допускает).
+    results = {}
+    if workers <= 1:
+        processor = BatchProcessor(sink_factory, **processor_kwargs)
+        for index, video_file in enumerate(video_files):
+            try:
+                results[index] = processor.process(video_file)
+            except Exception as e:
+                logging.error(f'Failed to process {video_file}: {e!r}')
+    else:
+        workers = min(workers, len(video_files))
+        if not processor_kwargs.get('cpu_threads'):
+            processor_kwargs['cpu_threads'] = max((os.cpu_count() or 1) // workers, 1)
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(sink_factory, processor_kwargs)) as pool:
+            futures = {pool.submit(_process_in_worker, video_file): index
+                       for index, video_file in enumerate(video_files)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logging.error(f'Failed to process {video_files[index]}: {e!r}')
+    return [results[index] for index in sorted(results)]
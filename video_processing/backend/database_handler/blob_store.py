@@ -0,0 +1,76 @@
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+
+
+class BlobStore(ABC):
+    """Хранилище содержимого изображений. В БД хранится только ключ, возвращаемый put."""
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Метод сохранения данных. Возвращает ключ."""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """Метод чтения данных по ключу. Если данных нет, вызывает KeyError."""
+
+
+class FileBlobStore(BlobStore):
+    """
+    Файловое хранилище с адресацией по содержимому: ключ - SHA-256 данных, одинаковые изображения хранятся один раз.
+    Файлы раскладываются по вложенным директориям по первым символам ключа (root/ab/cd/abcd...),
+    чтобы директории не разрастались. Запись атомарна: данные пишутся во временный файл, сбрасываются на диск
+    и переименовываются, после чего сбрасывается запись в директории.
+    """
+    # Число уровней вложенных директорий и символов ключа на уровень
+    _shard_levels = 2
+    _shard_width = 2
+    _suffix = '.jpg'
+    _key_pattern = re.compile('[0-9a-f]{64}')
+
+    def __init__(self, root: str):
+        self._root = root
+        os.makedirs(self._root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        shards = [key[i * self._shard_width: (i + 1) * self._shard_width] for i in range(self._shard_levels)]
+        return os.path.join(self._root, *shards, key + self._suffix)
+
+    @staticmethod
+    def _fsync_dir(path: str) -> None:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def put(self, data: bytes) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._fsync_dir(directory)
+        return key
+
+    def get(self, key: str) -> bytes:
+        if not self._key_pattern.fullmatch(key):
+            raise KeyError(key)
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key) from None
@@ -0,0 +1,154 @@
+import logging
+import time
+from collections import deque
+from threading import Condition, Thread
+from typing import List, Optional
+
+import psycopg2
+
+from ..metrics import pipeline_metrics
+from .db_handler import Crop, DBHandler
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class DBWriter(Thread):
+    """
+    Поток записи изображений в БД.
+    Изображения накапливаются в ограниченной очереди и записываются пакетами: одним обращением к БД
+    и одной транзакцией на пакет. Пакет записывается при наборе batch_size изображений или через flush_interval
+    секунд после поступления первого изображения пакета.
+    При недоступности БД (DBHandler уже исчерпал свои повторные попытки) пакет не теряется:
+    запись повторяется каждые retry_interval секунд, а очередь тем временем заполняется и переполняется согласно политике:
+    'block' - put ждет освобождения места (обратное давление на обработку видео);
+    'drop_oldest' - отбрасывается самое старое изображение очереди;
+    'drop_newest' - отбрасывается новое изображение.
+    db_handler - любой объект с методами connect, disconnect и insert_images (например, заглушка в тестах).
+    """
+    policies = ('block', 'drop_oldest', 'drop_newest')
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def rows_written(self) -> int:
+        return self._rows_written
+
+    @property
+    def rows_dropped(self) -> int:
+        return self._rows_dropped
+
+    def __init__(self, db_handler: DBHandler, queue_size: int = 256, batch_size: int = 32,
+                 flush_interval: float = 0.5, policy: str = 'drop_oldest', retry_interval: float = 1.0,
+                 *args, **kwargs):
+        if policy not in self.policies:
+            raise ValueError(f'Unknown DB writer policy: {policy}')
+        self._db_handler = db_handler
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._policy = policy
+        self._retry_interval = retry_interval
+
+        self._condition = Condition()
+        self._queue = deque()
+        self._stopped = False
+        self._connected = False
+        self._rows_written = 0
+        self._rows_dropped = 0
+        super().__init__(*args, **kwargs)
+
+    def put(self, crop: Crop) -> bool:
+        """Метод постановки изображения в очередь. Возвращает False, если изображение отброшено."""
+        with self._condition:
+            if self._policy == 'block':
+                while len(self._queue) >= self._queue_size and not self._stopped:
+                    self._condition.wait()
+            if self._stopped:
+                return False
+            if len(self._queue) >= self._queue_size:
+                self._rows_dropped += 1
+                if self._policy == 'drop_newest':
+                    return False
+                self._queue.popleft()
+            self._queue.append(crop)
+            self._condition.notify_all()
+        return True
+
+    def stop(self) -> None:
+        """Метод остановки потока. Изображения, уже поставленные в очередь, записываются, если БД доступна."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def _next_batch(self) -> Optional[List[Crop]]:
+        with self._condition:
+            while not self._queue:
+                if self._stopped:
+                    return None
+                self._condition.wait()
+            deadline = time.monotonic() + self._flush_interval
+            while len(self._queue) < self._batch_size and not self._stopped:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+            batch = [self._queue.popleft() for _ in range(min(self._batch_size, len(self._queue)))]
+            self._condition.notify_all()
+        return batch
+
+    def _connect(self) -> bool:
+        if self._connected:
+            return True
+        try:
+            self._db_handler.connect()
+        except psycopg2.OperationalError as e:
+            logging.warning(f'Database connection failed: {e}')
+            return False
+        self._connected = True
+        return True
+
+    def _disconnect(self) -> None:
+        if self._connected:
+            self._connected = False
+            try:
+                self._db_handler.disconnect()
+            except psycopg2.Error:
+                pass
+
+    def _wait_retry(self) -> bool:
+        """Метод ожидания перед повторной попыткой. Возвращает False, если поток остановлен."""
+        with self._condition:
+            if not self._stopped:
+                self._condition.wait(self._retry_interval)
+            return not self._stopped
+
+    def _write(self, batch: List[Crop]) -> None:
+        while True:
+            if self._connect():
+                try:
+                    with pipeline_metrics.timer('db_insert'):
+                        self._db_handler.insert_images(batch)
+                    self._rows_written += len(batch)
+                    return
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    logging.warning(f'Database connection lost: {e}')
+                except (psycopg2.Error, OSError) as e:
+                    # Ошибка не связана с соединением, повторная запись пакета не поможет.
+                    logging.error(f'Failed to write {len(batch)} images: {e}')
+                    self._rows_dropped += len(batch)
+                    return
+            if not self._wait_retry():
+                logging.error(f'Database is unavailable, {len(batch)} images are lost')
+                self._rows_dropped += len(batch)
+                return
+
+    def run(self) -> None:
+        self._connect()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._write(batch)
+        self._disconnect()
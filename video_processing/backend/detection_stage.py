@@ -0,0 +1,94 @@
+import logging
+from datetime import datetime, timezone
+from typing import List, NamedTuple
+
+import cv2 as cv
+import numpy as np
+
+from .database_handler.db_handler import Crop
+from .detectors import RaisingArmsMomentDetector
+from .frame_encoder import FrameEncoder
+from .metrics import pipeline_metrics
+from .overlay_renderer import OverlayRenderer
+from .person import Person
+from .pose_estimator import PoseEstimator, Skeletons
+from .pose_rules import PoseRuleEngine
+from .trackers import SkeletonTracker
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class Detection(NamedTuple):
+    """
+    Результат обработки кадра: скелеты в координатах кадра, люди трекера в порядке скелетов, флаги правил
+    (люди x правила), флаги искомой позы и момента ее появления и изображения людей в момент появления позы.
+    """
+    skeletons: Skeletons
+    persons: List[Person]
+    poses_matched: np.ndarray
+    poses_detected: np.ndarray
+    unique_poses: List[bool]
+    crops: List[Crop]
+
+
+class DetectionStage:
+    """
+    Этап обнаружения искомой позы, общий для обработки видео (VideoProcessor) и пакетной обработки (BatchProcessor):
+    трекинг скелетов, проверка правил поз, поиск момента появления искомой позы у человека и изображение
+    человека в этот момент (с нарисованными позами, уменьшенное и закодированное в JPEG).
+    Состояние видеопотока (трекер и детектор момента) передается при обработке кадра.
+    """
+
+    @property
+    def pose_rules(self) -> PoseRuleEngine:
+        return self._pose_rules
+
+    @property
+    def target_pose(self) -> str:
+        return self._pose_rules.rule_names[self._target_pose]
+
+    @property
+    def renderer(self) -> OverlayRenderer:
+        return self._renderer
+
+    @staticmethod
+    def _resize(img: np.ndarray, max_dim_px: int = 100):
+        factor = max_dim_px / max(img.shape)
+        return cv.resize(img, dsize=(0, 0), fx=factor, fy=factor)
+
+    def __init__(self, frame_encoder: FrameEncoder, target_pose: str = 'raised_arms'):
+        """
+        frame_encoder - кодировщик изображений людей (кодирование в вызывающем потоке).
+        target_pose - правило PoseRuleEngine, при первом срабатывании которого сохраняется изображение человека.
+        """
+        self._pose_rules = PoseRuleEngine()
+        if target_pose not in self._pose_rules.rule_names:
+            raise ValueError(f'Unknown target pose: {target_pose}')
+        self._target_pose = self._pose_rules.rule_names.index(target_pose)
+        self._renderer = OverlayRenderer(self._pose_rules.rule_names)
+        self._frame_encoder = frame_encoder
+
+    def process(self, stream_id: str, frame: np.ndarray, frame_index: int, poses: np.ndarray,
+                pose_estimator: PoseEstimator, skeleton_tracker: SkeletonTracker,
+                unique_detector: RaisingArmsMomentDetector) -> Detection:
+        """Метод обработки поз кадра видеопотока stream_id. Кадр не изменяется."""
+        with pipeline_metrics.timer('tracking'):
+            skeletons = pose_estimator.annotate_skeletons(poses)
+            persons = skeleton_tracker.track(skeletons, skeletons.bounding_boxes())
+        pipeline_metrics.frame_processed(len(skeletons))
+        with pipeline_metrics.timer('rules'):
+            # Трекер возвращает данные людей в порядке скелетов, поэтому правила проверяются для всего пакета сразу.
+            poses_matched = self._pose_rules.evaluate(skeletons)
+            poses_detected = poses_matched[:, self._target_pose]
+            unique_poses = unique_detector.detect(persons, poses_detected)
+        crops = []
+        for index, unique_pose_flag in enumerate(unique_poses):
+            if unique_pose_flag:
+                logging.debug(f'{self.target_pose} was detected on skeleton: {index} ({stream_id})!')
+                bbox = persons[index].bbox
+                # Изображение человека сохраняется с нарисованными позами, но без рамок и подписей.
+                cropped_person = self._resize(self._renderer.render_crop(frame, skeletons, bbox))
+                crops.append(Crop(self._frame_encoder.encode(cropped_person), datetime.now(timezone.utc), stream_id,
+                                  frame_index, persons[index].index, bbox, float(skeletons.scores[index]),
+                                  self.target_pose))
+        return Detection(skeletons, persons, poses_matched, poses_detected, unique_poses, crops)
@@ -0,0 +1,162 @@
+"""
+Приемники событий пакетной обработки видеофайлов (batch.py).
+События одного видеофайла накапливаются в памяти и записываются одним обращением: файлы JSONL и Parquet
+пишутся целиком при закрытии приемника (во временный файл с переименованием, поэтому прерванная обработка
+не оставляет неполных файлов), в БД - пакетами по batch_size событий в одной транзакции.
+Изображения людей сохраняются в файловое хранилище, в событиях записывается ключ изображения.
+"""
+import json
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from .database_handler.blob_store import FileBlobStore
+from .database_handler.db_handler import Crop, DBHandler
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logging.basicConfig(level=logging.DEBUG)
+
+PARQUET_AVAILABLE = pq is not None
+
+
+class EventSink(ABC):
+    """Приемник событий одного видеофайла. Используется как контекстный менеджер: события записываются при выходе."""
+
+    @property
+    def events_count(self) -> int:
+        return self._events_count
+
+    def __init__(self):
+        self._events_count = 0
+
+    def __enter__(self) -> 'EventSink':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # При ошибке обработки файла накопленные события не записываются.
+        if exc_type is None:
+            self.close()
+
+    def put(self, crop: Crop) -> None:
+        self._events_count += 1
+        self._put(crop)
+
+    @abstractmethod
+    def _put(self, crop: Crop) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        """Метод записи накопленных событий."""
+
+
+class _FileEventSink(EventSink):
+    """Приемник событий в файл output_dir/<имя видеофайла><extension>. Метаданные событий совпадают с таблицей events."""
+    extension = ''
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def __init__(self, video_file: str, output_dir: str, blob_store_path: Optional[str] = None):
+        """blob_store_path - директория хранилища изображений людей, None - изображения не сохраняются."""
+        super().__init__()
+        os.makedirs(output_dir, exist_ok=True)
+        self._path = os.path.join(output_dir, os.path.splitext(os.path.basename(video_file))[0] + self.extension)
+        self._blob_store = FileBlobStore(blob_store_path) if blob_store_path else None
+        self._rows: List[dict] = []
+
+    def _put(self, crop: Crop) -> None:
+        min_x, min_y, max_x, max_y = crop.bbox
+        self._rows.append({
+            'created_at': crop.timestamp, 'stream_id': crop.stream_id, 'frame_index': crop.frame_index,
+            'track_index': crop.track_index, 'min_x': min_x, 'min_y': min_y, 'max_x': max_x, 'max_y': max_y,
+            'score': crop.score, 'pose': crop.pose,
+            'blob_key': self._blob_store.put(crop.image) if self._blob_store is not None else None,
+        })
+
+    @abstractmethod
+    def _write(self, path: str) -> None:
+        pass
+
+    def close(self) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._path), suffix='.tmp')
+        os.close(fd)
+        try:
+            self._write(tmp_path)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logging.debug(f'{len(self._rows)} events are written to {self._path}')
+
+
+class JsonlEventSink(_FileEventSink):
+    """Приемник событий в файл JSON Lines: одно событие на строку, время в ISO 8601."""
+    extension = '.jsonl'
+
+    def _write(self, path: str) -> None:
+        with open(path, 'w') as f:
+            f.writelines(json.dumps({**row, 'created_at': row['created_at'].isoformat()}) + '\n'
+                         for row in self._rows)
+
+
+class ParquetEventSink(_FileEventSink):
+    """Приемник событий в файл Parquet (нужен пакет pyarrow)."""
+    extension = '.parquet'
+    _schema = pa.schema([
+        ('created_at', pa.timestamp('us', tz='UTC')), ('stream_id', pa.string()), ('frame_index', pa.int32()),
+        ('track_index', pa.int32()), ('min_x', pa.int32()), ('min_y', pa.int32()), ('max_x', pa.int32()),
+        ('max_y', pa.int32()), ('score', pa.float32()), ('pose', pa.string()), ('blob_key', pa.string()),
+    ]) if PARQUET_AVAILABLE else None
+
+    def __init__(self, video_file: str, output_dir: str, blob_store_path: Optional[str] = None):
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError('Parquet output requires the pyarrow package')
+        super().__init__(video_file, output_dir, blob_store_path)
+
+    def _write(self, path: str) -> None:
+        pq.write_table(pa.Table.from_pylist(self._rows, schema=self._schema), path)
+
+
+class DBEventSink(EventSink):
+    """Приемник событий в БД: события записываются пакетами по batch_size за одно обращение (DBHandler.insert_images)."""
+
+    def __init__(self, video_file: str, db_name: str, db_user: str, db_password: str, db_host: str = None,
+                 db_port: int = None, blob_store_path: str = 'blob_store', batch_size: int = 256):
+        super().__init__()
+        self._batch_size = batch_size
+        self._crops: List[Crop] = []
+        self._db_handler = DBHandler(db_name, db_user, db_password, db_host, db_port, FileBlobStore(blob_store_path),
+                                     max_connections=1)
+        self._db_handler.connect()
+
+    def _flush(self) -> None:
+        if self._crops:
+            self._db_handler.insert_images(self._crops)
+            self._crops = []
+
+    def _put(self, crop: Crop) -> None:
+        self._crops.append(crop)
+        if len(self._crops) >= self._batch_size:
+            self._flush()
+
+    def close(self) -> None:
+        try:
+            self._flush()
+        finally:
+            self._db_handler.disconnect()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Соединение закрывается и при ошибке обработки; уже записанные пакеты остаются в БД.
+        if exc_type is None:
+            self.close()
+        else:
+            self._db_handler.disconnect()
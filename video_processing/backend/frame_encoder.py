@@ -0,0 +1,75 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import cv2 as cv
+import numpy as np
+
+from .metrics import pipeline_metrics
+
+
+class EncodedFrame(NamedTuple):
+    """Кадр в JPEG: полный кадр и уменьшенная копия (None, если вариант не создавался)."""
+    full: Optional[bytes]
+    preview: Optional[bytes]
+
+
+class FrameEncoder:
+    """
+    Класс кодирования кадров в JPEG в пуле потоков (cv.imencode отпускает GIL, поэтому потоки работают параллельно).
+    Каждый кадр кодируется один раз в полном размере и, если задан preview_scale, один раз в уменьшенном;
+    результаты общие для всех потребителей. Кадры передаются в BGR без преобразования цвета.
+    При num_workers = 0 кадры кодируются в вызывающем потоке.
+    Время кодирования кадров учитывается в pipeline_metrics как этап 'encode'.
+    """
+
+    @property
+    def preview_scale(self) -> float:
+        return self._preview_scale
+
+    def __init__(self, num_workers: int = 2, quality: int = 95, preview_scale: float = 0.,
+                 preview_quality: int = None):
+        """
+        quality - качество JPEG (0-100).
+        preview_scale - масштаб уменьшенной копии кадра (0 - не создавать).
+        preview_quality - качество JPEG уменьшенной копии, по умолчанию quality.
+        """
+        if not 0 <= preview_scale < 1:
+            raise ValueError(f'Invalid preview scale: {preview_scale}')
+        self._params = [cv.IMWRITE_JPEG_QUALITY, quality]
+        self._preview_params = [cv.IMWRITE_JPEG_QUALITY, quality if preview_quality is None else preview_quality]
+        self._preview_scale = preview_scale
+        self._executor = ThreadPoolExecutor(num_workers, thread_name_prefix='frame_encoder') if num_workers else None
+
+    def encode(self, img: np.ndarray) -> bytes:
+        """Метод кодирования изображения в JPEG в вызывающем потоке."""
+        ret, img_data = cv.imencode('.jpg', img, self._params)
+        return img_data.tobytes()
+
+    def resize_to_preview(self, img: np.ndarray) -> np.ndarray:
+        return cv.resize(img, (0, 0), fx=self._preview_scale, fy=self._preview_scale, interpolation=cv.INTER_AREA)
+
+    def _encode_frame(self, img: np.ndarray, preview_only: bool) -> EncodedFrame:
+        with pipeline_metrics.timer('encode'):
+            full = None if preview_only else self.encode(img)
+            preview = None
+            if self._preview_scale:
+                ret, preview_data = cv.imencode('.jpg', img if preview_only else self.resize_to_preview(img),
+                                                self._preview_params)
+                preview = preview_data.tobytes()
+        return EncodedFrame(full, preview)
+
+    def submit(self, img: np.ndarray, preview_only: bool = False) -> Future:
+        """
+        Метод постановки кадра в очередь кодирования. Возвращает Future с EncodedFrame.
+        preview_only - img уже уменьшен методом resize_to_preview, кодируется только уменьшенная копия.
+        Кадр нельзя изменять, пока кодирование не завершено.
+        """
+        if self._executor is not None:
+            return self._executor.submit(self._encode_frame, img, preview_only)
+        future = Future()
+        future.set_result(self._encode_frame(img, preview_only))
+        return future
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
@@ -0,0 +1,39 @@
+"""
+Протокол передачи кадров по TCP: соединение постоянное, каждый кадр передается как
+4-байтная длина (big-endian) и следом JPEG-данные.
+Клиент может прислать байт варианта кадров: VARIANT_FULL (по умолчанию) или VARIANT_PREVIEW -
+уменьшенная копия кадра, если сервер ее создает, иначе полный кадр.
+"""
+import socket
+import struct
+
+VARIANT_FULL = b'f'
+VARIANT_PREVIEW = b'p'
+VARIANTS = (VARIANT_FULL, VARIANT_PREVIEW)
+
+_header = struct.Struct('!I')
+# Ограничение размера кадра для обнаружения рассинхронизации потока
+_max_frame_size = 64 * 1024 * 1024
+
+
+def pack_frame(frame: bytes) -> bytes:
+    return _header.pack(len(frame)) + frame
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError('Connection closed by server')
+        received += count
+    return buffer
+
+
+def recv_frame(sock: socket.socket) -> bytes:
+    size, = _header.unpack(_recv_exactly(sock, _header.size))
+    if size > _max_frame_size:
+        raise ConnectionError(f'Invalid frame size: {size}')
+    return bytes(_recv_exactly(sock, size))
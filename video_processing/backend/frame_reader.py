@@ -0,0 +1,152 @@
+import logging
+from collections import deque
+from threading import Condition, Thread
+from typing import Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from .metrics import pipeline_metrics
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FrameReader(Thread):
+    """
+    Поток чтения видео.
+    Декодирует кадры заранее прямо в кольцевой буфер предварительно выделенных кадров (BGR).
+    Политики:
+    'all' - обрабатывается каждый кадр, чтение приостанавливается при заполнении очереди (обработка записей);
+    'latest' - устаревшие кадры отбрасываются, потребитель всегда получает последний кадр (живое видео).
+    Полученный кадр принадлежит потребителю до вызова release, после чего его место в буфере используется повторно.
+    """
+    policies = ('all', 'latest')
+
+    @property
+    def frame_shape(self) -> tuple:
+        return self._frames[0].shape
+
+    @property
+    def queue_depth(self) -> int:
+        """Число декодированных кадров, ожидающих обработки."""
+        return len(self._ready)
+
+    @property
+    def frames_decoded(self) -> int:
+        return self._frames_decoded
+
+    @property
+    def frames_dropped(self) -> int:
+        return self._frames_dropped
+
+    def __init__(self, input_video_file: str, queue_size: int = 4, policy: str = 'all', reserve: int = 1,
+                 loop: bool = True, *args, **kwargs):
+        """
+        queue_size - максимальное число кадров в очереди;
+        reserve - число кадров, которые потребитель может удерживать одновременно, не останавливая чтение;
+        loop - перезапускать видео по окончании файла, иначе поток завершается.
+        """
+        if policy not in self.policies:
+            raise ValueError(f'Unknown frame reader policy: {policy}')
+        self._input_video_file = input_video_file
+        self._queue_size = queue_size
+        self._policy = policy
+        self._loop = loop
+        self._video_reader = cv.VideoCapture(self._input_video_file)
+
+        # Первый кадр определяет размер буферов и отдается потребителю первым.
+        ret, self._first_frame = self._video_reader.read()
+        if not ret:
+            raise RuntimeError(f'Failed to read video: {input_video_file}')
+        buffer = np.empty((queue_size + reserve, *self._first_frame.shape), dtype=np.uint8)
+        self._frames = list(buffer)
+        self._slot_by_frame_id = {id(frame): slot for slot, frame in enumerate(self._frames)}
+
+        self._condition = Condition()
+        self._free_slots = deque(range(len(self._frames)))
+        self._ready = deque()
+        self._finished = False
+        self._stopped = False
+        self._cur_frame = 0
+        self._frames_decoded = 0
+        self._frames_dropped = 0
+        super().__init__(*args, **kwargs)
+
+    def _reload_video(self):
+        self._video_reader.release()
+        self._video_reader = cv.VideoCapture(self._input_video_file)
+
+    def _decode(self, frame: np.ndarray) -> bool:
+        """Метод декодирования очередного кадра в заданный буфер."""
+        with pipeline_metrics.timer('decode'):
+            ret, _ = self._video_reader.read(frame)
+        if not ret and self._loop:
+            self._reload_video()
+            ret, _ = self._video_reader.read(frame)
+        return ret
+
+    def _drop_oldest(self) -> None:
+        _, slot = self._ready.popleft()
+        self._free_slots.append(slot)
+        self._frames_dropped += 1
+
+    def _acquire_slot(self) -> Optional[int]:
+        with self._condition:
+            while not self._stopped:
+                if self._policy == 'latest' and self._ready and \
+                        (not self._free_slots or len(self._ready) >= self._queue_size):
+                    self._drop_oldest()
+                if self._free_slots and len(self._ready) < self._queue_size:
+                    return self._free_slots.popleft()
+                self._condition.wait()
+        return None
+
+    def run(self) -> None:
+        while True:
+            slot = self._acquire_slot()
+            if slot is None:
+                break
+            if self._first_frame is not None:
+                np.copyto(self._frames[slot], self._first_frame)
+                self._first_frame = None
+            elif not self._decode(self._frames[slot]):
+                with self._condition:
+                    self._free_slots.append(slot)
+                break
+            self._cur_frame += 1
+            self._frames_decoded += 1
+            with self._condition:
+                self._ready.append((self._cur_frame, slot))
+                self._condition.notify_all()
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+        self._video_reader.release()
+
+    def get(self) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        Метод получения кадра. Возвращает номер кадра и кадр или None, если видео закончилось.
+        При политике 'latest' возвращается последний декодированный кадр, остальные отбрасываются.
+        """
+        with self._condition:
+            while not self._ready:
+                if self._finished or self._stopped:
+                    return None
+                self._condition.wait()
+            if self._policy == 'latest':
+                while len(self._ready) > 1:
+                    self._drop_oldest()
+            frame_index, slot = self._ready.popleft()
+            self._condition.notify_all()
+        return frame_index, self._frames[slot]
+
+    def release(self, frame: np.ndarray) -> None:
+        """Метод возврата кадра в буфер."""
+        with self._condition:
+            self._free_slots.append(self._slot_by_frame_id[id(frame)])
+            self._condition.notify_all()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
@@ -0,0 +1,99 @@
+from typing import List
+
+import cv2 as cv
+import numpy as np
+
+
+class PosePropagator:
+    """
+    Класс переноса поз на кадры, пропущенные нейронной сетью.
+    Ключевые точки последних поз переносятся на следующий кадр оптическим потоком Лукаса-Канаде
+    (на изображении половинного разрешения). Также хранит уменьшенную копию кадра последнего инференса
+    для оценки движения в кадре.
+    """
+    # Масштаб изображения для оптического потока
+    _flow_scale = 0.5
+    # Размер уменьшенного кадра для оценки движения
+    _thumbnail_size = (64, 36)
+    _lk_params = dict(winSize=(15, 15), maxLevel=3,
+                      criteria=(cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, 10, 0.03))
+
+    def __init__(self):
+        self._poses = None
+        self._prev_gray = None
+        self._gray = None
+        self._resized = None
+        self._reference_thumbnail = None
+        self._thumbnail = None
+
+    def _to_gray(self, frame: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        self._resized = cv.resize(frame, (0, 0), dst=self._resized, fx=self._flow_scale, fy=self._flow_scale,
+                                  interpolation=cv.INTER_AREA)
+        return cv.cvtColor(self._resized, cv.COLOR_BGR2GRAY, dst=dst)
+
+    def _to_thumbnail(self, frame: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        return cv.resize(frame, self._thumbnail_size, dst=dst, interpolation=cv.INTER_AREA)
+
+    def mark_inference(self, frame: np.ndarray) -> None:
+        """Метод запоминания кадра, отправленного на инференс, для оценки движения."""
+        self._reference_thumbnail = self._to_thumbnail(frame, self._reference_thumbnail)
+
+    def motion(self, frame: np.ndarray) -> float:
+        """Метод оценки движения: средняя абсолютная разность с кадром последнего инференса (0-255)."""
+        if self._reference_thumbnail is None:
+            return np.inf
+        self._thumbnail = self._to_thumbnail(frame, self._thumbnail)
+        return cv.norm(self._thumbnail, self._reference_thumbnail, cv.NORM_L1) / self._thumbnail.size
+
+    def reset(self, frame: np.ndarray, poses: np.ndarray) -> None:
+        """Метод запоминания поз, полученных нейронной сетью на кадре."""
+        self._prev_gray = self._to_gray(frame, self._prev_gray)
+        self._poses = poses
+
+    def propagate(self, frame: np.ndarray) -> np.ndarray:
+        """Метод переноса последних поз на следующий кадр."""
+        self._gray = self._to_gray(frame, self._gray)
+        poses = np.copy(self._poses)
+        if poses.size:
+            points = np.ascontiguousarray(poses[:, :, :2].reshape(-1, 1, 2)) * self._flow_scale
+            new_points, status, _ = cv.calcOpticalFlowPyrLK(self._prev_gray, self._gray, points, None,
+                                                            **self._lk_params)
+            # Точки, которые не удалось отследить, остаются на месте.
+            tracked = status.reshape(-1) == 1
+            points[tracked] = new_points[tracked]
+            poses[:, :, :2] = points.reshape(poses.shape[0], poses.shape[1], 2) / self._flow_scale
+        self._prev_gray, self._gray = self._gray, self._prev_gray
+        self._poses = poses
+        return poses
+
+
+class InferenceScheduler:
+    """
+    Класс выбора кадров для инференса.
+    Сеть запускается каждые stride кадров. При заданном motion_threshold сеть запускается раньше,
+    если хотя бы в одном источнике движение относительно кадра последнего инференса превышает порог.
+    """
+
+    @property
+    def enabled(self) -> bool:
+        """Пропускаются ли кадры вообще."""
+        return self._stride > 1
+
+    def __init__(self, stride: int = 1, motion_threshold: float = 0):
+        """motion_threshold - порог средней абсолютной разности кадров (0-255), 0 - без учета движения."""
+        self._stride = max(stride, 1)
+        self._motion_threshold = motion_threshold
+        self._frames_since_inference = self._stride
+
+    def need_inference(self, frames: List[np.ndarray], propagators: List[PosePropagator]) -> bool:
+        self._frames_since_inference += 1
+        need_inference = self._frames_since_inference >= self._stride
+        if not need_inference and self._motion_threshold > 0:
+            need_inference = any(propagator.motion(frame) > self._motion_threshold
+                                 for frame, propagator in zip(frames, propagators))
+        if need_inference:
+            self._frames_since_inference = 0
+            if self.enabled:
+                for frame, propagator in zip(frames, propagators):
+                    propagator.mark_inference(frame)
+        return need_inference
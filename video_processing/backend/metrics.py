@@ -0,0 +1,193 @@
+"""
+Метрики конвейера обработки видео: длительности этапов, частота кадров, число людей в кадре.
+Этапы измеряются таймерами на time.perf_counter из любых потоков и сохраняются в гистограммы с накопительными
+корзинами (для Prometheus) и скользящим окном последних значений (для квантилей p50/p95/p99).
+Общий реестр pipeline_metrics используется всеми компонентами конвейера, как модуль logging.
+"""
+import math
+import time
+from bisect import bisect_left
+from collections import deque
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Квантили скользящего окна
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Гистограмма значений: накопительные корзины, сумма и число значений, а также окно последних значений."""
+    # Границы корзин длительностей этапов, с
+    latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5)
+
+    @property
+    def buckets(self) -> Tuple[float, ...]:
+        return self._buckets
+
+    def __init__(self, buckets: Sequence[float] = latency_buckets, window: int = 1000):
+        self._buckets = tuple(buckets)
+        self._lock = Lock()
+        self._window = deque(maxlen=window)
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self._bucket_counts = [0] * (len(self._buckets) + 1)
+        self._count = 0
+        self._sum = 0.
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._window.append(value)
+            self._bucket_counts[bisect_left(self._buckets, value)] += 1
+            self._count += 1
+            self._sum += value
+
+    def quantiles(self) -> Tuple[float, ...]:
+        """Квантили QUANTILES последних значений, nan при отсутствии значений."""
+        with self._lock:
+            values = np.array(self._window)
+        if values.size == 0:
+            return (math.nan,) * len(QUANTILES)
+        return tuple(np.quantile(values, QUANTILES))
+
+    def snapshot(self) -> Tuple[List[int], int, float]:
+        """Накопленные числа значений по корзинам (включая +Inf), общее число и сумма значений."""
+        with self._lock:
+            return list(np.cumsum(self._bucket_counts)), self._count, self._sum
+
+
+class _StageTimer:
+    """Контекстный менеджер измерения длительности этапа."""
+    __slots__ = ('_histogram', '_start')
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+        self._start = 0.
+
+    def __enter__(self) -> '_StageTimer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class Metrics:
+    """
+    Реестр метрик конвейера.
+    Этапы (decode, preprocess, infer, decoder, tracking, rules, render, encode, db_insert и др.) создаются
+    при первом измерении. Значения, которые хранят сами компоненты (глубина очередей, число клиентов),
+    регистрируются функциями, вызываемыми при выводе метрик.
+    """
+    prefix = 'pose_detector'
+    # Границы корзин числа людей в кадре
+    people_buckets = (0, 1, 2, 3, 5, 10, 20, 50)
+
+    def __init__(self, window: int = 1000):
+        self._window = window
+        self._lock = Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._people = Histogram(self.people_buckets, window)
+        self._counters: Dict[str, float] = {}
+        self._gauges: List[Tuple[str, str, Dict[str, str], Callable[[], float]]] = []
+        self._frame_times = deque(maxlen=window)
+        self._summary_state: Tuple[float, float] = (time.monotonic(), 0)
+
+    def _stage(self, stage: str) -> Histogram:
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, Histogram(window=self._window))
+        return histogram
+
+    def timer(self, stage: str) -> _StageTimer:
+        """Таймер этапа: with pipeline_metrics.timer('tracking'): ..."""
+        return _StageTimer(self._stage(stage))
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self._stage(stage).observe(seconds)
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def frame_processed(self, people: int) -> None:
+        """Метод учета обработанного кадра с people людьми."""
+        self._frame_times.append(time.monotonic())
+        self._people.observe(people)
+        self.count('frames')
+
+    def add_gauge(self, name: str, help_text: str, getter: Callable[[], float],
+                  labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self._gauges.append((name, help_text, labels or {}, getter))
+
+    @property
+    def fps(self) -> float:
+        """Частота обработки кадров по последним кадрам окна."""
+        frame_times = list(self._frame_times)
+        if len(frame_times) < 2 or frame_times[-1] == frame_times[0]:
+            return 0.
+        return (len(frame_times) - 1) / (frame_times[-1] - frame_times[0])
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> str:
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}' if labels else ''
+
+    def _histogram_lines(self, name: str, histogram: Histogram, labels: Dict[str, str]) -> List[str]:
+        cumulative, count, total = histogram.snapshot()
+        bounds = [*(f'{bound:g}' for bound in histogram.buckets), '+Inf']
+        lines = [f'{name}_bucket{self._labels({**labels, "le": bound})} {value}'
+                 for bound, value in zip(bounds, cumulative)]
+        lines.append(f'{name}_sum{self._labels(labels)} {total}')
+        lines.append(f'{name}_count{self._labels(labels)} {count}')
+        return lines
+
+    def prometheus_text(self) -> str:
+        """Метрики в текстовом формате Prometheus."""
+        with self._lock:
+            stages = sorted(self._stages.items())
+            counters = sorted(self._counters.items())
+            # Строки одной метрики должны идти подряд.
+            gauges = sorted(self._gauges, key=lambda gauge: gauge[0])
+        stage_name = f'{self.prefix}_stage_seconds'
+        recent_name = f'{self.prefix}_stage_recent_seconds'
+        people_name = f'{self.prefix}_people_per_frame'
+        lines = [f'# HELP {stage_name} Duration of pipeline stages.', f'# TYPE {stage_name} histogram']
+        for stage, histogram in stages:
+            lines.extend(self._histogram_lines(stage_name, histogram, {'stage': stage}))
+        lines += [f'# HELP {recent_name} Quantiles of the latest stage durations.', f'# TYPE {recent_name} gauge']
+        for stage, histogram in stages:
+            for quantile, value in zip(QUANTILES, histogram.quantiles()):
+                lines.append(f'{recent_name}{self._labels({"stage": stage, "quantile": quantile})} {value}')
+        lines += [f'# HELP {people_name} People detected per frame.', f'# TYPE {people_name} histogram']
+        lines.extend(self._histogram_lines(people_name, self._people, {}))
+        lines += [f'# HELP {self.prefix}_fps Frames processed per second over the latest frames.',
+                  f'# TYPE {self.prefix}_fps gauge', f'{self.prefix}_fps {self.fps}']
+        for name, value in counters:
+            lines += [f'# TYPE {self.prefix}_{name}_total counter', f'{self.prefix}_{name}_total {value}']
+        described = set()
+        for name, help_text, labels, getter in gauges:
+            if name not in described:
+                described.add(name)
+                lines += [f'# HELP {self.prefix}_{name} {help_text}', f'# TYPE {self.prefix}_{name} gauge']
+            lines.append(f'{self.prefix}_{name}{self._labels(labels)} {getter()}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """Краткая сводка для лога: частота кадров с прошлой сводки, люди в кадре, квантили этапов в мс."""
+        now = time.monotonic()
+        with self._lock:
+            stages = sorted(self._stages.items())
+            frames = self._counters.get('frames', 0)
+        last_time, last_frames = self._summary_state
+        self._summary_state = (now, frames)
+        fps = (frames - last_frames) / (now - last_time) if now > last_time else 0.
+        people = self._people.quantiles()[0]
+        parts = [f'fps {fps:.1f}', f'people p50 {people:.0f}']
+        for stage, histogram in stages:
+            parts.append(f'{stage} ' + '/'.join(f'{value * 1e3:.1f}' for value in histogram.quantiles()))
+        return ', '.join(parts) + ' (stage p50/p95/p99, ms)'
+
+
+pipeline_metrics = Metrics()
@@ -0,0 +1,51 @@
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from .metrics import Metrics
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов /metrics в текстовом формате Prometheus."""
+    server: 'MetricsServer'
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Запросы сборщика метрик не пишутся в лог.
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address: tuple, metrics: Metrics):
+        self.metrics = metrics
+        super().__init__(server_address, MetricsRequestHandler)
+
+
+class MetricsExporter(Thread):
+    """Поток HTTP-сервера метрик конвейера рядом со стримерами."""
+
+    def __init__(self, metrics: Metrics, host: str = '', port: int = 9100, *args, **kwargs):
+        self._metrics = metrics
+        self._host = host
+        self._port = port
+        super().__init__(name='metrics_thread', *args, **kwargs)
+
+    def run(self) -> None:
+        with MetricsServer((self._host, self._port), self._metrics) as server:
+            logging.debug(f'Metrics server started on {server.server_address}')
+            server.serve_forever()
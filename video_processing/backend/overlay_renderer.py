@@ -0,0 +1,101 @@
+from typing import List, Sequence
+
+import cv2 as cv
+import numpy as np
+
+from .person import Person
+from .pose_estimator import PoseEstimator, Skeletons
+
+
+class OverlayRenderer:
+    """
+    Класс отрисовки поз и информации о людях на кадре. Кадр изменяется на месте.
+    Конечности накладываются полупрозрачно только внутри прямоугольника, охватывающего все позы: эта область кадра
+    копируется в переиспользуемый буфер, конечности рисуются в буфере и смешиваются с кадром.
+    Рамки и подписи рисуются поверх кадра за один проход по людям.
+    Кадр может быть уменьшенной копией исходного: координаты умножаются на scale.
+    """
+    # Толщина конечностей и их непрозрачность при смешивании с кадром
+    _stick_width = 4
+    _limbs_alpha = 0.6
+    # Отступ области смешивания от крайних точек поз, пикселей
+    _roi_margin = 4
+
+    def __init__(self, rule_names: Sequence[str], skeleton=PoseEstimator.default_skeleton,
+                 colors=PoseEstimator.colors):
+        self._rule_names = np.array(rule_names)
+        self._skeleton = skeleton
+        self._colors = colors
+        self._scratch = np.empty(0, dtype=np.uint8)
+
+    def _scratch_buffer(self, shape: tuple) -> np.ndarray:
+        size = int(np.prod(shape))
+        if self._scratch.size < size:
+            self._scratch = np.empty(size, dtype=np.uint8)
+        return self._scratch[:size].reshape(shape)
+
+    def _draw_poses(self, img: np.ndarray, skeletons: Skeletons, scale: float, origin: tuple = (0, 0)) -> None:
+        """Метод отрисовки поз на изображении, левый верхний угол которого - точка origin кадра."""
+        visible = skeletons.visible
+        if not visible.any():
+            return
+        points = np.rint(skeletons.xy * scale).astype(np.int32) - origin
+        height, width = img.shape[:2]
+        min_x, min_y = np.maximum(points[visible].min(axis=0) - self._roi_margin, 0)
+        max_x, max_y = np.minimum(points[visible].max(axis=0) + self._roi_margin + 1, (width, height))
+        if min_x >= max_x or min_y >= max_y:
+            return
+        roi = img[min_y: max_y, min_x: max_x]
+        limbs = self._scratch_buffer(roi.shape)
+        np.copyto(limbs, roi)
+        points -= (min_x, min_y)
+        stick_width = max(int(round(self._stick_width * scale)), 1)
+        for pose_points, pose_visible in zip(points, visible):
+            # Суставы рисуются на кадре и при смешивании тоже становятся полупрозрачными.
+            for i in np.flatnonzero(pose_visible):
+                cv.circle(roi, tuple(pose_points[i]), 1, self._colors[i], 2)
+            for i, j in self._skeleton:
+                if pose_visible[i] and pose_visible[j]:
+                    cv.line(limbs, tuple(pose_points[i]), tuple(pose_points[j]), color=self._colors[j],
+                            thickness=stick_width)
+        cv.addWeighted(roi, 1 - self._limbs_alpha, limbs, self._limbs_alpha, 0, dst=roi)
+
+    def render_crop(self, img: np.ndarray, skeletons: Skeletons, bbox: tuple) -> np.ndarray:
+        """
+        Метод получения изображения области bbox (min_x, min_y, max_x, max_y) кадра с нарисованными позами.
+        Рисуется только эта область, кадр не изменяется.
+        """
+        min_x, min_y, max_x, max_y = bbox
+        # Область рисования шире bbox на толщину конечностей, чтобы их края у границ bbox совпадали с кадром.
+        margin = self._roi_margin + self._stick_width
+        height, width = img.shape[:2]
+        left, top = max(min_x - margin, 0), max(min_y - margin, 0)
+        area = img[top: min(max_y + margin, height), left: min(max_x + margin, width)].copy()
+        self._draw_poses(area, skeletons, 1., (left, top))
+        return area[min_y - top: max_y - top, min_x - left: max_x - left]
+
+    def render(self, img: np.ndarray, skeletons: Skeletons, persons: List[Person], poses_matched: np.ndarray,
+               poses_detected: np.ndarray, unique_poses: List[bool], frame_index: int,
+               scale: float = 1.) -> np.ndarray:
+        """
+        Метод отрисовки поз, рамок людей (красная - искомая поза, зеленая - нет), их номеров и сработавших правил,
+        отметок уникальных поз и номера кадра.
+        """
+        self._draw_poses(img, skeletons, scale)
+        font_scale = 0.5 * scale
+        thickness = max(int(round(2 * scale)), 1)
+        for person, matched, detected, unique in zip(persons, poses_matched, poses_detected, unique_poses):
+            min_x, min_y, max_x, max_y = (int(value * scale) for value in person.bbox)
+            color = (0, 0, 255) if detected else (0, 255, 0)
+            cv.rectangle(img, pt1=(min_x, min_y), pt2=(max_x, max_y), color=color, thickness=thickness)
+            cv.circle(img, center=((min_x + max_x) // 2, (min_y + max_y) // 2), radius=3, color=color,
+                      thickness=thickness)
+            cv.putText(img, text=' '.join([f'Object: {person.index}', *self._rule_names[matched]]),
+                       org=(max_x, max_y), fontFace=cv.FONT_HERSHEY_SIMPLEX, fontScale=font_scale, color=0,
+                       thickness=thickness)
+            if unique:
+                cv.putText(img, text=f'Unique {person.index}', org=(min_x, min_y),
+                           fontFace=cv.FONT_HERSHEY_SIMPLEX, fontScale=2 * font_scale, color=0, thickness=thickness)
+        cv.putText(img, text=f'Current frame: {frame_index}', org=(0, int(30 * scale)),
+                   fontFace=cv.FONT_HERSHEY_SIMPLEX, fontScale=font_scale, color=0, thickness=thickness)
+        return img
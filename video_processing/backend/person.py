@@ -2,7 +2,10 @@ import numpy as np
 
 
 class Person:
-    """Структура для хранения данных о человеке в кадре."""
+    """
+    Структура для хранения данных о человеке в кадре.
+    skeleton - точки скелета (число точек x 3: x, y, оценка), bbox - рамка (min_x, min_y, max_x, max_y).
+    """
 
     @property
     def unmatched_frames_count(self):
@@ -52,7 +55,7 @@ class Person:
     def index(self, value):
         self._index = value
 
-    def __init__(self, index: int, skeleton: dict, bbox: dict, _unmatched_frames_count: int = None,
+    def __init__(self, index: int, skeleton: np.ndarray, bbox: tuple, _unmatched_frames_count: int = None,
                  no_detection_count: int = None):
         self._index = index
         self._unmatched_frames_count = _unmatched_frames_count
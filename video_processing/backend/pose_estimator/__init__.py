@@ -1 +1,2 @@
-from .pose_estimator import PoseEstimator
+from .pose_estimator import Joint, PoseEstimator
+from .skeletons import Skeletons
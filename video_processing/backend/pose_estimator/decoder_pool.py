@@ -0,0 +1,176 @@
+import queue
+import time
+from collections import deque
+from multiprocessing import get_context, parent_process
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..metrics import pipeline_metrics
+
+# Выходы сети, передаваемые декодеру, в порядке аргументов decode_batch
+OUTPUT_NAMES = ('heatmaps', 'nms_heatmaps', 'embeddings')
+
+
+def _decode_worker(decoder_factory: Callable, block_names: Sequence[str], shapes: Sequence[tuple], tasks, results,
+                   poll_interval: float) -> None:
+    """Процесс декодирования: берет номер слота из очереди задач, декодирует выходы сети в слоте, возвращает позы."""
+    decoder = decoder_factory()
+    blocks = [SharedMemory(name) for name in block_names]
+    buffers = [np.ndarray(shape, np.float32, buffer=block.buf) for block, shape in zip(blocks, shapes)]
+
+    def decode(slot: int) -> Tuple[np.ndarray, np.ndarray]:
+        heatmaps, nms_heatmaps, embeddings = (buffer[slot: slot + 1] for buffer in buffers)
+        (poses, scores), = decoder.decode_batch(heatmaps, embeddings, nms_heatmaps=nms_heatmaps)
+        return poses, scores
+
+    parent = parent_process()
+    while True:
+        try:
+            task = tasks.get(timeout=poll_interval)
+        except queue.Empty:
+            # Процесс завершается вместе с родительским, даже если тот не успел закрыть пул.
+            if not parent.is_alive():
+                break
+            continue
+        if task is None:
+            break
+        ticket, slot = task
+        start = time.perf_counter()
+        try:
+            poses, scores = decode(slot)
+            results.put((ticket, slot, poses, scores, time.perf_counter() - start, None))
+        except Exception as e:
+            results.put((ticket, slot, None, None, time.perf_counter() - start, repr(e)))
+    # Представления буферов должны быть удалены до закрытия разделяемой памяти.
+    buffers.clear()
+    for block in blocks:
+        block.close()
+
+
+class DecoderPool:
+    """
+    Пул процессов декодирования поз (AssociativeEmbeddingDecoder) вне процесса обработки видео.
+    Выходы сети кадра копируются в свободный слот буферов разделяемой памяти (multiprocessing.shared_memory),
+    процессам передаются только номера слотов, а обратно - найденные позы, поэтому тензоры не сериализуются.
+    Кадры декодируются параллельно в порядке поступления; результат кадра забирается по номеру, выданному submit,
+    и порядок кадров определяет вызывающий код. Слот освобождается сразу после получения результата.
+    Длительность декодирования в процессах учитывается в pipeline_metrics как этап 'decoder'.
+    """
+    # Число слотов на процесс: пока процесс декодирует кадр, следующий кадр уже ждет в очереди.
+    slots_per_worker = 2
+    # Период проверки живости процессов при ожидании, с
+    _poll_interval = 1.
+
+    @property
+    def num_workers(self) -> int:
+        return len(self._workers)
+
+    @property
+    def num_slots(self) -> int:
+        return self._num_slots
+
+    @property
+    def pending(self) -> int:
+        """Число кадров, отправленных на декодирование, результат которых еще не получен."""
+        return self._num_slots - len(self._free_slots)
+
+    def __init__(self, decoder_factory: Callable, output_shapes: Dict[str, tuple], num_workers: int = 2,
+                 num_slots: int = 0):
+        """
+        decoder_factory - функция без аргументов, создающая декодер в процессе пула (передается в процесс,
+        например functools.partial).
+        output_shapes - размеры выходов сети OUTPUT_NAMES для одного кадра (без размерности пакета).
+        num_slots - число кадров, одновременно находящихся в пуле, по умолчанию slots_per_worker на процесс.
+        """
+        if num_workers < 1:
+            raise ValueError(f'Invalid number of decoder workers: {num_workers}')
+        self._num_slots = num_slots or num_workers * self.slots_per_worker
+        shapes = [(self._num_slots, *output_shapes[name]) for name in OUTPUT_NAMES]
+        self._blocks = [SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(np.float32).itemsize)
+                        for shape in shapes]
+        self._buffers = {name: np.ndarray(shape, np.float32, buffer=block.buf)
+                         for name, shape, block in zip(OUTPUT_NAMES, shapes, self._blocks)}
+        self._free_slots = deque(range(self._num_slots))
+        self._next_ticket = 0
+        self._decoded: Dict[int, Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[str]]] = {}
+
+        # spawn, а не fork: родительский процесс уже запустил потоки (чтение видео, OpenVINO).
+        context = get_context('spawn')
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._workers = [context.Process(target=_decode_worker,
+                                         args=(decoder_factory, [block.name for block in self._blocks], shapes,
+                                               self._tasks, self._results, self._poll_interval),
+                                         name=f'pose_decoder_{i}', daemon=True)
+                         for i in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+        # Пул закрывается и при завершении программы без вызова close. Приоритет выше, чем у завершения
+        # потоков очередей (10), иначе сигналы остановки не дойдут до процессов.
+        self._finalizer = Finalize(self, self._shutdown, args=(self._workers, self._tasks, self._blocks,
+                                                               self._buffers), exitpriority=20)
+
+    @staticmethod
+    def _shutdown(workers: List, tasks, blocks: List[SharedMemory], buffers: Dict[str, np.ndarray]) -> None:
+        for _ in workers:
+            tasks.put(None)
+        for worker in workers:
+            worker.join(timeout=5.)
+            if worker.is_alive():
+                worker.terminate()
+        buffers.clear()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    def _receive(self, block: bool) -> bool:
+        """Метод получения одного результата. Возвращает False, если результатов нет (без ожидания)."""
+        try:
+            if block:
+                ticket, slot, poses, scores, decode_time, error = self._results.get(timeout=self._poll_interval)
+            else:
+                ticket, slot, poses, scores, decode_time, error = self._results.get_nowait()
+        except queue.Empty:
+            if block and not all(worker.is_alive() for worker in self._workers):
+                raise RuntimeError('Pose decoder process has terminated unexpectedly')
+            return False
+        self._free_slots.append(slot)
+        pipeline_metrics.observe('decoder', decode_time)
+        self._decoded[ticket] = (poses, scores, error)
+        return True
+
+    def submit(self, outputs: Dict[str, np.ndarray]) -> int:
+        """
+        Метод отправки выходов сети одного кадра на декодирование. Выходы копируются в свободный слот,
+        при отсутствии свободных слотов метод ждет завершения декодирования одного из кадров.
+        Возвращает номер для получения результата методом result.
+        """
+        while not self._free_slots:
+            self._receive(block=True)
+        slot = self._free_slots.popleft()
+        for name, buffer in self._buffers.items():
+            np.copyto(buffer[slot], outputs[name])
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        self._tasks.put((ticket, slot))
+        return ticket
+
+    def done(self, ticket: int) -> bool:
+        while self._receive(block=False):
+            pass
+        return ticket in self._decoded
+
+    def result(self, ticket: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Метод получения поз и их оценок для кадра. Ждет завершения декодирования."""
+        while ticket not in self._decoded:
+            self._receive(block=True)
+        poses, scores, error = self._decoded.pop(ticket)
+        if error is not None:
+            raise RuntimeError(f'Failed to decode poses: {error}')
+        return poses, scores
+
+    def close(self) -> None:
+        self._finalizer()
@@ -14,16 +14,19 @@
  limitations under the License.
 """
 
+from functools import partial
+
+import cv2
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 
 from .model import Model
-from .utils import resize_image
 
 
 class HpeAssociativeEmbedding(Model):
-    def __init__(self, ie, model_path, target_size, aspect_ratio, prob_threshold, delta=0.0, size_divisor=32, padding_mode='right_bottom'):
-        super().__init__(ie, model_path)
+    def __init__(self, ie, model_path, target_size, aspect_ratio, prob_threshold, delta=0.0, size_divisor=32, padding_mode='right_bottom',
+                 batch_size=1, reverse_input_channels=False):
+        super().__init__(ie, model_path, batch_size=batch_size)
         self.image_blob_name = self._get_inputs(self.net)
         self.heatmaps_blob_name = find_layer_by_name('heatmaps', self.net.outputs)
         try:
@@ -48,9 +51,26 @@ class HpeAssociativeEmbedding(Model):
         input_shape = {self.image_blob_name: (default_input_shape[:-2] + [self.h, self.w])}
         self.logger.info('Reshape net to {}'.format(input_shape))
         self.net.reshape(input_shape)
+        self.net.input_info[self.image_blob_name].precision = 'U8'
+
+        # The factory is picklable, so the same decoder can be created in other processes.
+        self.decoder_factory = partial(self.create_decoder, self.net.outputs[self.heatmaps_blob_name].shape[1],
+                                       prob_threshold, delta)
+        self.decoder = self.decoder_factory()
+        self.size_divisor = size_divisor
+        self.padding_mode = padding_mode
+        self.reverse_input_channels = reverse_input_channels
 
-        self.decoder = AssociativeEmbeddingDecoder(
-            num_joints=self.net.outputs[self.heatmaps_blob_name].shape[1],
+        # Preprocessing writes straight into these reused buffers, so no frame-sized arrays are allocated per frame.
+        self._input_tensor = np.zeros(self.net.input_info[self.image_blob_name].input_data.shape, dtype=np.uint8)
+        self._resized_buffers = {}
+        self._image_regions = [None] * self._input_tensor.shape[0]
+
+    @staticmethod
+    def create_decoder(num_joints, prob_threshold, delta=0.0):
+        # Also used by the offline benchmarks to decode recorded outputs exactly as the model does.
+        return AssociativeEmbeddingDecoder(
+            num_joints=num_joints,
             adjust=True,
             refine=True,
             delta=delta,
@@ -61,8 +81,6 @@ class HpeAssociativeEmbedding(Model):
             use_detection_val=True,
             ignore_too_much=False,
             dist_reweight=True)
-        self.size_divisor = size_divisor
-        self.padding_mode = padding_mode
 
     @staticmethod
     def _get_inputs(net):
@@ -78,30 +96,65 @@ class HpeAssociativeEmbedding(Model):
         return image_blob_name
 
     def preprocess(self, inputs):
-        img = resize_image(inputs, (self.w, self.h), keep_aspect_ratio=True)
+        batch, metas = self.preprocess_batch([inputs])
+        return batch, metas[0]
+
+    def preprocess_batch(self, frames):
+        # The returned input tensor is reused and stays valid until the next call.
+        # The unused tail of the batch keeps stale data, its outputs are ignored.
+        if len(frames) > self._input_tensor.shape[0]:
+            raise ValueError('Got {} frames for a batch of size {}'.format(len(frames), self._input_tensor.shape[0]))
+        metas = [self._preprocess_into(frame, batch_idx) for batch_idx, frame in enumerate(frames)]
+        return {self.image_blob_name: self._input_tensor}, metas
+
+    def _preprocess_into(self, inputs, batch_idx):
+        # Same scale and output size as cv2.resize with fx, fy, so the result is resized straight into a reused buffer.
+        scale = min(self.h / inputs.shape[0], self.w / inputs.shape[1])
+        size = (round(inputs.shape[1] * scale), round(inputs.shape[0] * scale))
+        img = cv2.resize(inputs, (0, 0), dst=self._resized_buffers.get(size), fx=scale, fy=scale)
+        self._resized_buffers[size] = img
         h, w = img.shape[:2]
         if not (self.h - self.size_divisor < h <= self.h and self.w - self.size_divisor < w <= self.w):
             self.logger.warn("Chosen model aspect ratio doesn't match image aspect ratio")
         resize_img_scale = np.array((inputs.shape[1] / w, inputs.shape[0] / h), np.float32)
 
         if self.padding_mode == 'center':
-            pad = ((self.h - h + 1) // 2, (self.h - h) // 2, (self.w - w + 1) // 2, (self.w - w) // 2)
+            top, left = (self.h - h + 1) // 2, (self.w - w + 1) // 2
         else:
-            pad = (0, self.h - h, 0, self.w - w)
-        img = np.pad(img, (pad[:2], pad[2:], (0, 0)), mode='constant', constant_values=0)
-        img = img.transpose((2, 0, 1))  # Change data layout from HWC to CHW
-        img = img[None]
+            top, left = 0, 0
+        # The padding is zeroed only when the image region changes.
+        tensor = self._input_tensor[batch_idx]
+        if self._image_regions[batch_idx] != (top, left, h, w):
+            tensor.fill(0)
+            self._image_regions[batch_idx] = (top, left, h, w)
+        # Change data layout from HWC to CHW, optionally swapping BGR and RGB, by splitting into the tensor planes.
+        planes = list(tensor[:, top:top + h, left:left + w])
+        if self.reverse_input_channels:
+            planes.reverse()
+        cv2.split(img, planes)
         meta = {
             'original_size': inputs.shape[:2],
             'resize_img_scale': resize_img_scale
         }
-        return {self.image_blob_name: img}, meta
+        return meta
 
     def postprocess(self, outputs, meta):
-        heatmaps = outputs[self.heatmaps_blob_name]
-        nms_heatmaps = outputs[self.nms_heatmaps_blob_name]
-        aembds = outputs[self.embeddings_blob_name]
-        poses, scores = self.decoder(heatmaps, aembds, nms_heatmaps=nms_heatmaps)
+        return self.postprocess_batch(outputs, [meta])[0]
+
+    def postprocess_batch(self, outputs, metas):
+        # Only the filled part of the batch is decoded.
+        heatmaps = outputs[self.heatmaps_blob_name][:len(metas)]
+        nms_heatmaps = outputs[self.nms_heatmaps_blob_name][:len(metas)]
+        aembds = outputs[self.embeddings_blob_name][:len(metas)]
+        return self.rescale_batch(self.decoder.decode_batch(heatmaps, aembds, nms_heatmaps=nms_heatmaps), metas)
+
+    def rescale_batch(self, results, metas):
+        # Rescales decoded poses in place, also for poses decoded outside of postprocess_batch.
+        for (poses, _), meta in zip(results, metas):
+            self._rescale(poses, meta)
+        return results
+
+    def _rescale(self, poses, meta):
         # Rescale poses to the original image.
         if self.padding_mode == 'center':
             scale = meta['resize_img_scale'][self.index_of_max_dimension]
@@ -110,7 +163,6 @@ class HpeAssociativeEmbedding(Model):
             poses[:, :, 1 - self.index_of_max_dimension] += shift
         else:
             poses[:, :, :2] *= meta['resize_img_scale'] * self.output_scale
-        return poses, scores
 
 
 def find_layer_by_name(name, layers):
@@ -124,38 +176,10 @@ def find_layer_by_name(name, layers):
     return suitable_layers[0]
 
 
-class Pose:
-    def __init__(self, num_joints, tag_size=1):
-        self.num_joints = num_joints
-        self.tag_size = tag_size
-        # 2 is for x, y and 1 is for joint confidence
-        self.pose = np.zeros((num_joints, 2 + 1 + tag_size), dtype=np.float32)
-        self.pose_tag = np.zeros(tag_size, dtype=np.float32)
-        self.valid_points_num = 0
-        self.c = np.zeros(2, dtype=np.float32)
-
-    def add(self, idx, joint, tag):
-        self.pose[idx] = joint
-        self.c = self.c * self.valid_points_num + joint[:2]
-        self.pose_tag = (self.pose_tag * self.valid_points_num) + tag
-        self.valid_points_num += 1
-        self.c /= self.valid_points_num
-        self.pose_tag /= self.valid_points_num
-
-    @property
-    def tag(self):
-        if self.valid_points_num > 0:
-            return self.pose_tag
-        return None
-
-    @property
-    def center(self):
-        if self.valid_points_num > 0:
-            return self.c
-        return None
-
-
 class AssociativeEmbeddingDecoder:
+    # Size of the scratch buffer used by refine().
+    _refine_buffer_bytes = 1 << 20
+
     def __init__(self, num_joints, max_num_people, detection_threshold, use_detection_val,
                  ignore_too_much, tag_threshold, pose_threshold,
                  adjust=True, refine=True, delta=0.0, joints_order=None,
@@ -188,7 +212,15 @@ class AssociativeEmbeddingDecoder:
         embd_size = tag_k.shape[2]
         all_joints = np.concatenate((loc_k, val_k[..., None], tag_k), -1)
 
-        poses = []
+        # Grouping state. Every joint type adds at most max_num_people candidates, which bounds the number of poses.
+        max_poses = self.num_joints * tag_k.shape[1]
+        # 2 is for x, y and 1 is for joint confidence
+        poses = np.zeros((max_poses, self.num_joints, 2 + 1 + embd_size), dtype=np.float32)
+        tags_sum = np.zeros((max_poses, embd_size), dtype=np.float32)
+        centers_sum = np.zeros((max_poses, 2), dtype=np.float32)
+        counts = np.zeros(max_poses, dtype=np.float32)
+        num_poses = 0
+
         for idx in self.joint_order:
             tags = tag_k[idx]
             joints = all_joints[idx]
@@ -196,49 +228,54 @@ class AssociativeEmbeddingDecoder:
             tags = tags[mask]
             joints = joints[mask]
 
-            if len(poses) == 0:
-                for tag, joint in zip(tags, joints):
-                    pose = Pose(self.num_joints, embd_size)
-                    pose.add(idx, joint, tag)
-                    poses.append(pose)
-                continue
-
-            if joints.shape[0] == 0 or (self.ignore_too_much and len(poses) == self.max_num_people):
-                continue
-
-            poses_tags = np.stack([p.tag for p in poses], axis=0)
-            diff = tags[:, None] - poses_tags[None, :]
-            diff_normed = np.linalg.norm(diff, ord=2, axis=2)
-            diff_saved = np.copy(diff_normed)
-
-            if self.dist_reweight:
-                # Reweight cost matrix to prefer nearby points among all that are close enough in a tag space.
-                centers = np.stack([p.center for p in poses], axis=0)[None]
-                dists = np.linalg.norm(joints[:, :2][:, None, :] - centers, ord=2, axis=2)
-                close_tags_masks = diff_normed < self.tag_threshold
-                min_dists = np.min(dists, axis=0, keepdims=True)
-                dists /= min_dists + 1e-10
-                diff_normed[close_tags_masks] *= dists[close_tags_masks]
-
-            if self.use_detection_val:
-                diff_normed = np.round(diff_normed) * 100 - joints[:, 2:3]
-            num_added = diff.shape[0]
-            num_grouped = diff.shape[1]
-            if num_added > num_grouped:
-                diff_normed = np.pad(diff_normed, ((0, 0), (0, num_added - num_grouped)),
-                                     mode='constant', constant_values=1e10)
-
-            pairs = self._max_match(diff_normed)
-            for row, col in pairs:
-                if row < num_added and col < num_grouped and diff_saved[row][col] < self.tag_threshold:
-                    poses[col].add(idx, joints[row], tags[row])
-                else:
-                    pose = Pose(self.num_joints, embd_size)
-                    pose.add(idx, joints[row], tags[row])
-                    poses.append(pose)
-
-        ans = np.asarray([p.pose for p in poses], dtype=np.float32).reshape(-1, self.num_joints, 2 + 1 + embd_size)
-        tags = np.asarray([p.tag for p in poses], dtype=np.float32).reshape(-1, embd_size)
+            if num_poses == 0:
+                target = np.arange(joints.shape[0])
+                num_poses = joints.shape[0]
+            else:
+                if joints.shape[0] == 0 or (self.ignore_too_much and num_poses == self.max_num_people):
+                    continue
+
+                poses_tags = tags_sum[:num_poses] / counts[:num_poses, None]
+                diff = tags[:, None] - poses_tags[None, :]
+                diff_normed = np.linalg.norm(diff, ord=2, axis=2)
+                diff_saved = np.copy(diff_normed)
+
+                if self.dist_reweight:
+                    # Reweight cost matrix to prefer nearby points among all that are close enough in a tag space.
+                    centers = (centers_sum[:num_poses] / counts[:num_poses, None])[None]
+                    dists = np.linalg.norm(joints[:, :2][:, None, :] - centers, ord=2, axis=2)
+                    close_tags_masks = diff_normed < self.tag_threshold
+                    min_dists = np.min(dists, axis=0, keepdims=True)
+                    dists /= min_dists + 1e-10
+                    diff_normed[close_tags_masks] *= dists[close_tags_masks]
+
+                if self.use_detection_val:
+                    diff_normed = np.round(diff_normed) * 100 - joints[:, 2:3]
+                num_added = diff.shape[0]
+                num_grouped = diff.shape[1]
+                if num_added > num_grouped:
+                    diff_normed = np.pad(diff_normed, ((0, 0), (0, num_added - num_grouped)),
+                                         mode='constant', constant_values=1e10)
+
+                # Every added joint gets a pair, rows come sorted.
+                rows, cols = self._max_match(diff_normed).T
+                matched = cols < num_grouped
+                matched[matched] = diff_saved[rows[matched], cols[matched]] < self.tag_threshold
+                # Unmatched joints start new poses in the order of rows.
+                num_new = np.count_nonzero(~matched)
+                target = np.where(matched, cols, 0)
+                target[~matched] = np.arange(num_poses, num_poses + num_new)
+                num_poses += num_new
+                joints = joints[rows]
+                tags = tags[rows]
+
+            poses[target, idx] = joints
+            tags_sum[target] += tags
+            centers_sum[target] += joints[:, :2]
+            counts[target] += 1
+
+        ans = poses[:num_poses]
+        tags = tags_sum[:num_poses] / counts[:num_poses, None]
         return ans, tags
 
     def top_k(self, heatmaps, tags):
@@ -260,61 +297,81 @@ class AssociativeEmbeddingDecoder:
         return tag_k, loc_k, val_k
 
     @staticmethod
-    def adjust(ans, heatmaps):
+    def _gradient_sign(heatmaps, k, x, y):
+        # Sign of the heatmap gradient at integer points (x, y) of joint heatmaps k, shape (N, 2).
+        return np.sign(np.stack((
+            heatmaps[k, y, x + 1] - heatmaps[k, y, x - 1],
+            heatmaps[k, y + 1, x] - heatmaps[k, y - 1, x]
+        ), axis=1))
+
+    @classmethod
+    def adjust(cls, ans, heatmaps):
         H, W = heatmaps.shape[-2:]
         for batch_idx, people in enumerate(ans):
-            for person in people:
-                for k, joint in enumerate(person):
-                    heatmap = heatmaps[batch_idx, k]
-                    px = int(joint[0])
-                    py = int(joint[1])
-                    if 1 < px < W - 1 and 1 < py < H - 1:
-                        diff = np.array([
-                            heatmap[py, px + 1] - heatmap[py, px - 1],
-                            heatmap[py + 1, px] - heatmap[py - 1, px]
-                        ])
-                        joint[:2] += np.sign(diff) * .25
+            if people.size == 0:
+                continue
+            px = people[..., 0].astype(np.int32)
+            py = people[..., 1].astype(np.int32)
+            inner = (1 < px) & (px < W - 1) & (1 < py) & (py < H - 1)
+            person_idx, k = np.nonzero(inner)
+            shift = cls._gradient_sign(heatmaps[batch_idx], k, px[inner], py[inner]) * .25
+            people[person_idx, k, :2] += shift
         return ans
 
-    @staticmethod
-    def refine(heatmap, tag, keypoints, pose_tag=None):
+    @classmethod
+    def refine(cls, heatmap, tag, poses, poses_tags=None):
         K, H, W = heatmap.shape
         if len(tag.shape) == 3:
             tag = tag[..., None]
-
-        if pose_tag is not None:
-            prev_tag = pose_tag
-        else:
-            tags = []
-            for i in range(K):
-                if keypoints[i, 2] > 0:
-                    x, y = keypoints[i][:2].astype(int)
-                    tags.append(tag[i, y, x])
-            prev_tag = np.mean(tags, axis=0)
-
-        for i, (_heatmap, _tag) in enumerate(zip(heatmap, tag)):
-            if keypoints[i, 2] > 0:
-                continue
-            # Get position with the closest tag value to the pose tag.
-            diff = np.abs(_tag[..., 0] - prev_tag) + 0.5
-            diff = diff.astype(np.int32).astype(_heatmap.dtype)
-            diff -= _heatmap
-            idx = diff.argmin()
-            y, x = np.divmod(idx, _heatmap.shape[-1])
-            # Corresponding keypoint detection score.
-            val = _heatmap[y, x]
-            if val > 0:
-                keypoints[i, :3] = x, y, val
-                if 1 < x < W - 1 and 1 < y < H - 1:
-                    diff = np.array([
-                        _heatmap[y, x + 1] - _heatmap[y, x - 1],
-                        _heatmap[y + 1, x] - _heatmap[y - 1, x]
-                    ])
-                    keypoints[i, :2] += np.sign(diff) * .25
-
-        return keypoints
+        if len(poses) == 0:
+            return poses
+
+        if poses_tags is None:
+            visible = poses[:, :, 2] > 0
+            xy = poses[:, :, :2].astype(int)
+            poses_tags = np.stack([
+                np.mean(tag[np.nonzero(v)[0], p_xy[v, 1], p_xy[v, 0]], axis=0) for v, p_xy in zip(visible, xy)
+            ])
+        prev_tags = np.asarray(poses_tags).reshape(len(poses), -1)
+
+        pose_idx, joint_idx = np.nonzero(~(poses[:, :, 2] > 0))
+        heatmap_flat = heatmap.reshape(K, -1)
+        tag_flat = tag[..., 0].reshape(K, -1)
+        best = np.empty(len(pose_idx), dtype=np.int64)
+        # Missing joints of all poses are processed in batches small enough to stay in cache.
+        batch = max(1, cls._refine_buffer_bytes // (H * W * heatmap.itemsize))
+        buffer = np.empty((batch, H * W), dtype=heatmap.dtype)
+        for k in np.unique(joint_idx):
+            rows = np.nonzero(joint_idx == k)[0]
+            for start in range(0, len(rows), batch):
+                rows_batch = rows[start:start + batch]
+                diff = buffer[:len(rows_batch)]
+                # Get position with the closest tag value to the pose tag.
+                # floor() is equal to the int32 round trip here, since the values are non-negative.
+                np.subtract(tag_flat[k], prev_tags[pose_idx[rows_batch]], out=diff)
+                np.abs(diff, out=diff)
+                diff += 0.5
+                np.floor(diff, out=diff)
+                diff -= heatmap_flat[k]
+                best[rows_batch] = diff.argmin(axis=1)
+        y, x = np.divmod(best, W)
+        # Corresponding keypoint detection score.
+        val = heatmap[joint_idx, y, x]
+        found = val > 0
+        pose_idx, joint_idx, x, y, val = pose_idx[found], joint_idx[found], x[found], y[found], val[found]
+        poses[pose_idx, joint_idx, 0] = x
+        poses[pose_idx, joint_idx, 1] = y
+        poses[pose_idx, joint_idx, 2] = val
+
+        inner = (1 < x) & (x < W - 1) & (1 < y) & (y < H - 1)
+        shift = cls._gradient_sign(heatmap, joint_idx[inner], x[inner], y[inner]) * .25
+        poses[pose_idx[inner], joint_idx[inner], :2] += shift
+        return poses
 
     def __call__(self, heatmaps, tags, nms_heatmaps):
+        return self.decode_batch(heatmaps, tags, nms_heatmaps)[0]
+
+    def decode_batch(self, heatmaps, tags, nms_heatmaps):
         tag_k, loc_k, val_k = self.top_k(nms_heatmaps, tags)
         ans = tuple(map(self._match_by_tag, zip(tag_k, loc_k, val_k)))  # Call _match_by_tag() for each element in batch
         ans, ans_tags = map(list, zip(*ans))
@@ -326,20 +383,16 @@ class AssociativeEmbeddingDecoder:
 
         if self.delta != 0.0:
             for people in ans:
-                for person in people:
-                    for joint in person:
-                        joint[:2] += self.delta
-
-        ans = ans[0]
-        scores = np.asarray([i[:, 2].mean() for i in ans])
-        mask = scores > self.pose_threshold
-        ans = ans[mask]
-        scores = scores[mask]
-
-        if self.do_refine:
-            heatmap_numpy = heatmaps[0]
-            tag_numpy = tags[0]
-            for i, pose in enumerate(ans):
-                ans[i] = self.refine(heatmap_numpy, tag_numpy, pose, ans_tags[0][i])
-
-        return ans, scores
+                people[..., :2] += self.delta
+
+        results = []
+        for people, people_tags, heatmap, tag in zip(ans, ans_tags, heatmaps, tags):
+            scores = np.asarray([i[:, 2].mean() for i in people])
+            mask = scores > self.pose_threshold
+            people = people[mask]
+            scores = scores[mask]
+
+            if self.do_refine:
+                people = self.refine(heatmap, tag, people, people_tags[:len(people)])
+            results.append((people, scores))
+        return results
@@ -18,11 +18,11 @@ import logging
 
 
 class Model:
-    def __init__(self, ie, model_path, input_transform=None):
+    def __init__(self, ie, model_path, input_transform=None, batch_size=1):
         self.logger = logging.getLogger()
         self.logger.info('Reading network from IR...')
         self.net = ie.read_network(model_path)
-        self.set_batch_size(1)
+        self.set_batch_size(batch_size)
         self.input_transform = input_transform
 
     def preprocess(self, inputs):
@@ -1,29 +1,34 @@
-from typing import Any, List, Tuple
+from collections import deque
+from enum import IntEnum
+from typing import Any, Dict, List, Tuple
 
-import cv2
 import numpy as np
 from openvino.inference_engine import IECore
 
+from ..metrics import pipeline_metrics
+from .decoder_pool import DecoderPool
 from .hpe_associative_embedding import HpeAssociativeEmbedding
+from .skeletons import Skeletons
 from .utils import OutputTransform
 
 
 class PoseEstimator:
     """
     Данный класс предназначен для обнаружения позы человека в кадре.
-    В качестве нейронной сети используется higher-hrnet
+    В качестве нейронной сети используется higher-hrnet. Кадры передаются в BGR, сеть получает RGB
     """
     default_skeleton = (
         (15, 13), (13, 11), (16, 14), (14, 12), (11, 12), (5, 11), (6, 12), (5, 6), (5, 7),
         (6, 8), (7, 9), (8, 10), (1, 2), (0, 1), (0, 2), (1, 3), (2, 4), (3, 5), (4, 6),
     )
 
+    # Цвета в BGR
     colors = (
-        (255, 0, 0), (255, 0, 255), (170, 0, 255), (255, 0, 85),
-        (255, 0, 170), (85, 255, 0), (255, 170, 0), (0, 255, 0),
-        (255, 255, 0), (0, 255, 85), (170, 255, 0), (0, 85, 255),
-        (0, 255, 170), (0, 0, 255), (0, 255, 255), (85, 0, 255),
-        (0, 170, 255))
+        (0, 0, 255), (255, 0, 255), (255, 0, 170), (85, 0, 255),
+        (170, 0, 255), (0, 255, 85), (0, 170, 255), (0, 255, 0),
+        (0, 255, 255), (85, 255, 0), (0, 255, 170), (255, 85, 0),
+        (170, 255, 0), (255, 0, 0), (255, 255, 0), (255, 0, 85),
+        (255, 170, 0))
 
     point_names = [
         'nose',
@@ -45,55 +50,161 @@ class PoseEstimator:
         'right_heel',
     ]
 
-    def draw_poses(self, img: np.ndarray, poses: np.ndarray, point_score_threshold: float = 0.1,
-                   skeleton=default_skeleton) -> np.ndarray:
+    def annotate_skeletons(self, poses: np.ndarray, point_score_threshold: float = 0.1) -> Skeletons:
+        """Метод преобразования поз в пакет скелетов с целочисленными координатами в системе координат кадра."""
+        points = np.empty((*poses.shape[:2], 3), dtype=np.float32)
+        points[..., :2] = self._output_transform.scale(poses[..., :2].astype(np.int32))
+        points[..., 2] = poses[..., 2]
+        return Skeletons(points, poses[..., 2] > point_score_threshold)
+
+    def __init__(self, frame_shape: tuple, device: str = 'CPU', num_requests: int = 1, batch_size: int = 1,
+                 cpu_threads: int = 0, decode_workers: int = 0):
         """
-        Метод отрисовки поз на изображении.
+        cpu_threads - число потоков инференса на CPU (0 - по числу ядер), задается при нескольких процессах.
+        decode_workers - число процессов декодирования поз (DecoderPool), 0 - декодирование в вызывающем потоке.
         """
-        img = self._output_transform.resize(img)
-        if poses.size == 0:
-            return img
-        stick_width = 4
-
-        img_limbs = np.copy(img)
-        for pose in poses:
-            points = pose[:, :2].astype(np.int32)
-            points = self._output_transform.scale(points)
-            points_scores = pose[:, 2]
-            # Draw joints.
-            for i, (p, v) in enumerate(zip(points, points_scores)):
-                if v > point_score_threshold:
-                    cv2.circle(img, tuple(p), 1, PoseEstimator.colors[i], 2)
-            # Draw limbs.
-            for i, j in skeleton:
-                if points_scores[i] > point_score_threshold and points_scores[j] > point_score_threshold:
-                    cv2.line(img_limbs, tuple(points[i]), tuple(points[j]), color=PoseEstimator.colors[j],
-                             thickness=stick_width)
-        cv2.addWeighted(img, 0.4, img_limbs, 0.6, 0, dst=img)
-        return img
-
-    def annotate_skeletons(self, poses: np.ndarray, point_score_threshold: float = 0.1) -> List[dict]:
-        annotated_poses = []
-        for pose in poses:
-            points = pose[:, :2].astype(np.int32)
-            points = self._output_transform.scale(points)
-            points_scores = pose[:, 2]
-            pack = zip(PoseEstimator.point_names, points, points_scores)
-            annotated_poses.append({name: point for name, point, scores in pack if scores > point_score_threshold})
-        return annotated_poses
-
-    def __init__(self, frame_shape: tuple, device: str = 'CPU'):
         _model_path = 'backend/pose_estimator/higher-hrnet-w32/FP32/higher-hrnet-w32-human-pose-estimation.xml'
         _inference_engine = IECore()
+        if cpu_threads and device == 'CPU':
+            _inference_engine.set_config({'CPU_THREADS_NUM': str(cpu_threads)}, device)
         _aspect_ratio = frame_shape[1] / frame_shape[0]
         self._output_transform = OutputTransform(frame_shape, None)
         self._model = HpeAssociativeEmbedding(_inference_engine, _model_path, target_size=None,
                                               aspect_ratio=_aspect_ratio,
-                                              prob_threshold=0.1, delta=0.5, padding_mode='center')
-        self._exec_net = _inference_engine.load_network(network=self._model.net, device_name=device)
+                                              prob_threshold=0.1, delta=0.5, padding_mode='center',
+                                              batch_size=batch_size, reverse_input_channels=True)
+        self._exec_net = _inference_engine.load_network(network=self._model.net, device_name=device,
+                                                        num_requests=num_requests)
+        # Имена выходов сети, которые получает декодер
+        self._blob_names = {'heatmaps': self._model.heatmaps_blob_name,
+                            'nms_heatmaps': self._model.nms_heatmaps_blob_name,
+                            'embeddings': self._model.embeddings_blob_name}
+        self._decoder_pool = None
+        if decode_workers:
+            output_shapes = {name: tuple(self._model.net.outputs[blob_name].shape[1:])
+                             for name, blob_name in self._blob_names.items()}
+            self._decoder_pool = DecoderPool(self._model.decoder_factory, output_shapes, decode_workers)
+        # Очередь свободных запросов, очередь запросов в работе и очередь пакетов на декодировании
+        # (в порядке подачи кадров).
+        self._free_requests = deque(range(len(self._exec_net.requests)))
+        self._in_flight = deque()
+        self._decoding = deque()
 
     def process_image(self, frame: np.ndarray) -> Tuple[Any, Any]:
-        inputs, preprocessing_meta = self._model.preprocess(frame)
-        prediction = self._exec_net.infer(inputs=inputs)
-        poses, scores = self._model.postprocess(prediction, preprocessing_meta)
+        poses, scores = self.process_images([frame])[0]
         return poses, scores
+
+    def process_images(self, frames: List[np.ndarray]) -> List[Tuple[Any, Any]]:
+        """
+        Метод синхронной обработки пакета кадров (не больше batch_size). Возвращает (poses, scores) для каждого кадра.
+        При наличии пула декодирования кадры пакета декодируются параллельно.
+        """
+        with pipeline_metrics.timer('preprocess'):
+            inputs, preprocessing_metas = self._model.preprocess_batch(frames)
+        with pipeline_metrics.timer('infer'):
+            prediction = self._exec_net.infer(inputs=inputs)
+        if self._decoder_pool is not None:
+            return self._finish(None, self._start_decoding(prediction, len(frames)), preprocessing_metas, True)[1]
+        with pipeline_metrics.timer('decoder'):
+            return self._model.postprocess_batch(prediction, preprocessing_metas)
+
+    def infer_outputs(self, frames: List[np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Метод синхронного инференса пакета кадров без декодирования поз. Возвращает выходы сети
+        heatmaps, nms_heatmaps и embeddings для каждого кадра (для записи выходов и офлайн-бенчмарков).
+        """
+        inputs, _ = self._model.preprocess_batch(frames)
+        outputs = self._exec_net.infer(inputs=inputs)
+        return {name: np.copy(outputs[blob_name][:len(frames)]) for name, blob_name in self._blob_names.items()}
+
+    def _start_decoding(self, outputs: Dict[str, np.ndarray], num_frames: int) -> List[int]:
+        """Метод отправки выходов сети каждого кадра пакета в пул декодирования. Возвращает номера кадров в пуле."""
+        return [self._decoder_pool.submit({name: outputs[blob_name][i] for name, blob_name in self._blob_names.items()})
+                for i in range(num_frames)]
+
+    def _wait_oldest_request(self) -> Tuple[Any, Any, List[dict], bool]:
+        """
+        Метод ожидания самого старого запроса в работе.
+        Выходы копируются (в пул декодирования, если он есть), чтобы освободить запрос под следующий пакет
+        до начала постобработки.
+        """
+        request_id, metas, context, batched = self._in_flight.popleft()
+        request = self._exec_net.requests[request_id]
+        # В асинхронном режиме измеряется только ожидание: инференс идет параллельно с остальной обработкой.
+        with pipeline_metrics.timer('infer_wait'):
+            request.wait()
+        outputs = {name: blob.buffer for name, blob in request.output_blobs.items()}
+        if self._decoder_pool is not None:
+            outputs = self._start_decoding(outputs, len(metas))
+        else:
+            outputs = {name: np.copy(buffer) for name, buffer in outputs.items()}
+        self._free_requests.append(request_id)
+        return context, outputs, metas, batched
+
+    def _finish(self, context: Any, outputs: Any, metas: List[dict], batched: bool) -> tuple:
+        """outputs - выходы сети пакета или номера его кадров в пуле декодирования."""
+        if self._decoder_pool is not None:
+            with pipeline_metrics.timer('decoder_wait'):
+                results = self._model.rescale_batch([self._decoder_pool.result(ticket) for ticket in outputs], metas)
+        else:
+            with pipeline_metrics.timer('decoder'):
+                results = self._model.postprocess_batch(outputs, metas)
+        if batched:
+            return context, results
+        return (context, *results[0])
+
+    def _decoded(self, outputs: Any) -> bool:
+        return self._decoder_pool is None or all(map(self._decoder_pool.done, outputs))
+
+    def _collect(self, max_decoding: int) -> list:
+        """
+        Метод завершения пакетов в порядке подачи: пакетов, декодирование которых закончено,
+        и самых старых пакетов (с ожиданием), пока на декодировании больше max_decoding пакетов.
+        """
+        finished = []
+        while self._decoding and (len(self._decoding) > max_decoding or self._decoded(self._decoding[0][1])):
+            finished.append(self._finish(*self._decoding.popleft()))
+        return finished
+
+    def _submit(self, frames: List[np.ndarray], context: Any, batched: bool) -> list:
+        with pipeline_metrics.timer('preprocess'):
+            inputs, preprocessing_metas = self._model.preprocess_batch(frames)
+        if not self._free_requests:
+            self._decoding.append(self._wait_oldest_request())
+        request_id = self._free_requests.popleft()
+        self._exec_net.start_async(request_id=request_id, inputs=inputs)
+        self._in_flight.append((request_id, preprocessing_metas, context, batched))
+        return self._collect(self._decoder_pool.num_slots if self._decoder_pool is not None else 0)
+
+    def submit(self, frame: np.ndarray, context: Any = None) -> List[Tuple[Any, Any, Any]]:
+        """
+        Метод асинхронной обработки кадра.
+        Кадр предобрабатывается, пока предыдущие кадры находятся на инференсе. Если свободных запросов нет,
+        дожидается самый старый из них, на освободившемся запросе запускается текущий кадр,
+        после чего декодируется результат старого кадра. При наличии пула декодирования результат старого кадра
+        декодируется в пуле, и возвращаются только уже декодированные кадры.
+        Возвращает список (context, poses, scores) для завершенных кадров в порядке их подачи.
+        """
+        return self._submit([frame], context, batched=False)
+
+    def submit_batch(self, frames: List[np.ndarray], context: Any = None) -> List[Tuple[Any, List[Tuple[Any, Any]]]]:
+        """
+        Метод асинхронной обработки пакета кадров (не больше batch_size), аналогичный submit.
+        Возвращает список (context, [(poses, scores) для каждого кадра]) для завершенных пакетов.
+        """
+        return self._submit(frames, context, batched=True)
+
+    def flush(self) -> list:
+        """Метод ожидания всех запросов в работе и их декодирования. Возвращает результаты в порядке подачи кадров."""
+        while self._in_flight:
+            self._decoding.append(self._wait_oldest_request())
+        return self._collect(0)
+
+    def close(self) -> None:
+        """Метод остановки пула декодирования. Запросы в работе не дожидаются."""
+        if self._decoder_pool is not None:
+            self._decoder_pool.close()
+
+
+# Индексы точек скелета: Joint.LEFT_WRIST == PoseEstimator.point_names.index('left_wrist')
+Joint = IntEnum('Joint', [(name.upper(), index) for index, name in enumerate(PoseEstimator.point_names)])
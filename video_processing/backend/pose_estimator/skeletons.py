@@ -0,0 +1,54 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+class Skeletons:
+    """
+    Пакет скелетов кадра.
+    points - координаты и оценки точек (число людей x число точек x 3: x, y, оценка),
+    visible - маска точек с оценкой выше порога (число людей x число точек).
+    Порядок точек - PoseEstimator.point_names, индексы - Joint.
+    """
+
+    @property
+    def points(self) -> np.ndarray:
+        return self._points
+
+    @property
+    def visible(self) -> np.ndarray:
+        return self._visible
+
+    @property
+    def xy(self) -> np.ndarray:
+        return self._points[..., :2]
+
+    @property
+    def scores(self) -> np.ndarray:
+        """Оценка каждого скелета - средняя оценка его точек."""
+        return self._points[..., 2].mean(axis=1)
+
+    def __init__(self, points: np.ndarray, visible: np.ndarray):
+        self._points = points
+        self._visible = visible
+
+    @classmethod
+    def empty(cls, num_joints: int) -> 'Skeletons':
+        return cls(np.zeros((0, num_joints, 3), dtype=np.float32), np.zeros((0, num_joints), dtype=bool))
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __getitem__(self, index) -> 'Skeletons':
+        return Skeletons(self._points[index], self._visible[index])
+
+    def bounding_boxes(self) -> List[Tuple[int, int, int, int]]:
+        """Метод вычисления рамок (min_x, min_y, max_x, max_y) по видимым точкам всех скелетов."""
+        if len(self) == 0:
+            return []
+        visible = self._visible[..., None]
+        min_xy = np.where(visible, self.xy, np.inf).min(axis=1)
+        max_xy = np.where(visible, self.xy, -np.inf).max(axis=1)
+        boxes = np.concatenate((min_xy, max_xy), axis=1)
+        boxes[~self._visible.any(axis=1)] = 0
+        return [tuple(box) for box in boxes.astype(np.int32).tolist()]
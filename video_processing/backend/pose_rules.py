@@ -0,0 +1,219 @@
+from typing import List, NamedTuple, Sequence, Tuple, Union
+
+import numpy as np
+
+from .pose_estimator import Joint, Skeletons
+
+# Точка скелета: сустав или середина нескольких суставов
+Point = Union[Joint, Tuple[Joint, ...]]
+# Вектор между двумя точками скелета (откуда, куда)
+Vector = Tuple[Point, Point]
+
+# Виды признаков, вычисляемых по векторам
+_DY, _LENGTH, _COS, _VERTICAL_COS = range(4)
+
+
+class Above(NamedTuple):
+    """Точка joint выше точки reference не меньше чем на margin (доля размера скелета)."""
+    joint: Point
+    reference: Point
+    margin: float = 0.
+
+    def compile(self) -> Tuple[int, Vector, Vector, float, float]:
+        vector = (self.reference, self.joint)
+        return _DY, vector, vector, -np.inf, -self.margin
+
+
+class Below(NamedTuple):
+    """Точка joint ниже точки reference не меньше чем на margin (доля размера скелета)."""
+    joint: Point
+    reference: Point
+    margin: float = 0.
+
+    def compile(self) -> Tuple[int, Vector, Vector, float, float]:
+        vector = (self.reference, self.joint)
+        return _DY, vector, vector, self.margin, np.inf
+
+
+class Near(NamedTuple):
+    """Расстояние между точками меньше radius (доля размера скелета)."""
+    joint: Point
+    reference: Point
+    radius: float
+
+    def compile(self) -> Tuple[int, Vector, Vector, float, float]:
+        vector = (self.reference, self.joint)
+        return _LENGTH, vector, vector, -np.inf, self.radius
+
+
+class Angle(NamedTuple):
+    """Угол first-vertex-second в градусах лежит в диапазоне (min_deg, max_deg)."""
+    first: Point
+    vertex: Point
+    second: Point
+    min_deg: float = 0.
+    max_deg: float = 180.
+
+    def compile(self) -> Tuple[int, Vector, Vector, float, float]:
+        return (_COS, (self.vertex, self.first), (self.vertex, self.second),
+                _cos_bound(self.max_deg, 180, -np.inf), _cos_bound(self.min_deg, 0, np.inf))
+
+
+class Tilt(NamedTuple):
+    """Угол отклонения отрезка lower-upper от вертикали в градусах лежит в диапазоне (min_deg, max_deg)."""
+    lower: Point
+    upper: Point
+    min_deg: float = 0.
+    max_deg: float = 90.
+
+    def compile(self) -> Tuple[int, Vector, Vector, float, float]:
+        vector = (self.lower, self.upper)
+        return (_VERTICAL_COS, vector, vector,
+                _cos_bound(self.max_deg, 90, -np.inf), _cos_bound(self.min_deg, 0, np.inf))
+
+
+Condition = Union[Above, Below, Near, Angle, Tilt]
+
+
+def _cos_bound(degrees: float, limit: float, unbounded: float) -> float:
+    return unbounded if degrees == limit else np.cos(np.deg2rad(degrees))
+
+
+class PoseRule:
+    """
+    Правило позы: поза обнаружена, если выполнены все условия хотя бы одного из вариантов.
+    Расстояния задаются в долях размера скелета (большей стороны рамки), начало координат - левый верхний угол.
+    """
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def alternatives(self) -> Tuple[Tuple[Condition, ...], ...]:
+        return self._alternatives
+
+    def __init__(self, name: str, *alternatives: Sequence[Condition]):
+        self._name = name
+        self._alternatives = tuple(tuple(conditions) for conditions in alternatives)
+
+
+def _arm_raised(side: str) -> List[Condition]:
+    wrist, elbow, shoulder = (Joint[f'{side}_{name}'] for name in ('WRIST', 'ELBOW', 'SHOULDER'))
+    return [Above(wrist, elbow), Above(elbow, shoulder)]
+
+
+def _arm_lowered(side: str) -> List[Condition]:
+    return [Below(Joint[f'{side}_WRIST'], Joint[f'{side}_SHOULDER'])]
+
+
+_SHOULDERS = (Joint.LEFT_SHOULDER, Joint.RIGHT_SHOULDER)
+_HIPS = (Joint.LEFT_HIP, Joint.RIGHT_HIP)
+
+DEFAULT_RULES = (
+    PoseRule('raised_arms', _arm_raised('RIGHT') + _arm_raised('LEFT')),
+    PoseRule('one_arm_raised', _arm_raised('RIGHT') + _arm_lowered('LEFT'),
+             _arm_raised('LEFT') + _arm_lowered('RIGHT')),
+    PoseRule('hands_on_head', [Near(Joint.RIGHT_WRIST, Joint.NOSE, 0.12), Near(Joint.LEFT_WRIST, Joint.NOSE, 0.12),
+                               Above(Joint.RIGHT_WRIST, Joint.RIGHT_SHOULDER),
+                               Above(Joint.LEFT_WRIST, Joint.LEFT_SHOULDER)]),
+    PoseRule('crouch', [Angle(Joint.RIGHT_HIP, Joint.RIGHT_KNEE, Joint.RIGHT_HEEL, max_deg=110),
+                        Angle(Joint.LEFT_HIP, Joint.LEFT_KNEE, Joint.LEFT_HEEL, max_deg=110)]),
+    PoseRule('fall', [Tilt(_HIPS, _SHOULDERS, min_deg=60)]),
+)
+
+
+class PoseRuleEngine:
+    """
+    Класс проверки правил поз.
+    Условия всех правил при создании компилируются в матрицы: векторы между точками скелета - в веса суставов,
+    правила - в матрицы условий и вариантов. Проверка всех правил для всех людей кадра - несколько
+    матричных операций, поэтому новое правило почти не увеличивает время обработки кадра.
+    """
+
+    @property
+    def rule_names(self) -> List[str]:
+        return [rule.name for rule in self._rules]
+
+    def __init__(self, rules: Sequence[PoseRule] = DEFAULT_RULES):
+        self._rules = list(rules)
+        vectors, features, conditions = {}, {}, {}
+        alternatives = []
+        for rule_index, rule in enumerate(self._rules):
+            for alternative in rule.alternatives:
+                condition_indices = []
+                for condition in alternative:
+                    kind, first, second, low, high = condition.compile()
+                    vector_indices = tuple(vectors.setdefault(vector, len(vectors)) for vector in (first, second))
+                    feature = features.setdefault((kind, *vector_indices), len(features))
+                    condition_indices.append(conditions.setdefault((feature, low, high), len(conditions)))
+                alternatives.append((rule_index, condition_indices))
+
+        # Вектор - линейная комбинация суставов; для его вычисления нужны все суставы обеих точек.
+        self._vector_weights = np.zeros((len(vectors), len(Joint)), dtype=np.float32)
+        self._vector_joints = np.zeros((len(vectors), len(Joint)), dtype=np.float32)
+        for (start, end), index in vectors.items():
+            for point, sign in ((start, -1), (end, 1)):
+                joints = list(np.atleast_1d(point))
+                self._vector_weights[index, joints] += sign / len(joints)
+                self._vector_joints[index, joints] = 1
+
+        feature_keys = list(features)
+        self._feature_kinds = np.array([kind for kind, _, _ in feature_keys], dtype=np.int32)
+        self._feature_vectors = np.array([vector_indices for _, *vector_indices in feature_keys],
+                                         dtype=np.int32).reshape(-1, 2)
+        condition_keys = list(conditions)
+        self._condition_features = np.array([feature for feature, _, _ in condition_keys], dtype=np.int32)
+        self._condition_low = np.array([low for _, low, _ in condition_keys], dtype=np.float32)
+        self._condition_high = np.array([high for _, _, high in condition_keys], dtype=np.float32)
+
+        self._alternative_conditions = np.zeros((len(alternatives), len(conditions)), dtype=np.float32)
+        self._alternative_rules = np.zeros((len(alternatives), len(self._rules)), dtype=np.float32)
+        for index, (rule_index, condition_indices) in enumerate(alternatives):
+            self._alternative_conditions[index, condition_indices] = 1
+            self._alternative_rules[index, rule_index] = 1
+        self._alternative_sizes = self._alternative_conditions.sum(axis=1)
+
+    @staticmethod
+    def _body_size(skeletons: Skeletons) -> np.ndarray:
+        visible = skeletons.visible[..., None]
+        size = (np.where(visible, skeletons.xy, -np.inf).max(axis=1) -
+                np.where(visible, skeletons.xy, np.inf).min(axis=1)).max(axis=1)
+        return np.maximum(np.nan_to_num(size, neginf=1), 1)
+
+    def _features(self, skeletons: Skeletons) -> Tuple[np.ndarray, np.ndarray]:
+        """Значения всех признаков (люди x признаки) и флаги их вычислимости."""
+        vectors = np.einsum('kj,njd->nkd', self._vector_weights, skeletons.xy)
+        vectors_visible = (~skeletons.visible).astype(np.float32) @ self._vector_joints.T == 0
+        lengths = np.linalg.norm(vectors, axis=2)
+        body_size = self._body_size(skeletons)[:, None]
+        first, second = self._feature_vectors[:, 0], self._feature_vectors[:, 1]
+        kinds = self._feature_kinds
+
+        values = np.empty((len(skeletons), len(kinds)), dtype=np.float32)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            dy = kinds == _DY
+            values[:, dy] = vectors[:, first[dy], 1] / body_size
+            length = kinds == _LENGTH
+            values[:, length] = lengths[:, first[length]] / body_size
+            cos = kinds == _COS
+            values[:, cos] = ((vectors[:, first[cos]] * vectors[:, second[cos]]).sum(axis=2) /
+                              (lengths[:, first[cos]] * lengths[:, second[cos]]))
+            vertical = kinds == _VERTICAL_COS
+            values[:, vertical] = np.abs(vectors[:, first[vertical], 1]) / lengths[:, first[vertical]]
+        return values, vectors_visible[:, first] & vectors_visible[:, second]
+
+    def evaluate(self, skeletons: Skeletons) -> np.ndarray:
+        """Метод проверки всех правил для всех скелетов кадра. Возвращает флаги (люди x правила)."""
+        if len(skeletons) == 0:
+            return np.zeros((0, len(self._rules)), dtype=bool)
+        values, features_visible = self._features(skeletons)
+        values = values[:, self._condition_features]
+        conditions = ((values > self._condition_low) & (values < self._condition_high) &
+                      features_visible[:, self._condition_features])
+        alternatives = conditions.astype(np.float32) @ self._alternative_conditions.T == self._alternative_sizes
+        return alternatives.astype(np.float32) @ self._alternative_rules > 0
+
+    def detect(self, skeletons: Skeletons, rule_name: str) -> np.ndarray:
+        """Метод проверки одного правила. Возвращает флаг для каждого скелета."""
+        return self.evaluate(skeletons)[:, self.rule_names.index(rule_name)]
@@ -1,20 +1,69 @@
-import logging
-from socketserver import BaseRequestHandler
+import socket
+import time
+from typing import Optional, Tuple
 
-from .server import Server
+from .frame_protocol import VARIANTS
 
-logging.basicConfig(level=logging.DEBUG)
 
-
-class RequestHandler(BaseRequestHandler):
+class RequestHandler:
     """
-    Класс обработчика запросов. Возвращает изображение с сервера.
+    Класс состояния клиента сервера кадров: вариант кадров, буфер отправки и номер последнего отправленного кадра.
+    Буфер ссылается на неизменяемый кадр сервера без копирования, поэтому на клиента приходится не больше
+    одного кадра, общего для всех клиентов.
     """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    @property
+    def client_address(self) -> tuple:
+        return self._client_address
+
+    @property
+    def variant(self) -> int:
+        """Индекс варианта кадров в frame_protocol.VARIANTS."""
+        return self._variant
+
+    @property
+    def pending(self) -> bool:
+        """Есть ли неотправленные данные."""
+        return self._buffer is not None
+
+    @property
+    def last_progress(self) -> float:
+        """Время (time.monotonic) начала отправки текущего кадра или последней отправки его части."""
+        return self._last_progress
+
+    def __init__(self, request: socket.socket, client_address: tuple, server):
+        self._request = request
+        self._client_address = client_address
+        self._server = server
+        self._variant = 0
+        self._frame_index = 0
+        self._buffer: Optional[memoryview] = None
+        self._last_progress = time.monotonic()
+
+    def select_variant(self, variant: bytes) -> None:
+        """Метод выбора варианта кадров (frame_protocol.VARIANTS). Неизвестные варианты игнорируются."""
+        if variant in VARIANTS:
+            self._variant = VARIANTS.index(variant)
 
-    def handle(self) -> None:
-        self.server: Server
-        image = self.server.get_response_image()
-        self.request.sendall(image)
+    def send(self, frame: Tuple[int, Tuple[bytes, Optional[bytes]]]) -> None:
+        """
+        Метод отправки без блокировки: дописывает неотправленный кадр, а затем, если кадр frame новее
+        последнего отправленного, начинает отправку frame. Ошибки сокета передаются серверу.
+        """
+        while True:
+            if self._buffer is None:
+                frame_index, variants = frame
+                if frame_index <= self._frame_index:
+                    return
+                self._frame_index = frame_index
+                # Если выбранный вариант не создавался для кадра, отправляется имеющийся.
+                self._buffer = memoryview(variants[self._variant] or next(filter(None, variants)))
+                self._last_progress = time.monotonic()
+            try:
+                sent = self._request.send(self._buffer)
+            except BlockingIOError:
+                return
+            self._last_progress = time.monotonic()
+            self._buffer = self._buffer[sent:] if sent < len(self._buffer) else None
+            if self._buffer is not None:
+                return
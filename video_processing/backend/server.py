@@ -1,20 +1,182 @@
 import logging
+import selectors
+import socket
+import time
 from socketserver import TCPServer
+from typing import Dict, Optional, Tuple
+
+from .frame_protocol import VARIANTS, pack_frame
 
 logging.basicConfig(level=logging.DEBUG)
 
 
 class Server(TCPServer):
-    def __init__(self, *args, **kwargs):
-        self._response_image: bytes = b''
-        super().__init__(*args, **kwargs)
+    """
+    TCP-сервер кадров на selectors: все клиенты обслуживаются в одном потоке неблокирующими сокетами
+    по постоянным соединениям, поэтому медленный клиент не задерживает остальных.
+    Текущий кадр хранится как неизменяемая пара (номер, упакованные варианты кадра) и заменяется одним
+    присваиванием без блокировок; поток обработки видео только будит цикл сервера.
+    Состояние клиента (буфер отправки и номер последнего кадра) хранит RequestHandlerClass. Клиент, не успевший
+    отправить кадр, пропускает промежуточные и затем получает последний кадр. Клиент, не принимавший данные
+    дольше client_timeout секунд, отключается.
+    """
+    allow_reuse_address = True
+    # Период проверки медленных клиентов, с
+    _poll_interval = 0.5
+
+    @property
+    def clients_count(self) -> int:
+        return len(self._clients)
+
+    @property
+    def consumers(self) -> Tuple[int, ...]:
+        """Число клиентов, получающих каждый вариант кадров (в порядке frame_protocol.VARIANTS)."""
+        return self._consumers
+
+    @property
+    def evicted_count(self) -> int:
+        return self._evicted_count
+
+    @property
+    def frame(self) -> Tuple[int, Tuple[bytes, Optional[bytes]]]:
+        """
+        Номер текущего кадра и варианты кадра в порядке frame_protocol.VARIANTS, упакованные по протоколу
+        frame_protocol. Отсутствующий вариант - None.
+        """
+        return self._frame
+
+    def __init__(self, server_address: tuple, RequestHandlerClass, client_timeout: float = 5.,
+                 max_clients: int = 64, *args, **kwargs):
+        self._frame: Tuple[int, Tuple[bytes, Optional[bytes]]] = (0, (b'', None))
+        self._client_timeout = client_timeout
+        self._max_clients = max_clients
+        self._clients: Dict[socket.socket, object] = {}
+        # Пересчитывается в потоке сервера и заменяется целиком, поэтому читается из других потоков без блокировок.
+        self._consumers = (0,) * len(VARIANTS)
+        self._evicted_count = 0
+        self._running = False
+        self._selector = selectors.DefaultSelector()
+        # Пара сокетов для пробуждения цикла сервера из других потоков
+        self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+        self._wakeup_receiver.setblocking(False)
+        self._wakeup_sender.setblocking(False)
+        super().__init__(server_address, RequestHandlerClass, *args, **kwargs)
 
     def get_response_image(self) -> bytes:
-        return self._response_image
+        return next(filter(None, self._frame[1]), b'')[4:]
+
+    def set_response_image(self, image: Optional[bytes], preview: bytes = None) -> None:
+        """
+        Метод публикации кадра и его уменьшенной копии preview. Может быть передан только один из вариантов,
+        тогда клиенты другого варианта получают его.
+        """
+        variants = tuple(None if data is None else pack_frame(data) for data in (image, preview))
+        self._frame = (self._frame[0] + 1, variants)
+        self._wakeup()
+
+    def _count_consumers(self) -> None:
+        counts = [0] * len(VARIANTS)
+        for handler in self._clients.values():
+            counts[handler.variant] += 1
+        self._consumers = tuple(counts)
 
-    def set_response_image(self, image: bytes) -> None:
-        self._response_image = image
+    def _wakeup(self) -> None:
+        try:
+            self._wakeup_sender.send(b'\0')
+        except BlockingIOError:
+            # Цикл сервера уже разбужен и еще не прочитал предыдущие сигналы.
+            pass
 
-    def serve_forever(self, *args, **kwargs) -> None:
+    def process_request(self, request: socket.socket, client_address: tuple) -> None:
+        if len(self._clients) >= self._max_clients:
+            logging.debug(f'Client rejected, too many clients: {client_address}')
+            self.shutdown_request(request)
+            return
+        request.setblocking(False)
+        self._clients[request] = self.RequestHandlerClass(request, client_address, self)
+        self._selector.register(request, selectors.EVENT_READ)
+        logging.debug(f'Client connected: {client_address}')
+        self._count_consumers()
+        self._send(request)
+
+    def _close_client(self, request: socket.socket) -> None:
+        handler = self._clients.pop(request)
+        self._selector.unregister(request)
+        self.shutdown_request(request)
+        self._count_consumers()
+        logging.debug(f'Client disconnected: {handler.client_address}')
+
+    def _send(self, request: socket.socket) -> None:
+        """Метод отправки данных клиенту. Пока сокет не принимает данные, клиент ждет события записи."""
+        handler = self._clients[request]
+        try:
+            handler.send(self._frame)
+        except OSError:
+            self._close_client(request)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if handler.pending else 0)
+        self._selector.modify(request, events)
+
+    def _receive(self, request: socket.socket) -> None:
+        """Клиенты присылают только выбор варианта кадров, поэтому чтение в основном обнаруживает отключение."""
+        try:
+            data = request.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close_client(request)
+        else:
+            self._clients[request].select_variant(data[-1:])
+            self._count_consumers()
+
+    def _evict_slow_clients(self) -> None:
+        now = time.monotonic()
+        for request, handler in list(self._clients.items()):
+            if handler.pending and now - handler.last_progress > self._client_timeout:
+                logging.debug(f'Slow client evicted: {handler.client_address}')
+                self._evicted_count += 1
+                self._close_client(request)
+
+    def serve_forever(self, poll_interval: float = None) -> None:
+        poll_interval = poll_interval or self._poll_interval
         logging.debug(f'Server started on {self.server_address}')
-        super().serve_forever(*args, **kwargs)
+        self._selector.register(self.socket, selectors.EVENT_READ)
+        self._selector.register(self._wakeup_receiver, selectors.EVENT_READ)
+        self._running = True
+        last_frame_index = 0
+        while self._running:
+            for key, events in self._selector.select(poll_interval):
+                if key.fileobj is self.socket:
+                    self._handle_request_noblock()
+                elif key.fileobj is self._wakeup_receiver:
+                    try:
+                        while self._wakeup_receiver.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif key.fileobj in self._clients:
+                    if events & selectors.EVENT_READ:
+                        self._receive(key.fileobj)
+                    if events & selectors.EVENT_WRITE and key.fileobj in self._clients:
+                        self._send(key.fileobj)
+            frame_index = self._frame[0]
+            if frame_index != last_frame_index:
+                last_frame_index = frame_index
+                # Клиенты с неотправленным кадром получат новый кадр по событию записи.
+                for request in [request for request, handler in self._clients.items() if not handler.pending]:
+                    self._send(request)
+            self._evict_slow_clients()
+
+    def shutdown(self) -> None:
+        self._running = False
+        self._wakeup()
+
+    def server_close(self) -> None:
+        for request in list(self._clients):
+            self._close_client(request)
+        self._selector.close()
+        self._wakeup_receiver.close()
+        self._wakeup_sender.close()
+        super().server_close()
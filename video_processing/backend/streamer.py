@@ -1,7 +1,9 @@
 import logging
 import socket
 from threading import Thread
+from typing import Optional, Tuple
 
+from .frame_protocol import VARIANTS
 from .request_handler import RequestHandler
 from .server import Server
 
@@ -11,7 +13,14 @@ logging.basicConfig(level=logging.DEBUG)
 class Streamer(Thread):
     """Класс стриминга видео."""
 
-    def __init__(self, host_ip: str = None, port: int = None, *args, **kwargs):
+    @property
+    def server(self) -> Server:
+        """Сервер кадров, None до запуска потока."""
+        return self._server
+
+    def __init__(self, host_ip: str = None, port: int = None, client_timeout: float = 5., max_clients: int = 64,
+                 *args, **kwargs):
+        """client_timeout и max_clients передаются в Server."""
 
         self._host_name = socket.gethostname()
         if host_ip:
@@ -22,14 +31,24 @@ class Streamer(Thread):
             self._port = port
         else:
             self._port = 80
+        self._client_timeout = client_timeout
+        self._max_clients = max_clients
+        self._server = None
         self._set_current_frame = None
         super().__init__(name='videostream_thread', *args, **kwargs)
         logging.debug('Streamer is ready')
 
     def run(self):
-        with Server((self._host_ip, self._port), RequestHandler) as streaming_server:
+        with Server((self._host_ip, self._port), RequestHandler,
+                    self._client_timeout, self._max_clients) as streaming_server:
+            self._server = streaming_server
             self._set_current_frame = streaming_server.set_response_image
             streaming_server.serve_forever()
 
-    def update(self, frame: bytes) -> None:
-        self._set_current_frame(frame)
+    @property
+    def consumers(self) -> Tuple[int, ...]:
+        """Число клиентов каждого варианта кадров (Server.consumers), нули до запуска сервера."""
+        return self._server.consumers if self._server is not None else (0,) * len(VARIANTS)
+
+    def update(self, frame: Optional[bytes], preview: bytes = None) -> None:
+        self._set_current_frame(frame, preview)
@@ -1,73 +1,95 @@
 from typing import List
 
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 
 from .person import Person
+from .pose_estimator import Joint, Skeletons
 
 
 class SkeletonTracker:
-    """Трекер для отслеживания скелетов. Необходим, чтобы отслеживать, кто из людей в кадре принимал заданную позу."""
+    """
+    Трекер для отслеживания скелетов. Необходим, чтобы отслеживать, кто из людей в кадре принимал заданную позу.
+    Скелеты кадра сопоставляются с треками оптимальным назначением (венгерский алгоритм)
+    по матрице стоимостей, вычисляемой сразу для всех пар скелет-трек.
+    """
     _tracking_threshold = 0.5
     # Квадарт максимального сдвига элемента скелета (чтобы не считать sqrt)
     _shift_threshold = 50 ** 2
     _unmatched_frames_count = 10
+    # Стоимость недопустимого сопоставления
+    _no_match_cost = 1e6
 
     def __init__(self):
         self._skeletons: List[Person] = []
+        # Ключевые точки (треки x точки x 2) и их видимость для сопоставления
+        self._points = np.zeros((0, len(Joint), 2), dtype=np.float32)
+        self._visible = np.zeros((0, len(Joint)), dtype=bool)
+        self._next_index = 0
 
-    def _match_skeletons(self, skeleton: dict, reference_skeleton: dict) -> bool:
-        point_names = set(skeleton.keys()).intersection(set(reference_skeleton.keys()))
-        tracks = np.array([np.square(skeleton[pt_name] - reference_skeleton[pt_name]).sum() for pt_name in point_names])
-        if tracks.shape[0] != 0:
-            return tracks[tracks <= self._shift_threshold].shape[0] / tracks.shape[0] >= self._tracking_threshold
-        else:
-            return False
+    def _cost_matrix(self, points: np.ndarray, visible: np.ndarray) -> np.ndarray:
+        """
+        Матрица стоимостей (скелеты x треки). Пара допустима, если не меньше _tracking_threshold общих точек
+        сдвинулись не больше чем на sqrt(_shift_threshold). Стоимость - доля сдвинувшихся точек
+        плюс нормированный средний сдвиг для различения близких вариантов.
+        """
+        shifts = np.square(points[:, None] - self._points[None]).sum(axis=3)
+        common = visible[:, None] & self._visible[None]
+        common_count = common.sum(axis=2)
+        close_count = ((shifts <= self._shift_threshold) & common).sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            close_ratio = close_count / common_count
+            mean_shift = np.where(common, np.minimum(shifts, self._shift_threshold), 0).sum(axis=2) / common_count
+        cost = 1 - close_ratio + 1e-3 * mean_shift / self._shift_threshold
+        cost[~(close_ratio >= self._tracking_threshold)] = self._no_match_cost
+        return cost
 
-    def _on_empty_intrenal_data(self, skeletons: List[dict], bboxes: List[dict]) -> None:
-        for skeleton, bbox in zip(skeletons, bboxes):
-            person_index = len(self._skeletons)
-            skeleton_data = Person(person_index, skeleton, bbox, self._unmatched_frames_count)
-            self._skeletons.append(skeleton_data)
+    def _add_track(self, skeleton: np.ndarray, bbox: tuple) -> Person:
+        person = Person(self._next_index, skeleton, bbox, self._unmatched_frames_count)
+        self._next_index += 1
+        self._skeletons.append(person)
+        return person
 
-    def _on_empty_input_data(self):
-        for reference_skeleton in self._skeletons:
-            reference_skeleton.unmatched_frames_count -= 1
-            if reference_skeleton.unmatched_frames_count == 0:
-                self._skeletons.remove(reference_skeleton)
+    def track(self, skeletons: Skeletons, bboxes: List[tuple]) -> List[Person]:
+        """
+        Метод сопоставления скелетов кадра с треками. Возвращает данные человека для каждого скелета.
+        Несопоставленные скелеты начинают новые треки, несопоставленные треки удаляются
+        через _unmatched_frames_count кадров.
+        """
+        points, visible = skeletons.xy, skeletons.visible
+        num_old = len(self._skeletons)
+        matches = {}
+        if len(skeletons) and num_old:
+            cost = self._cost_matrix(points, visible)
+            rows, cols = linear_sum_assignment(cost)
+            matches = {row: col for row, col in zip(rows, cols) if cost[row, col] < self._no_match_cost}
 
-    def _on_extra_internal_data(self, skeletons: List[dict]) -> None:
-        for reference_skeleton in self._skeletons:
-            for skeleton in skeletons:
-                if not self._match_skeletons(skeleton, reference_skeleton.skeleton):
-                    reference_skeleton.unmatched_frames_count -= 1
-                    if reference_skeleton.unmatched_frames_count == 0:
-                        self._skeletons.remove(reference_skeleton)
+        matched_tracks = set(matches.values())
+        tracked = []
+        for index, (skeleton, bbox) in enumerate(zip(skeletons.points, bboxes)):
+            if index in matches:
+                person = self._skeletons[matches[index]]
+                person.skeleton = skeleton
+                person.bbox = bbox
+                person.unmatched_frames_count = self._unmatched_frames_count
+            else:
+                person = self._add_track(skeleton, bbox)
+            tracked.append(person)
 
-    def _on_lack_internal_data(self, skeletons: List[dict], bboxes: List[dict]):
-        new_skeletons = []
-        for skeleton, bbox in zip(skeletons, bboxes):
-            for reference_skeleton in self._skeletons:
-                if not self._match_skeletons(skeleton, reference_skeleton.skeleton):
-                    person_index = len(self._skeletons)
-                    new_skeletons.append(Person(person_index, skeleton, bbox, self._unmatched_frames_count))
-        self._skeletons.extend(new_skeletons)
-
-    def update(self, skeletons: List[dict], bboxes: List[dict]) -> None:
-        if len(self._skeletons) == 0:
-            self._on_empty_intrenal_data(skeletons, bboxes)
-        if len(skeletons) == 0:
-            self._on_empty_input_data()
-        elif len(self._skeletons) < len(skeletons):
-            self._on_lack_internal_data(skeletons, bboxes)
-        elif len(self._skeletons) > len(skeletons):
-            self._on_extra_internal_data(skeletons)
-
-    def track(self, skeletons: List[dict], bboxes: List[dict]) -> List[Person]:
-        idx = []
-        for skeleton, bbox in zip(skeletons, bboxes):
-            for index, reference_skeleton in enumerate(self._skeletons):
-                if self._match_skeletons(skeleton, reference_skeleton.skeleton):
-                    self._skeletons[index].skeleton = skeleton
-                    self._skeletons[index].bbox = bbox
-                    idx.append(index)
-        return [self._skeletons[index] for index in idx]
+        # Сопоставленные треки обновляются, новые добавляются в конец, устаревшие удаляются.
+        new_rows = [index for index in range(len(skeletons)) if index not in matches]
+        self._points = np.concatenate((self._points, points[new_rows]))
+        self._visible = np.concatenate((self._visible, visible[new_rows]))
+        if matches:
+            rows, cols = map(list, zip(*matches.items()))
+            self._points[cols] = points[rows]
+            self._visible[cols] = visible[rows]
+        keep = np.ones(len(self._skeletons), dtype=bool)
+        for col, person in enumerate(self._skeletons[:num_old]):
+            if col not in matched_tracks:
+                person.unmatched_frames_count -= 1
+                keep[col] = person.unmatched_frames_count > 0
+        self._skeletons = [person for person, keep_person in zip(self._skeletons, keep) if keep_person]
+        self._points = self._points[keep]
+        self._visible = self._visible[keep]
+        return tracked
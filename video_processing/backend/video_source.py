@@ -0,0 +1,83 @@
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .detectors import RaisingArmsMomentDetector
+from .frame_reader import FrameReader
+from .frame_skipping import PosePropagator
+from .streamer import Streamer
+from .trackers import SkeletonTracker
+
+
+class VideoSource:
+    """
+    Класс источника видео.
+    Хранит всё, что относится к одному видеопотоку: поток чтения видеофайла, перенос поз на пропущенные кадры,
+    трекер скелетов, детектор момента поднятия рук и стример.
+    """
+    # Период (в кадрах) вывода в лог статистики очереди кадров
+    _stats_log_interval = 1000
+
+    @property
+    def input_video_file(self) -> str:
+        return self._input_video_file
+
+    @property
+    def frame_shape(self) -> tuple:
+        return self._frame_reader.frame_shape
+
+    @property
+    def frame_reader(self) -> FrameReader:
+        return self._frame_reader
+
+    @property
+    def pose_propagator(self) -> PosePropagator:
+        return self._pose_propagator
+
+    @property
+    def skeleton_tracker(self) -> SkeletonTracker:
+        return self._skeleton_tracker
+
+    @property
+    def unique_detector(self) -> RaisingArmsMomentDetector:
+        return self._unique_detector
+
+    @property
+    def streamer(self) -> Streamer:
+        return self._streamer
+
+    def __init__(self, input_video_file: str, streamer: Streamer, queue_size: int = 4, policy: str = 'all',
+                 reserve: int = 1):
+        """Параметры queue_size, policy и reserve передаются в FrameReader."""
+        self._input_video_file = input_video_file
+        self._frame_reader = FrameReader(input_video_file, queue_size, policy, reserve,
+                                         name=f'frame_reader_thread_{input_video_file}', daemon=True)
+        self._frames_read = 0
+
+        self._pose_propagator = PosePropagator()
+        self._skeleton_tracker = SkeletonTracker()
+        self._unique_detector = RaisingArmsMomentDetector()
+        self._streamer = streamer
+
+    def start(self) -> None:
+        self._frame_reader.start()
+        self._streamer.start()
+
+    def read(self) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        Метод получения очередного кадра. Возвращает номер кадра и кадр в BGR или None, если видео закончилось.
+        После обработки кадр нужно вернуть методом release.
+        """
+        frame_data = self._frame_reader.get()
+        if frame_data is None:
+            return None
+        self._frames_read += 1
+        if self._frames_read % self._stats_log_interval == 0:
+            logging.debug(f'{self._input_video_file}: frame {frame_data[0]}, '
+                          f'queue depth {self._frame_reader.queue_depth}, '
+                          f'dropped frames {self._frame_reader.frames_dropped}')
+        return frame_data
+
+    def release(self, frame: np.ndarray) -> None:
+        self._frame_reader.release(frame)
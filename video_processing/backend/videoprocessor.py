@@ -1,156 +1,285 @@
 import logging
-from typing import List
+import time
+from collections import deque
+from typing import List, Optional, Tuple, Union
 
-import cv2 as cv
 import numpy as np
 
+from .database_handler.blob_store import FileBlobStore
 from .database_handler.db_handler import DBHandler
-from .detectors import RaisingArmsMomentDetector, SimpleRaisedArmsDetector
-from .person import Person
+from .database_handler.db_writer import DBWriter
+from .detection_stage import DetectionStage
+from .frame_encoder import FrameEncoder
+from .frame_skipping import InferenceScheduler
+from .metrics import pipeline_metrics
+from .metrics_server import MetricsExporter
 from .pose_estimator import PoseEstimator
+from .pose_estimator.decoder_pool import DecoderPool
 from .streamer import Streamer
-from .trackers import SkeletonTracker
+from .video_source import VideoSource
 
 logging.basicConfig(level=logging.DEBUG)
 
+# Источник, номер кадра и сам кадр
+FrameContext = Tuple[VideoSource, int, np.ndarray]
+
+
+class PendingBatch:
+    """Пакет кадров, ожидающий обработки. Позы кадров, пропущенных нейронной сетью, вычисляются при обработке."""
+
+    @property
+    def ready(self) -> bool:
+        return not self.inferred or self.skeletons is not None
+
+    def __init__(self, contexts: List[FrameContext], inferred: bool):
+        self.contexts = contexts
+        self.inferred = inferred
+        self.skeletons: List[np.ndarray] = None
+
 
 class VideoProcessor:
     """
     Класс обработчика видео.
     Функционал:
-    1) Чтение видеофайла.
+    1) Чтение одного или нескольких видеофайлов.
     2) Определение позы человека на видео.
     3) Определение, явялется ли поза искомой.
     4) Кадрирование человека в искомой позе.
     5) Отправка кадрированного изображения в БД.
     6) Стриминг изображения в отдельном потоке.
+    Кадры нескольких источников объединяются в один пакет для нейронной сети.
+    Сеть может запускаться не на каждом кадре, тогда позы переносятся на пропущенные кадры оптическим потоком.
     """
+    render_modes = ('full', 'auto', 'off')
 
-    @staticmethod
-    def _encode_image_to_jpg(img: np.ndarray) -> bytes:
-        """ Метод преобразует numpy-массив изображения в файл заданного расширения и возвращает строку байтов."""
-        ret, img_data = cv.imencode('.jpg', cv.cvtColor(img, cv.COLOR_RGB2BGR))
-        return img_data.tobytes()
-
-    @staticmethod
-    def get_bounding_boxes(skeletons: List[dict]) -> List[dict]:
-        bounding_boxes = []
-        for skeleton in skeletons:
-            x = [point[0] for point in skeleton.values()]
-            y = [point[1] for point in skeleton.values()]
-            bounding_box = {
-                'min_x': min(x),
-                'max_x': max(x),
-                'min_y': min(y),
-                'max_y': max(y),
-            }
-            bounding_boxes.append(bounding_box)
-        return bounding_boxes
-
-    @staticmethod
-    def _resize(img: np.ndarray, max_dim_px: int = 100):
-        factor = max_dim_px / max(img.shape)
-        return cv.resize(img, dsize=(0, 0), fx=factor, fy=factor)
-
-    @staticmethod
-    def _crop_person(img: np.ndarray, bounding_box: dict) -> np.ndarray:
-        min_x = bounding_box['min_x']
-        max_x = bounding_box['max_x']
-        min_y = bounding_box['min_y']
-        max_y = bounding_box['max_y']
-        return img[min_y: max_y, min_x: max_x]
-
-    def __init__(self, input_video_file: str, db_name: str, db_user: str, db_password: str,
-                 host: str = None, port: int = None, db_host: str = None, db_port: int = None):
-        self._input_video_file = input_video_file
-        self._video_reader = cv.VideoCapture(self._input_video_file)
-        self._cur_frame = 0
-        frame_shape = self._video_reader.read()[1].shape
-
-        self._pose_estimator = PoseEstimator(frame_shape)
-        self._pose_detector = SimpleRaisedArmsDetector()
-        self._skeleton_tracker = SkeletonTracker()
-        self._unique_detector = RaisingArmsMomentDetector()
-
-        self._db_handler = DBHandler(db_name, db_user, db_password, db_host, db_port)
-        self._streamer = Streamer(host, port, daemon=True)
-
-        self._db_handler.connect()
-        self._streamer.start()
-
-    def _draw_info(self, img: np.ndarray, skeletons_data: List[Person],
-                   poses_detected: List[bool], unique_poses: List[bool]) -> np.ndarray:
-        # Отобразить флаг измененения позы
-        for index, unique_pose_flag in enumerate(unique_poses):
-            if unique_pose_flag:
-                bbox = skeletons_data[index].bbox
-                img = cv.putText(img,
-                                 text=f'Unique {skeletons_data[index].index}',
-                                 org=(bbox['min_x'], bbox['min_y']),
-                                 fontFace=cv.FONT_HERSHEY_SIMPLEX, fontScale=1, color=0, thickness=2)
-        # Отобразить рамку вокруг человека и её центр
-        for index, (pose_detected_flag, skeleton_data) in enumerate(zip(poses_detected, skeletons_data)):
-            if pose_detected_flag:
-                color = (255, 0, 0)
-            else:
-                color = (0, 255, 0)
-            bbox = skeleton_data.bbox
-            bbox_center = (
-                bbox['min_x'] + int((bbox['max_x'] - bbox['min_x']) / 2),
-                bbox['min_y'] + int((bbox['max_y'] - bbox['min_y']) / 2),
-            )
-            img = cv.rectangle(img,
-                               pt1=(bbox['min_x'], bbox['min_y']),
-                               pt2=(bbox['max_x'], bbox['max_y']),
-                               color=color, thickness=2)
-            img = cv.circle(img,
-                            center=bbox_center,
-                            radius=3,
-                            color=color, thickness=2)
-            img = cv.putText(img,
-                             text=f'Object: {skeletons_data[index].index}',
-                             org=(bbox['max_x'], bbox['max_y']),
-                             fontFace=cv.FONT_HERSHEY_SIMPLEX, fontScale=0.5, color=0, thickness=2)
-        # Отобразить номер текущего кадра
-        img = cv.putText(img,
-                         text=f'Current frame: {self._cur_frame}',
-                         org=(0, 30),
-                         fontFace=cv.FONT_HERSHEY_SIMPLEX, fontScale=0.5, color=0, thickness=2)
-        return img
-
-    def _process_frame(self, img: np.ndarray) -> np.ndarray:
-        skeletons, _ = self._pose_estimator.process_image(img)
-        annotated_img = self._pose_estimator.draw_poses(img, skeletons)
-        annotated_skeletons = self._pose_estimator.annotate_skeletons(skeletons)
-        skeletons_bounding_boxes = self.get_bounding_boxes(annotated_skeletons)
-        self._skeleton_tracker.update(annotated_skeletons, skeletons_bounding_boxes)
-        skeletons_data = self._skeleton_tracker.track(annotated_skeletons, skeletons_bounding_boxes)
-        poses_detected = self._pose_detector.detect([skeleton_data.skeleton for skeleton_data in skeletons_data])
-        unique_poses = self._unique_detector.detect(skeletons_data, poses_detected)
-        for index, unique_pose_flag in enumerate(unique_poses):
-            if unique_pose_flag:
-                logging.debug(f'Raised arms were detected on skeleton: {index}!')
-                bbox = skeletons_data[index].bbox
-                cropped_person = self._resize(self._crop_person(annotated_img, bbox))
-                self._db_handler.insert_image(self._encode_image_to_jpg(cropped_person))
-        annotated_img = self._draw_info(annotated_img, skeletons_data, poses_detected, unique_poses)
-        return annotated_img
-
-    def _reload_video(self):
-        self._video_reader.release()
-        self._video_reader = cv.VideoCapture(self._input_video_file)
+    def __init__(self, input_video_file: Union[str, List[str]], db_name: str, db_user: str, db_password: str,
+                 host: str = None, port: int = None, db_host: str = None, db_port: int = None,
+                 num_infer_requests: int = 0, reader_queue_size: int = 4, reader_policy: str = 'all',
+                 inference_stride: int = 1, motion_threshold: float = 0, target_pose: str = 'raised_arms',
+                 db_queue_size: int = 256, db_batch_size: int = 32, db_flush_interval: float = 0.5,
+                 db_queue_policy: str = 'drop_oldest', blob_store_path: str = 'blob_store',
+                 stream_client_timeout: float = 5., stream_max_clients: int = 64, encode_workers: int = 2,
+                 jpeg_quality: int = 95, preview_scale: float = 0., preview_quality: int = None,
+                 render_mode: str = 'full', metrics_port: int = 9100, metrics_log_interval: float = 60.,
+                 decode_workers: int = 0):
+        """
+        input_video_file - видеофайл или список видеофайлов с одинаковым размером кадра.
+        Стример i-го источника слушает порт port + i.
+        num_infer_requests - число одновременно выполняемых запросов инференса.
+        При 0 инференс выполняется синхронно.
+        reader_queue_size - число заранее декодированных кадров каждого источника.
+        reader_policy - 'all' (обрабатывать каждый кадр) или 'latest' (отбрасывать устаревшие кадры).
+        inference_stride - сеть запускается каждые inference_stride кадров.
+        motion_threshold - порог движения в кадре (0-255), при превышении которого сеть запускается раньше, 0 - не учитывать.
+        target_pose - правило PoseRuleEngine, при первом срабатывании которого изображение человека сохраняется в БД.
+        db_queue_size, db_batch_size, db_flush_interval, db_queue_policy - параметры фоновой записи в БД (DBWriter).
+        blob_store_path - директория хранилища изображений людей, общая с веб-приложением.
+        stream_client_timeout - время (с), после которого клиент стримера, не принимающий кадр, отключается.
+        stream_max_clients - наибольшее число клиентов стримера каждого источника.
+        encode_workers, jpeg_quality, preview_scale, preview_quality - параметры кодирования кадров (FrameEncoder).
+        Кадры стримера кодируются в пуле и публикуются по порядку; изображения людей кодируются сразу.
+        render_mode - отрисовка поз и информации на кадрах стримера: 'full' - всегда на полном кадре,
+        'auto' - только при наличии клиентов стримера и на уменьшенной копии, если нужна только она,
+        'off' - без отрисовки (стример передает исходные кадры).
+        metrics_port - порт HTTP-сервера метрик в формате Prometheus (/metrics), 0 - не запускать.
+        metrics_log_interval - период вывода сводки метрик в лог, с (0 - не выводить).
+        decode_workers - число процессов декодирования поз (0 - декодирование в потоке обработки).
+        В асинхронном режиме декодирование идет параллельно с инференсом и обработкой следующих кадров.
+        """
+        input_video_files = [input_video_file] if isinstance(input_video_file, str) else list(input_video_file)
+        port = port or 80
+        # Кадры, удерживаемые обработкой: пакеты на инференсе и декодировании, текущий пакет,
+        # пропущенные кадры между ними и кадры на кодировании.
+        decode_slots = decode_workers * DecoderPool.slots_per_worker
+        reserve = (num_infer_requests + 1 + decode_slots) * max(inference_stride, 1) + encode_workers
+        self._sources = [VideoSource(video_file, Streamer(host, port + i, stream_client_timeout, stream_max_clients,
+                                                               daemon=True),
+                                     reader_queue_size, reader_policy, reserve)
+                         for i, video_file in enumerate(input_video_files)]
 
-    def run(self) -> None:
-        while True:
-            ret, frame_bgr = self._video_reader.read()
-            if not ret:
-                self._reload_video()
+        # Кадры источников объединяются в один пакет сети, а масштаб поз вычисляется по размеру кадра,
+        # поэтому размеры кадров всех источников должны совпадать.
+        frame_shapes = {source.input_video_file: source.frame_shape for source in self._sources}
+        if len(set(frame_shapes.values())) > 1:
+            raise ValueError(f'Video sources must have the same frame size: {frame_shapes}')
+        self._async_mode = num_infer_requests > 0
+        self._pose_estimator = PoseEstimator(self._sources[0].frame_shape, num_requests=max(num_infer_requests, 1),
+                                             batch_size=len(self._sources), decode_workers=decode_workers)
+        if render_mode not in self.render_modes:
+            raise ValueError(f'Unknown render mode: {render_mode}')
+        self._render_mode = render_mode
+        self._inference_scheduler = InferenceScheduler(inference_stride, motion_threshold)
+        self._pending_batches = deque()
+        self._frame_encoder = FrameEncoder(encode_workers, jpeg_quality, preview_scale, preview_quality)
+        self._detection_stage = DetectionStage(self._frame_encoder, target_pose)
+        # Кадры на кодировании: (источник, исходный кадр, Future с EncodedFrame)
+        self._pending_frames = deque()
+        self._max_pending_frames = encode_workers * len(self._sources)
+
+        db_handler = DBHandler(db_name, db_user, db_password, db_host, db_port, FileBlobStore(blob_store_path))
+        self._db_writer = DBWriter(db_handler,
+                                   db_queue_size, db_batch_size, db_flush_interval, db_queue_policy,
+                                   name='db_writer_thread', daemon=True)
+
+        self._metrics_log_interval = metrics_log_interval
+        self._metrics_logged_at = time.monotonic()
+        self._register_gauges()
+        if metrics_port:
+            MetricsExporter(pipeline_metrics, host or '', metrics_port, daemon=True).start()
+
+        self._db_writer.start()
+        for source in self._sources:
+            source.start()
+
+    def _register_gauges(self) -> None:
+        for source in self._sources:
+            labels = {'source': source.input_video_file}
+            reader, streamer = source.frame_reader, source.streamer
+            pipeline_metrics.add_gauge('reader_queue_depth', 'Decoded frames waiting for processing.',
+                                       lambda reader=reader: reader.queue_depth, labels)
+            pipeline_metrics.add_gauge('reader_frames_dropped', 'Frames dropped by the latest reader policy.',
+                                       lambda reader=reader: reader.frames_dropped, labels)
+            pipeline_metrics.add_gauge('stream_clients', 'Connected stream clients.',
+                                       lambda streamer=streamer: sum(streamer.consumers), labels)
+            pipeline_metrics.add_gauge('stream_clients_evicted', 'Slow stream clients evicted.',
+                                       lambda streamer=streamer: streamer.server.evicted_count
+                                       if streamer.server is not None else 0, labels)
+        pipeline_metrics.add_gauge('encode_pending', 'Frames waiting for JPEG encoding.',
+                                   lambda: len(self._pending_frames))
+        pipeline_metrics.add_gauge('db_queue_depth', 'Images waiting to be written to the database.',
+                                   lambda: self._db_writer.queue_depth)
+        pipeline_metrics.add_gauge('db_rows_written', 'Images written to the database.',
+                                   lambda: self._db_writer.rows_written)
+        pipeline_metrics.add_gauge('db_rows_dropped', 'Images dropped before reaching the database.',
+                                   lambda: self._db_writer.rows_dropped)
+
+    def _render_variant(self, source: VideoSource) -> Optional[str]:
+        """
+        Метод выбора варианта отрисовки кадра: 'full' - на полном кадре, 'preview' - на уменьшенной копии
+        (в режиме auto, если всем клиентам стримера нужна только она), None - без отрисовки.
+        """
+        if self._render_mode == 'full':
+            return 'full'
+        if self._render_mode == 'off':
+            return None
+        full_consumers, preview_consumers = source.streamer.consumers
+        if full_consumers or preview_consumers and not self._frame_encoder.preview_scale:
+            return 'full'
+        return 'preview' if preview_consumers else None
+
+    def _process_frame(self, source: VideoSource, img: np.ndarray, skeletons: np.ndarray,
+                       frame_index: int) -> Tuple[Optional[np.ndarray], bool]:
+        """
+        Метод обработки кадра. Возвращает изображение для стримера или None, если стримеру кадр не нужен,
+        и флаг того, что изображение - уменьшенная копия кадра.
+        """
+        detection = self._detection_stage.process(source.input_video_file, img, frame_index, skeletons,
+                                                  self._pose_estimator, source.skeleton_tracker,
+                                                  source.unique_detector)
+        for crop in detection.crops:
+            self._db_writer.put(crop)
+        render_variant = self._render_variant(source)
+        if render_variant is None:
+            return (img if self._render_mode == 'off' else None), False
+        scale = 1.
+        if render_variant == 'preview':
+            img, scale = self._frame_encoder.resize_to_preview(img), self._frame_encoder.preview_scale
+        with pipeline_metrics.timer('render'):
+            img = self._detection_stage.renderer.render(img, detection.skeletons, detection.persons,
+                                                        detection.poses_matched, detection.poses_detected,
+                                                        detection.unique_poses, frame_index, scale)
+        return img, render_variant == 'preview'
+
+    def _estimate_poses(self, batch: PendingBatch) -> None:
+        """
+        Метод определения поз на пакете кадров. Позы записываются в пакеты по мере готовности.
+        В асинхронном режиме пакеты готовы с задержкой в число запросов инференса, порядок сохраняется.
+        """
+        frames = [frame for _, _, frame in batch.contexts]
+        if self._async_mode:
+            results = self._pose_estimator.submit_batch(frames, context=batch)
+        else:
+            results = [(batch, self._pose_estimator.process_images(frames))]
+        for finished_batch, batch_results in results:
+            finished_batch.skeletons = [skeletons for skeletons, _ in batch_results]
+
+    def _process_batch(self, batch: PendingBatch) -> None:
+        batch_skeletons = batch.skeletons if batch.inferred else [None] * len(batch.contexts)
+        for (source, frame_index, frame), skeletons in zip(batch.contexts, batch_skeletons):
+            if not batch.inferred:
+                with pipeline_metrics.timer('propagate'):
+                    skeletons = source.pose_propagator.propagate(frame)
+            elif self._inference_scheduler.enabled:
+                source.pose_propagator.reset(frame, skeletons)
+            processed_image, preview_only = self._process_frame(source, frame, skeletons, frame_index)
+            if processed_image is None:
+                source.release(frame)
                 continue
-            self._cur_frame += 1
-            frame_rgb = cv.cvtColor(frame_bgr, cv.COLOR_BGR2RGB)
-            processed_image = self._process_frame(frame_rgb)
-            stream_frame = self._encode_image_to_jpg(processed_image)
+            # Изображение может быть нарисовано поверх кадра, поэтому кадр возвращается после кодирования.
+            self._pending_frames.append((source, frame, self._frame_encoder.submit(processed_image, preview_only)))
+            self._publish_frames()
+
+    def _publish_frames(self) -> None:
+        """Метод отправки закодированных кадров в стримеры в порядке обработки. Ждет кодирования при переполнении."""
+        while self._pending_frames and (self._pending_frames[0][2].done() or
+                                        len(self._pending_frames) > self._max_pending_frames):
+            source, frame, future = self._pending_frames.popleft()
+            with pipeline_metrics.timer('encode_wait'):
+                encoded_frame = future.result()
+            source.release(frame)
             try:
-                self._streamer.update(stream_frame)
+                source.streamer.update(encoded_frame.full, encoded_frame.preview)
             except TypeError:
                 logging.debug('Server is not ready yet.')
+
+    def _read_frames(self) -> Optional[List[FrameContext]]:
+        """Метод чтения кадра каждого источника. Возвращает None, если хотя бы один источник перестал выдавать кадры."""
+        contexts = []
+        for source in self._sources:
+            frame_data = source.read()
+            if frame_data is None:
+                logging.error(f'{source.input_video_file}: no more frames, video processing is stopped')
+                for context_source, _, frame in contexts:
+                    context_source.release(frame)
+                return None
+            contexts.append((source, *frame_data))
+        return contexts
+
+    def _drain(self) -> None:
+        """Метод обработки пакетов, оставшихся в работе после окончания чтения кадров."""
+        if self._async_mode:
+            for finished_batch, batch_results in self._pose_estimator.flush():
+                finished_batch.skeletons = [skeletons for skeletons, _ in batch_results]
+        while self._pending_batches:
+            self._process_batch(self._pending_batches.popleft())
+
+    def run(self) -> None:
+        """
+        Метод обработки видео. Работает, пока все источники выдают кадры; затем обрабатывает пакеты в работе
+        и ждет записи в БД изображений, поставленных в очередь.
+        """
+        try:
+            while True:
+                contexts = self._read_frames()
+                if contexts is None:
+                    break
+                need_inference = self._inference_scheduler.need_inference(
+                    [frame for _, _, frame in contexts], [source.pose_propagator for source in self._sources])
+                batch = PendingBatch(contexts, need_inference)
+                self._pending_batches.append(batch)
+                if batch.inferred:
+                    self._estimate_poses(batch)
+                # Пропущенные кадры обрабатываются после кадров, на которых они основаны.
+                while self._pending_batches and self._pending_batches[0].ready:
+                    self._process_batch(self._pending_batches.popleft())
+                self._log_metrics()
+            self._drain()
+        finally:
+            self._db_writer.stop()
+            self._db_writer.join()
+
+    def _log_metrics(self) -> None:
+        now = time.monotonic()
+        if self._metrics_log_interval and now - self._metrics_logged_at >= self._metrics_log_interval:
+            self._metrics_logged_at = now
+            logging.info(f'Pipeline metrics: {pipeline_metrics.summary()}')
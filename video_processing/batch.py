@@ -0,0 +1,68 @@
+"""
+Пакетная обработка записанных видеофайлов без стриминга и отрисовки.
+Каждый файл обрабатывается один раз от начала до конца, файлы распределяются по пулу процессов.
+События (изображения людей в искомой позе) записываются в файлы JSONL или Parquet (по файлу на видео)
+либо в БД, параметры которой берутся из .env.
+Пример: python3 -m batch archive/*.mp4 --output events --format jsonl --workers 4
+"""
+import argparse
+import logging
+import os
+import time
+from functools import partial
+
+from decouple import config
+
+from backend.batch_processor import process_files
+from backend.event_sinks import PARQUET_AVAILABLE, DBEventSink, JsonlEventSink, ParquetEventSink
+
+sink_formats = ('jsonl', 'parquet', 'db')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video_files', nargs='+', help='Видеофайлы')
+    parser.add_argument('--format', choices=sink_formats, default='jsonl', help='Приемник событий')
+    parser.add_argument('--output', default='events', help='Директория файлов событий (jsonl, parquet)')
+    parser.add_argument('--blob-store', default=config('BLOB_STORE_PATH', default=None),
+                        help='Директория хранилища изображений людей (для jsonl и parquet - необязательно)')
+    parser.add_argument('--workers', type=int, default=1, help='Число процессов')
+    parser.add_argument('--cpu-threads', type=int, default=0,
+                        help='Число потоков инференса в процессе (0 - ядра делятся между процессами поровну)')
+    parser.add_argument('--infer-requests', type=int, default=2, help='Число одновременных запросов инференса')
+    parser.add_argument('--batch-size', type=int, default=1, help='Число кадров в запросе инференса')
+    parser.add_argument('--decode-workers', type=int, default=0,
+                        help='Число процессов декодирования поз в каждом процессе (0 - без отдельных процессов)')
+    parser.add_argument('--target-pose', default=config('TARGET_POSE', default='raised_arms'))
+    parser.add_argument('--db-batch-size', type=int, default=256, help='Число событий в одной записи в БД')
+    args = parser.parse_args()
+
+    stream_ids = [os.path.splitext(os.path.basename(video_file))[0] for video_file in args.video_files]
+    if args.format != 'db' and len(set(stream_ids)) != len(stream_ids):
+        parser.error('Video files must have different names, events of each file are written to <name>.' +
+                     args.format)
+    if args.format == 'parquet' and not PARQUET_AVAILABLE:
+        parser.error('Parquet output requires the pyarrow package')
+    if args.format == 'db':
+        sink_factory = partial(DBEventSink, db_name=config('DB_NAME'), db_user=config('DB_USER'),
+                               db_password=config('DB_PASSWORD'), db_host=config('DB_HOST', default=None),
+                               db_port=config('DB_PORT', default=None, cast=lambda v: int(v) if v else None),
+                               blob_store_path=args.blob_store or 'blob_store', batch_size=args.db_batch_size)
+    else:
+        sink_class = JsonlEventSink if args.format == 'jsonl' else ParquetEventSink
+        sink_factory = partial(sink_class, output_dir=args.output, blob_store_path=args.blob_store)
+
+    start = time.perf_counter()
+    results = process_files(args.video_files, sink_factory, args.workers, num_infer_requests=args.infer_requests,
+                            batch_size=args.batch_size, cpu_threads=args.cpu_threads, target_pose=args.target_pose,
+                            decode_workers=args.decode_workers)
+    elapsed = time.perf_counter() - start
+    frames = sum(result.frames for result in results)
+    logging.info(f'Processed {len(results)} of {len(args.video_files)} files: {frames} frames, '
+                 f'{sum(result.events for result in results)} events, {elapsed:.1f} s ({frames / elapsed:.1f} fps)')
+    if len(results) < len(args.video_files):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
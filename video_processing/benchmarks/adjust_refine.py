@@ -0,0 +1,118 @@
+"""
+Микробенчмарк AssociativeEmbeddingDecoder.adjust и refine.
+Сравнивает векторизованную реализацию с исходной поэлементной и проверяет побитовое совпадение результатов.
+Запуск из директории video_processing: python3 -m benchmarks.adjust_refine
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from backend.pose_estimator.hpe_associative_embedding import AssociativeEmbeddingDecoder
+
+
+def reference_adjust(ans, heatmaps):
+    """Исходная реализация adjust."""
+    H, W = heatmaps.shape[-2:]
+    for batch_idx, people in enumerate(ans):
+        for person in people:
+            for k, joint in enumerate(person):
+                heatmap = heatmaps[batch_idx, k]
+                px = int(joint[0])
+                py = int(joint[1])
+                if 1 < px < W - 1 and 1 < py < H - 1:
+                    diff = np.array([
+                        heatmap[py, px + 1] - heatmap[py, px - 1],
+                        heatmap[py + 1, px] - heatmap[py - 1, px]
+                    ])
+                    joint[:2] += np.sign(diff) * .25
+    return ans
+
+
+def reference_refine(heatmap, tag, keypoints, pose_tag=None):
+    """Исходная реализация refine для одной позы."""
+    K, H, W = heatmap.shape
+    if len(tag.shape) == 3:
+        tag = tag[..., None]
+
+    if pose_tag is not None:
+        prev_tag = pose_tag
+    else:
+        tags = []
+        for i in range(K):
+            if keypoints[i, 2] > 0:
+                x, y = keypoints[i][:2].astype(int)
+                tags.append(tag[i, y, x])
+        prev_tag = np.mean(tags, axis=0)
+
+    for i, (_heatmap, _tag) in enumerate(zip(heatmap, tag)):
+        if keypoints[i, 2] > 0:
+            continue
+        diff = np.abs(_tag[..., 0] - prev_tag) + 0.5
+        diff = diff.astype(np.int32).astype(_heatmap.dtype)
+        diff -= _heatmap
+        idx = diff.argmin()
+        y, x = np.divmod(idx, _heatmap.shape[-1])
+        val = _heatmap[y, x]
+        if val > 0:
+            keypoints[i, :3] = x, y, val
+            if 1 < x < W - 1 and 1 < y < H - 1:
+                diff = np.array([
+                    _heatmap[y, x + 1] - _heatmap[y, x - 1],
+                    _heatmap[y + 1, x] - _heatmap[y - 1, x]
+                ])
+                keypoints[i, :2] += np.sign(diff) * .25
+    return keypoints
+
+
+def make_inputs(num_people: int, num_joints: int, height: int, width: int, missing_ratio: float, seed: int):
+    """Синтетические выходы сети и сгруппированные позы (батч из одного кадра)."""
+    rng = np.random.default_rng(seed)
+    heatmaps = np.abs(rng.standard_normal((1, num_joints, height, width)).astype(np.float32)) * 0.1
+    tags = rng.normal(0, 3, (1, num_joints, height, width, 1)).astype(np.float32)
+    poses = np.zeros((num_people, num_joints, 4), dtype=np.float32)
+    poses[..., 0] = rng.integers(0, width, (num_people, num_joints))
+    poses[..., 1] = rng.integers(0, height, (num_people, num_joints))
+    poses[..., 2] = rng.uniform(0.1, 1, (num_people, num_joints))
+    poses[..., 3] = rng.normal(0, 3, (num_people, num_joints))
+    poses[rng.uniform(size=(num_people, num_joints)) < missing_ratio] = 0
+    poses_tags = rng.normal(0, 3, (num_people, 1)).astype(np.float32)
+    return heatmaps, tags, poses, poses_tags
+
+
+def run_reference(heatmaps, tags, poses, poses_tags):
+    ans = reference_adjust([np.copy(poses)], heatmaps)[0]
+    for i, pose in enumerate(ans):
+        ans[i] = reference_refine(heatmaps[0], tags[0], pose, poses_tags[i])
+    return ans
+
+
+def run_vectorized(heatmaps, tags, poses, poses_tags):
+    ans = AssociativeEmbeddingDecoder.adjust([np.copy(poses)], heatmaps)[0]
+    return AssociativeEmbeddingDecoder.refine(heatmaps[0], tags[0], ans, poses_tags)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--people', type=int, nargs='+', default=[1, 5, 10, 30])
+    parser.add_argument('--joints', type=int, default=17)
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=448)
+    parser.add_argument('--missing', type=float, default=0.3, help='Доля отсутствующих суставов')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{"people":>6} {"reference, ms":>14} {"vectorized, ms":>15} {"speedup":>8}')
+    for num_people in args.people:
+        inputs = make_inputs(num_people, args.joints, args.height, args.width, args.missing, seed=num_people)
+        reference = run_reference(*inputs)
+        vectorized = run_vectorized(*inputs)
+        if not np.array_equal(reference, vectorized):
+            raise AssertionError(f'Results differ for {num_people} people')
+        t_ref = timeit.timeit(lambda: run_reference(*inputs), number=args.repeat) / args.repeat * 1e3
+        t_vec = timeit.timeit(lambda: run_vectorized(*inputs), number=args.repeat) / args.repeat * 1e3
+        print(f'{num_people:>6} {t_ref:>14.2f} {t_vec:>15.2f} {t_ref / t_vec:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
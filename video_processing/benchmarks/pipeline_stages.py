@@ -0,0 +1,237 @@
+"""
+Офлайн-бенчмарк этапов конвейера без нейронной сети: декодирование поз (AssociativeEmbeddingDecoder),
+трекинг (SkeletonTracker), правила поз и детектор момента (PoseRuleEngine, RaisingArmsMomentDetector),
+отрисовка (OverlayRenderer) и кодирование JPEG (FrameEncoder). Для каждого этапа выводятся пропускная
+способность и задержка p50/p95/p99.
+Входы декодера - синтетические сцены с заданным числом людей, которые ходят и поднимают руки
+(выходы сети строятся из их поз), или выходы сети, записанные с реального видео (--recording).
+Запись выходов (нужны IR модели и OpenVINO): python3 -m benchmarks.pipeline_stages --record video.mp4 outputs_dir
+Запуск из директории video_processing: python3 -m benchmarks.pipeline_stages --people 1 10 30
+"""
+import argparse
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from backend.detectors import RaisingArmsMomentDetector
+from backend.frame_encoder import FrameEncoder
+from backend.metrics import QUANTILES
+from backend.overlay_renderer import OverlayRenderer
+from backend.pose_estimator.hpe_associative_embedding import HpeAssociativeEmbedding
+from backend.pose_estimator.skeletons import Skeletons
+from backend.pose_rules import PoseRuleEngine
+from backend.trackers import SkeletonTracker
+
+# Выходы сети, сохраняемые в <имя>.npy: массивы по всем записанным кадрам
+_output_names = ('heatmaps', 'nms_heatmaps', 'embeddings')
+# Размер кадра записи (высота, ширина)
+_frame_shape_file = 'frame_shape.npy'
+
+# Поза стоящего человека ростом 1 с центром в начале координат, порядок точек PoseEstimator.point_names
+_standing_pose = np.array([
+    (0, -0.45), (-0.03, -0.47), (0.03, -0.47), (-0.06, -0.45), (0.06, -0.45),
+    (-0.12, -0.3), (0.12, -0.3), (-0.18, -0.12), (0.18, -0.12), (-0.2, 0.02), (0.2, 0.02),
+    (-0.08, 0.05), (0.08, 0.05), (-0.09, 0.28), (0.09, 0.28), (-0.09, 0.5), (0.09, 0.5),
+], dtype=np.float32)
+# Положение локтей и запястий с поднятыми руками
+_raised_arms = {7: (-0.2, -0.5), 8: (0.2, -0.5), 9: (-0.22, -0.7), 10: (0.22, -0.7)}
+# Размер окрестности точки на тепловой карте и ширина гауссианы, пикселей карты
+_blob_radius = 3
+_blob_sigma = 1.5
+
+
+def synthetic_scene(num_people: int, num_frames: int, frame_size: Tuple[int, int], seed: int) -> List[np.ndarray]:
+    """
+    Синтетическая сцена: люди разного роста идут с постоянной скоростью, отражаясь от краев кадра,
+    и время от времени поднимают руки. Возвращает позы N x 17 x 3 (x, y, уверенность) для каждого кадра.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = frame_size
+    heights = rng.uniform(0.15, 0.45, num_people) * height
+    centers = rng.uniform((0.1 * width, 0.3 * height), (0.9 * width, 0.7 * height), (num_people, 2))
+    velocities = rng.normal(0, 0.004 * width, (num_people, 2))
+    raise_periods = rng.integers(20, 80, num_people)
+    raised_pose = _standing_pose.copy()
+    for joint, point in _raised_arms.items():
+        raised_pose[joint] = point
+    scene = []
+    for frame_index in range(num_frames):
+        centers += velocities
+        out_of_frame = (centers < 0) | (centers > (width, height))
+        velocities[out_of_frame] *= -1
+        raised = (frame_index // raise_periods) % 2 == 1
+        templates = np.where(raised[:, None, None], raised_pose, _standing_pose)
+        poses = np.empty((num_people, len(_standing_pose), 3), dtype=np.float32)
+        poses[..., :2] = templates * heights[:, None, None] + centers[:, None] + rng.normal(0, 2, templates.shape)
+        poses[..., 2] = rng.uniform(0.3, 1, (num_people, len(_standing_pose)))
+        scene.append(poses)
+    return scene
+
+
+def synthetic_outputs(poses: np.ndarray, output_size: Tuple[int, int],
+                      scale: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Выходы сети для поз кадра: тепловые карты с гауссианами в точках, карты после NMS 3x3
+    и эмбеддинги, в окрестности точек равные метке человека (метки людей отличаются на 2).
+    scale - отношение размера кадра к размеру карт.
+    """
+    width, height = output_size
+    num_joints = poses.shape[1]
+    heatmaps = np.zeros((num_joints, height, width), dtype=np.float32)
+    embeddings = np.random.default_rng(0).normal(0, 0.3, (num_joints, height, width, 1)).astype(np.float32)
+    offsets = np.arange(-_blob_radius, _blob_radius + 1)
+    blob = np.exp(-(offsets[:, None] ** 2 + offsets[None, :] ** 2) / (2 * _blob_sigma ** 2)).astype(np.float32)
+    for person_index, pose in enumerate(poses):
+        for joint, (x, y, score) in enumerate(pose):
+            x, y = int(x / scale), int(y / scale)
+            if not (_blob_radius <= x < width - _blob_radius and _blob_radius <= y < height - _blob_radius):
+                continue
+            region = np.s_[joint, y - _blob_radius: y + _blob_radius + 1, x - _blob_radius: x + _blob_radius + 1]
+            np.maximum(heatmaps[region], blob * score, out=heatmaps[region])
+            embeddings[region] = 2 * person_index
+    nms_heatmaps = np.stack([np.where(heatmap == cv.dilate(heatmap, None), heatmap, 0) for heatmap in heatmaps])
+    return heatmaps, nms_heatmaps, embeddings
+
+
+def record_outputs(video_file: str, output_dir: str, num_frames: int) -> None:
+    """Запись выходов сети на первых num_frames кадрах видео (нужна IR модели)."""
+    from backend.pose_estimator import PoseEstimator
+
+    reader = cv.VideoCapture(video_file)
+    ret, frame = reader.read()
+    if not ret:
+        raise RuntimeError(f'Failed to read video: {video_file}')
+    frame_shape = frame.shape
+    pose_estimator = PoseEstimator(frame_shape)
+    recorded = {name: [] for name in _output_names}
+    for _ in range(num_frames):
+        for name, output in pose_estimator.infer_outputs([frame]).items():
+            recorded[name].append(output[0])
+        ret, frame = reader.read()
+        if not ret:
+            break
+    reader.release()
+    os.makedirs(output_dir, exist_ok=True)
+    for name, outputs in recorded.items():
+        np.save(os.path.join(output_dir, f'{name}.npy'), np.stack(outputs))
+    np.save(os.path.join(output_dir, _frame_shape_file), np.array(frame_shape[:2]))
+    print(f'Recorded {len(recorded["heatmaps"])} frames to {output_dir}')
+
+
+def load_outputs(recording_dir: str) -> Tuple[List[Tuple[np.ndarray, ...]], Tuple[int, int]]:
+    """Загрузка записанных выходов сети. Возвращает выходы по кадрам и размер кадра (ширина, высота)."""
+    outputs = [np.load(os.path.join(recording_dir, f'{name}.npy')) for name in _output_names]
+    height, width = np.load(os.path.join(recording_dir, _frame_shape_file))
+    return list(zip(*outputs)), (int(width), int(height))
+
+
+def measure(function: Callable, *args) -> float:
+    """Длительность вызова function(*args), с."""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run_stages(frame_outputs: List[Tuple[np.ndarray, ...]], frame_size: Tuple[int, int],
+               quality: int) -> Tuple[Dict[str, np.ndarray], float]:
+    """
+    Прогон этапов по кадрам: позы, полученные декодером, передаются следующим этапам, как в VideoProcessor.
+    Возвращает длительности вызовов каждого этапа и среднее число найденных людей в кадре.
+    """
+    width, height = frame_size
+    num_frames = len(frame_outputs)
+    scale = height / frame_outputs[0][0].shape[-2]
+    decoder = HpeAssociativeEmbedding.create_decoder(frame_outputs[0][0].shape[0], prob_threshold=0.1, delta=0.5)
+    rules = PoseRuleEngine()
+    target_pose = rules.rule_names.index('raised_arms')
+    tracker = SkeletonTracker()
+    detector = RaisingArmsMomentDetector()
+    renderer = OverlayRenderer(rules.rule_names)
+    encoder = FrameEncoder(num_workers=0, quality=quality)
+    # Фон с плавными переходами сжимается в JPEG ближе к реальному кадру, чем шум или однотонная заливка.
+    noise = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    background = cv.GaussianBlur(noise, (0, 0), 3)
+    frame = np.empty_like(background)
+    durations = {stage: np.empty(num_frames) for stage in ('decoder', 'tracking', 'rules', 'render', 'encode')}
+    people = 0
+    results = {}
+
+    def decode(heatmaps, nms_heatmaps, embeddings):
+        results['poses'] = decoder.decode_batch(heatmaps, embeddings, nms_heatmaps=nms_heatmaps)[0][0]
+
+    def track(skeletons):
+        results['persons'] = tracker.track(skeletons, skeletons.bounding_boxes())
+
+    def detect(skeletons, persons):
+        results['matched'] = rules.evaluate(skeletons)
+        results['unique'] = detector.detect(persons, results['matched'][:, target_pose])
+
+    for frame_index, outputs in enumerate(frame_outputs):
+        # Декодер изменяет тепловые карты на месте, поэтому ему передаются копии.
+        heatmaps, nms_heatmaps, embeddings = (output[None].copy() for output in outputs)
+        durations['decoder'][frame_index] = measure(decode, heatmaps, nms_heatmaps, embeddings)
+        poses = results['poses']
+        points = np.empty((*poses.shape[:2], 3), dtype=np.float32)
+        points[..., :2] = (poses[..., :2] * scale).astype(np.int32)
+        points[..., 2] = poses[..., 2]
+        skeletons = Skeletons(points, poses[..., 2] > 0.1)
+        people += len(skeletons)
+        durations['tracking'][frame_index] = measure(track, skeletons)
+        durations['rules'][frame_index] = measure(detect, skeletons, results['persons'])
+        np.copyto(frame, background)
+        durations['render'][frame_index] = measure(
+            renderer.render, frame, skeletons, results['persons'], results['matched'],
+            results['matched'][:, target_pose], results['unique'], frame_index)
+        durations['encode'][frame_index] = measure(encoder.encode, frame)
+    return durations, people / num_frames
+
+
+def print_durations(title: str, durations: Dict[str, np.ndarray]) -> None:
+    print(title)
+    print(f'{"stage":>10} {"calls/s":>9} ' + ' '.join(f'{f"p{round(q * 100)}, ms":>9}' for q in QUANTILES))
+    for stage, values in durations.items():
+        quantiles = ' '.join(f'{value * 1e3:>9.2f}' for value in np.quantile(values, QUANTILES))
+        print(f'{stage:>10} {len(values) / values.sum():>9.0f} {quantiles}')
+
+
+def parse_size(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--people', type=int, nargs='+', default=[1, 5, 10, 30], help='Число людей в сценах')
+    parser.add_argument('--frames', type=int, default=100, help='Число кадров сцены')
+    parser.add_argument('--frame-size', type=parse_size, default=(1920, 1080), help='Размер кадра, ШxВ')
+    parser.add_argument('--output-size', type=parse_size, default=(464, 256),
+                        help='Размер выходов сети, ШxВ (higher-hrnet для 1080p: 464x256)')
+    parser.add_argument('--quality', type=int, default=95, help='Качество JPEG')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--recording', help='Директория с записанными выходами сети вместо синтетических сцен')
+    parser.add_argument('--record', nargs=2, metavar=('VIDEO', 'OUTPUT_DIR'), help='Записать выходы сети и выйти')
+    args = parser.parse_args()
+
+    if args.record:
+        record_outputs(*args.record, num_frames=args.frames)
+        return
+    if args.recording:
+        frame_outputs, frame_size = load_outputs(args.recording)
+        durations, people = run_stages(frame_outputs, frame_size, args.quality)
+        print_durations(f'Recording {args.recording}: {len(frame_outputs)} frames, '
+                        f'{frame_size[0]}x{frame_size[1]}, {people:.1f} people found per frame', durations)
+        return
+    scale = args.frame_size[1] / args.output_size[1]
+    for num_people in args.people:
+        scene = synthetic_scene(num_people, args.frames, args.frame_size, args.seed + num_people)
+        frame_outputs = [synthetic_outputs(poses, args.output_size, scale) for poses in scene]
+        durations, people = run_stages(frame_outputs, args.frame_size, args.quality)
+        print_durations(f'Synthetic scene: {num_people} people, {args.frames} frames, '
+                        f'{args.frame_size[0]}x{args.frame_size[1]}, {people:.1f} people found per frame', durations)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,36 @@
-from decouple import config
+from decouple import Csv, config
 
 from backend.videoprocessor import VideoProcessor
 
 if __name__ == "__main__":
-    video_processor = VideoProcessor(input_video_file=config('INPUT'),
+    video_processor = VideoProcessor(input_video_file=config('INPUT', cast=Csv()),
                                      host=config('HOST'),
                                      port=config('PORT', cast=int),
                                      db_name=config('DB_NAME'),
                                      db_user=config('DB_USER'),
                                      db_password=config('DB_PASSWORD'),
                                      db_host=config('DB_HOST'),
-                                     db_port=config('DB_PORT', cast=int))
+                                     db_port=config('DB_PORT', cast=int),
+                                     num_infer_requests=config('NUM_INFER_REQUESTS', default=0, cast=int),
+                                     reader_queue_size=config('READER_QUEUE_SIZE', default=4, cast=int),
+                                     reader_policy=config('READER_POLICY', default='all'),
+                                     inference_stride=config('INFERENCE_STRIDE', default=1, cast=int),
+                                     motion_threshold=config('MOTION_THRESHOLD', default=0, cast=float),
+                                     target_pose=config('TARGET_POSE', default='raised_arms'),
+                                     db_queue_size=config('DB_QUEUE_SIZE', default=256, cast=int),
+                                     db_batch_size=config('DB_BATCH_SIZE', default=32, cast=int),
+                                     db_flush_interval=config('DB_FLUSH_INTERVAL', default=0.5, cast=float),
+                                     db_queue_policy=config('DB_QUEUE_POLICY', default='drop_oldest'),
+                                     blob_store_path=config('BLOB_STORE_PATH', default='blob_store'),
+                                     stream_client_timeout=config('STREAM_CLIENT_TIMEOUT', default=5., cast=float),
+                                     stream_max_clients=config('STREAM_MAX_CLIENTS', default=64, cast=int),
+                                     encode_workers=config('ENCODE_WORKERS', default=2, cast=int),
+                                     jpeg_quality=config('JPEG_QUALITY', default=95, cast=int),
+                                     preview_scale=config('PREVIEW_SCALE', default=0., cast=float),
+                                     preview_quality=config('PREVIEW_QUALITY', default=None,
+                                                            cast=lambda v: int(v) if v else None),
+                                     render_mode=config('RENDER_MODE', default='full'),
+                                     metrics_port=config('METRICS_PORT', default=9100, cast=int),
+                                     metrics_log_interval=config('METRICS_LOG_INTERVAL', default=60., cast=float),
+                                     decode_workers=config('DECODE_WORKERS', default=0, cast=int))
     video_processor.run()
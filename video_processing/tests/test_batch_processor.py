@@ -0,0 +1,31 @@
+"""
+Тесты пакетной обработки без нейронной сети: BatchProcessor заменяется поддельным.
+Запуск из директории video_processing: python3 -m unittest discover tests
+"""
+import unittest
+from unittest import mock
+
+from backend.batch_processor import BatchResult, process_files
+
+
+class FakeBatchProcessor:
+    def __init__(self, sink_factory, **kwargs):
+        pass
+
+    def process(self, video_file: str) -> BatchResult:
+        if video_file.startswith('broken'):
+            raise RuntimeError(f'Failed to open {video_file}')
+        return BatchResult(video_file, 10, 1, 1.)
+
+
+class ProcessFilesTest(unittest.TestCase):
+    @mock.patch('backend.batch_processor.BatchProcessor', FakeBatchProcessor)
+    def test_results_by_position(self):
+        # Файлы с одинаковыми именами (например, из разных директорий при записи в БД) учитываются отдельно.
+        video_files = ['a.mp4', 'broken.mp4', 'a.mp4', 'b.mp4']
+        results = process_files(video_files, sink_factory=None)
+        self.assertEqual([result.video_file for result in results], ['a.mp4', 'a.mp4', 'b.mp4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
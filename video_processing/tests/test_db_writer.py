@@ -0,0 +1,128 @@
+"""
+Тесты DBWriter с поддельным обработчиком БД.
+Запуск из директории video_processing: python3 -m unittest discover tests
+"""
+import threading
+import time
+import unittest
+from typing import List
+
+import psycopg2
+
+from backend.database_handler.db_writer import DBWriter
+
+
+class FakeDBHandler:
+    """Обработчик БД, запоминающий записанные пакеты. Первые connect_failures подключений и insert_failures записей
+    завершаются ошибкой соединения."""
+
+    def __init__(self, connect_failures: int = 0, insert_failures: int = 0):
+        self.connect_failures = connect_failures
+        self.insert_failures = insert_failures
+        self.connects = 0
+        self.batches: List[list] = []
+        self.written = threading.Event()
+
+    def connect(self) -> None:
+        self.connects += 1
+        if self.connect_failures:
+            self.connect_failures -= 1
+            raise psycopg2.OperationalError('connection refused')
+
+    def disconnect(self) -> None:
+        pass
+
+    def insert_images(self, crops: list) -> None:
+        if self.insert_failures:
+            self.insert_failures -= 1
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.batches.append(list(crops))
+        self.written.set()
+
+
+class DBWriterTest(unittest.TestCase):
+    def make_writer(self, db_handler: FakeDBHandler, **kwargs) -> DBWriter:
+        writer = DBWriter(db_handler, **kwargs, retry_interval=0.01, daemon=True)
+        self.addCleanup(self.stop, writer)
+        return writer
+
+    @staticmethod
+    def stop(writer: DBWriter) -> None:
+        writer.stop()
+        if writer.is_alive():
+            writer.join(timeout=5.)
+
+    def test_batch_size(self):
+        db_handler = FakeDBHandler()
+        writer = self.make_writer(db_handler, batch_size=3, flush_interval=10.)
+        for crop in range(7):
+            writer.put(crop)
+        writer.start()
+        self.stop(writer)
+        self.assertEqual(db_handler.batches, [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(writer.rows_written, 7)
+
+    def test_flush_interval(self):
+        db_handler = FakeDBHandler()
+        writer = self.make_writer(db_handler, batch_size=100, flush_interval=0.05)
+        writer.start()
+        writer.put(0)
+        writer.put(1)
+        # Пакет не набран, но записывается по истечении flush_interval, без остановки потока.
+        self.assertTrue(db_handler.written.wait(timeout=5.))
+        self.assertEqual(db_handler.batches, [[0, 1]])
+
+    def test_reconnect(self):
+        db_handler = FakeDBHandler(connect_failures=2, insert_failures=2)
+        writer = self.make_writer(db_handler, batch_size=2, flush_interval=0.)
+        writer.start()
+        writer.put(0)
+        writer.put(1)
+        self.assertTrue(db_handler.written.wait(timeout=5.))
+        self.assertEqual(db_handler.batches, [[0, 1]])
+        self.assertEqual(db_handler.connects, 3)
+        self.assertEqual(writer.rows_dropped, 0)
+
+    def test_block(self):
+        db_handler = FakeDBHandler()
+        writer = self.make_writer(db_handler, queue_size=2, batch_size=3, flush_interval=0., policy='block')
+        writer.put(0)
+        writer.put(1)
+        put = threading.Thread(target=writer.put, args=(2,), daemon=True)
+        put.start()
+        time.sleep(0.05)
+        self.assertTrue(put.is_alive())
+        self.assertEqual(writer.queue_depth, 2)
+        # Поток записи освобождает очередь, и ожидающее изображение попадает в нее.
+        writer.start()
+        put.join(timeout=5.)
+        self.assertFalse(put.is_alive())
+        self.stop(writer)
+        self.assertEqual(sum(db_handler.batches, []), [0, 1, 2])
+        self.assertEqual(writer.rows_dropped, 0)
+
+    def test_drop_oldest(self):
+        db_handler = FakeDBHandler()
+        writer = self.make_writer(db_handler, queue_size=2, batch_size=3, policy='drop_oldest')
+        self.assertTrue(all(writer.put(crop) for crop in range(4)))
+        self.assertEqual(writer.rows_dropped, 2)
+        writer.start()
+        self.stop(writer)
+        self.assertEqual(db_handler.batches, [[2, 3]])
+
+    def test_drop_newest(self):
+        db_handler = FakeDBHandler()
+        writer = self.make_writer(db_handler, queue_size=2, batch_size=3, policy='drop_newest')
+        self.assertEqual([writer.put(crop) for crop in range(4)], [True, True, False, False])
+        self.assertEqual(writer.rows_dropped, 2)
+        writer.start()
+        self.stop(writer)
+        self.assertEqual(db_handler.batches, [[0, 1]])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            DBWriter(FakeDBHandler(), policy='drop_all')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Тесты PoseRuleEngine.
+Запуск из директории video_processing: python3 -m unittest discover tests
+"""
+import unittest
+
+import numpy as np
+
+from backend.pose_estimator import Joint, Skeletons
+from backend.pose_rules import DEFAULT_RULES, PoseRuleEngine
+
+# Стоящий человек с опущенными руками, начало координат - левый верхний угол
+STANDING = {
+    Joint.NOSE: (50, 10), Joint.LEFT_EYE: (53, 8), Joint.RIGHT_EYE: (47, 8), Joint.LEFT_EAR: (56, 10),
+    Joint.RIGHT_EAR: (44, 10), Joint.LEFT_SHOULDER: (60, 30), Joint.RIGHT_SHOULDER: (40, 30),
+    Joint.LEFT_ELBOW: (65, 45), Joint.RIGHT_ELBOW: (35, 45), Joint.LEFT_WRIST: (65, 60), Joint.RIGHT_WRIST: (35, 60),
+    Joint.LEFT_HIP: (55, 60), Joint.RIGHT_HIP: (45, 60), Joint.LEFT_KNEE: (55, 80), Joint.RIGHT_KNEE: (45, 80),
+    Joint.LEFT_HEEL: (55, 100), Joint.RIGHT_HEEL: (45, 100),
+}
+# Поднятые руки: локоть выше плеча, кисть выше локтя
+RAISED = {
+    'LEFT': {Joint.LEFT_ELBOW: (65, 20), Joint.LEFT_WRIST: (65, 5)},
+    'RIGHT': {Joint.RIGHT_ELBOW: (35, 20), Joint.RIGHT_WRIST: (35, 5)},
+}
+
+
+def make_skeletons(*poses: dict, hidden: tuple = ()) -> Skeletons:
+    points = np.ones((len(poses), len(Joint), 3), dtype=np.float32)
+    for index, pose in enumerate(poses):
+        for joint, xy in {**STANDING, **pose}.items():
+            points[index, joint, :2] = xy
+    visible = np.ones((len(poses), len(Joint)), dtype=bool)
+    visible[:, list(hidden)] = False
+    return Skeletons(points, visible)
+
+
+def reference_raised_arms(skeletons: Skeletons) -> np.ndarray:
+    """Условие удаленного SimpleRaisedArmsDetector: обе руки видны, кисть выше локтя, локоть выше плеча."""
+    joints = np.array(((Joint.RIGHT_WRIST, Joint.RIGHT_ELBOW, Joint.RIGHT_SHOULDER),
+                       (Joint.LEFT_WRIST, Joint.LEFT_ELBOW, Joint.LEFT_SHOULDER)))
+    y = skeletons.xy[:, joints, 1]
+    wrist_y, elbow_y, shoulder_y = y[..., 0], y[..., 1], y[..., 2]
+    arms_raised = (wrist_y < elbow_y) & (elbow_y < shoulder_y) & skeletons.visible[:, joints].all(axis=2)
+    return arms_raised.all(axis=1)
+
+
+class PoseRuleEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = PoseRuleEngine()
+
+    def detect(self, skeletons: Skeletons, rule_name: str) -> list:
+        return self.engine.detect(skeletons, rule_name).tolist()
+
+    def test_raised_arms_matches_reference(self):
+        rng = np.random.default_rng(0)
+        num_people = 5000
+        points = np.concatenate([rng.integers(0, 50, (num_people, len(Joint), 2)),
+                                 rng.random((num_people, len(Joint), 1))], axis=2).astype(np.float32)
+        skeletons = Skeletons(points, rng.random((num_people, len(Joint))) < 0.9)
+        expected = reference_raised_arms(skeletons)
+        # Выборка должна содержать оба исхода, иначе совпадение ничего не проверяет.
+        self.assertTrue(expected.any() and not expected.all())
+        np.testing.assert_array_equal(self.engine.detect(skeletons, 'raised_arms'), expected)
+
+    def test_empty(self):
+        flags = self.engine.evaluate(Skeletons.empty(len(Joint)))
+        self.assertEqual(flags.shape, (0, len(DEFAULT_RULES)))
+        self.assertEqual(flags.dtype, bool)
+
+    def test_rules(self):
+        skeletons = make_skeletons({}, {**RAISED['LEFT'], **RAISED['RIGHT']}, RAISED['LEFT'])
+        self.assertEqual(self.detect(skeletons, 'raised_arms'), [False, True, False])
+        self.assertEqual(self.detect(skeletons, 'one_arm_raised'), [False, False, True])
+        self.assertEqual(self.engine.evaluate(skeletons).shape, (3, len(DEFAULT_RULES)))
+
+    def test_visibility(self):
+        raised = {**RAISED['LEFT'], **RAISED['RIGHT']}
+        # Условие на невидимой точке не выполняется, невидимые точки вне условий правила не влияют.
+        self.assertEqual(self.detect(make_skeletons(raised, hidden=(Joint.RIGHT_WRIST,)), 'raised_arms'), [False])
+        self.assertEqual(self.detect(make_skeletons(raised, hidden=(Joint.LEFT_HEEL, Joint.NOSE)), 'raised_arms'),
+                         [True])
+        # Опущенная рука тоже должна быть видна.
+        self.assertEqual(self.detect(make_skeletons(RAISED['LEFT'], hidden=(Joint.RIGHT_WRIST,)), 'one_arm_raised'),
+                         [False])
+        # Точка-середина (плечи, бедра) вычислима, только если видны все ее суставы.
+        lying = {joint: (y, x) for joint, (x, y) in STANDING.items()}
+        self.assertEqual(self.detect(make_skeletons(lying), 'fall'), [True])
+        self.assertEqual(self.detect(make_skeletons(lying, hidden=(Joint.LEFT_HIP,)), 'fall'), [False])
+        self.assertEqual(self.detect(make_skeletons({}), 'fall'), [False])
+
+
+if __name__ == '__main__':
+    unittest.main()
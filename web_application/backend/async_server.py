@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import re
+from typing import Optional
+
+from .frame_broadcaster import FrameBroadcaster
+from .gallery_cache import GalleryCache
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class AsyncStreamServer:
+    """
+    HTTP-сервер на asyncio для /video_feed и /db/<int:event_id>.
+    Все зрители обслуживаются корутинами в одном потоке: зритель ждет новый кадр, не занимая поток,
+    а следующий кадр пишется только после отправки предыдущего, поэтому память на зрителя ограничена
+    одним кадром и медленные зрители пропускают промежуточные кадры.
+    Кадры приходят из FrameBroadcaster: о каждом кадре цикл событий уведомляется один раз, независимо от
+    числа зрителей. Изображения галереи берутся из GalleryCache без обращений к БД.
+    """
+    _db_path = re.compile(r'/db/(\d+)')
+    _stream_headers = (b'HTTP/1.1 200 OK\r\n'
+                       b'Content-Type: multipart/x-mixed-replace; boundary=frame\r\n'
+                       b'Cache-Control: no-cache\r\n'
+                       b'Connection: close\r\n\r\n')
+    # Предельное время чтения заголовков запроса, с
+    _request_timeout = 10.
+
+    @property
+    def clients_count(self) -> int:
+        return self._clients_count
+
+    def __init__(self, frame_broadcaster: FrameBroadcaster, gallery_cache: GalleryCache, host: str, port: int,
+                 max_clients: int = 1000):
+        self._frame_broadcaster = frame_broadcaster
+        self._gallery_cache = gallery_cache
+        self._host = host
+        self._port = port
+        self._max_clients = max_clients
+        self._clients_count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._new_frame: Optional[asyncio.Event] = None
+        self._frame_index = 0
+        self._frame_part = b''
+
+    def _publish_frame(self, frame_index: int, frame_part: bytes) -> None:
+        """Вызывается в цикле событий: запоминает кадр и будит всех ожидающих зрителей."""
+        self._frame_index, self._frame_part = frame_index, frame_part
+        self._new_frame.set()
+        self._new_frame = asyncio.Event()
+
+    def _on_frame(self, frame_index: int, frame_part: bytes) -> None:
+        """Вызывается в потоке FrameBroadcaster."""
+        self._loop.call_soon_threadsafe(self._publish_frame, frame_index, frame_part)
+
+    async def _wait_frame(self, last_index: int) -> int:
+        while self._frame_index <= last_index:
+            await self._new_frame.wait()
+        return self._frame_index
+
+    @staticmethod
+    def _response(status: bytes, content_type: bytes, body: bytes) -> bytes:
+        return (b'HTTP/1.1 ' + status + b'\r\nContent-Type: ' + content_type +
+                b'\r\nContent-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+
+    async def _stream_video(self, writer: asyncio.StreamWriter) -> None:
+        writer.write(self._stream_headers)
+        frame_index = 0
+        while True:
+            frame_index = await self._wait_frame(frame_index)
+            writer.write(self._frame_part)
+            await writer.drain()
+
+    def _db_image(self, event_id: int) -> bytes:
+        image = self._gallery_cache.get(event_id) or b''
+        body = b'--frame\r\n' + b'Content-Type: image/jpeg\r\n\r\n' + image + b'\r\n'
+        return self._response(b'200 OK', b'multipart/x-mixed-replace; boundary=frame', body)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients_count += 1
+        try:
+            if self._clients_count > self._max_clients:
+                writer.write(self._response(b'503 Service Unavailable', b'text/plain', b'Too many clients'))
+                return
+            request_head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self._request_timeout)
+            method, path, _ = request_head.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+            path = path.split('?', 1)[0]
+            db_match = self._db_path.fullmatch(path)
+            if method != 'GET':
+                writer.write(self._response(b'405 Method Not Allowed', b'text/plain', b''))
+            elif path == '/video_feed':
+                await self._stream_video(writer)
+            elif db_match:
+                writer.write(self._db_image(int(db_match.group(1))))
+            else:
+                writer.write(self._response(b'404 Not Found', b'text/plain', b''))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError,
+                ConnectionError):
+            # Некорректный запрос или зритель отключился.
+            pass
+        finally:
+            self._clients_count -= 1
+            writer.close()
+
+    async def serve_forever(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._new_frame = asyncio.Event()
+        self._frame_broadcaster.add_listener(self._on_frame)
+        server = await asyncio.start_server(self._handle, self._host, self._port)
+        logging.debug(f'Async stream server started on {self._host}:{self._port}')
+        async with server:
+            await server.serve_forever()
@@ -1,49 +1,315 @@
 import logging
-from typing import List
+import select
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
 
 import psycopg2
+from psycopg2.extensions import connection as Connection
+from psycopg2.extras import execute_batch
+from psycopg2.pool import ThreadedConnectionPool
+
+from .blob_store import BlobStore, FileBlobStore
 
 logging.basicConfig(level=logging.DEBUG)
 
+T = TypeVar('T')
+
+
+class Crop(NamedTuple):
+    """Изображение человека, принявшего позу, и метаданные события."""
+    image: bytes
+    timestamp: datetime
+    stream_id: str
+    frame_index: int
+    track_index: int
+    bbox: Tuple[int, int, int, int]
+    score: float
+    pose: str
+
+
+class Event(NamedTuple):
+    """Событие, прочитанное из БД. Изображение читается отдельно по blob_key методом get_image."""
+    id: int
+    timestamp: datetime
+    stream_id: str
+    frame_index: int
+    track_index: int
+    bbox: Tuple[int, int, int, int]
+    score: float
+    pose: str
+    blob_key: str
+
+
+# Позиция в выборке событий для постраничного чтения: (время, id) последнего прочитанного события
+EventCursor = Tuple[datetime, int]
+
 
 class DBHandler:
-    def __init__(self, db_name: str, user: str, password: str, host: str = None, port: int = None):
+    """
+    Класс доступа к БД, общий для всех потоков приложения.
+    Соединения берутся из пула; если свободных соединений нет, поток ждет освобождения.
+    Разорванное соединение удаляется из пула, запрос повторяется на новом соединении с экспоненциальной задержкой.
+    Запросы выполняются подготовленными операторами (PREPARE), которые создаются при первом использовании соединения.
+    Содержимое изображений хранится в blob_store, в БД - только метаданные и ключ изображения.
+    """
+    # Подготовленные операторы: имя -> (типы параметров, запрос)
+    _statements = {
+        'insert_event': ('timestamptz, text, integer, integer, integer, integer, integer, integer, real, text, text',
+                         'INSERT INTO events (created_at, stream_id, frame_index, track_index, '
+                         'min_x, min_y, max_x, max_y, score, pose, blob_key) '
+                         'VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)'),
+        'last_n_blob_keys': ('integer', 'SELECT blob_key FROM events ORDER BY id DESC LIMIT $1'),
+        'blob_keys_after': ('bigint, integer', 'SELECT id, blob_key FROM events WHERE id > $1 ORDER BY id DESC LIMIT $2'),
+    }
+    _event_columns = ('id, created_at, stream_id, frame_index, track_index, '
+                      'min_x, min_y, max_x, max_y, score, pose, blob_key')
+    _connection_errors = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Статистика использования пула соединений."""
+        with self._stats_lock:
+            return {
+                'max_connections': self._max_connections,
+                'connections_in_use': self._in_use,
+                'peak_connections_in_use': self._peak_in_use,
+                'acquisitions': self._acquisitions,
+                'wait_time_total_s': self._wait_time,
+                'reconnects': self._reconnects,
+            }
+
+    def __init__(self, db_name: str, user: str, password: str, host: str = None, port: int = None,
+                 blob_store: BlobStore = None, min_connections: int = 1, max_connections: int = 4,
+                 retry_attempts: int = 5, retry_delay: float = 0.5, max_retry_delay: float = 8.):
+        """
+        blob_store - хранилище изображений, по умолчанию FileBlobStore в директории blob_store;
+        retry_attempts - число попыток выполнить запрос при потере соединения;
+        retry_delay - задержка перед второй попыткой, далее она удваивается до max_retry_delay.
+        """
         self._db_name = db_name
         self._user = user
         self._password = password
         self._host = host
         self._port = port
+        self._min_connections = min_connections
+        self._max_connections = max_connections
+        self._retry_attempts = retry_attempts
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._blob_store = blob_store or FileBlobStore('blob_store')
 
-    def connect(self) -> None:
+        self._pool = None
+        self._listen_connection = None
+        self._available = BoundedSemaphore(max_connections)
+        # Соединения, для которых выполнен PREPARE. Хранятся сами объекты, а не id: пул закрывает лишние
+        # возвращенные соединения, и id нового соединения может совпасть с id закрытого.
+        self._prepared = weakref.WeakSet()
+        self._stats_lock = Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquisitions = 0
+        self._wait_time = 0.
+        self._reconnects = 0
+
+    def _connection_params(self) -> dict:
         if self._host and self._port:
-            connection_params = {
+            return {
                 'dbname': self._db_name,
                 'user': self._user,
                 'password': self._password,
                 'host': self._host,
                 'port': self._port
             }
-        else:
-            connection_params = {
-                'dbname': self._db_name,
-                'user': self._user,
-            }
-        self._connection = psycopg2.connect(**connection_params)
+        return {
+            'dbname': self._db_name,
+            'user': self._user,
+        }
+
+    def _retry(self, action: Callable[[], T]) -> T:
+        delay = self._retry_delay
+        for attempt in range(1, self._retry_attempts + 1):
+            try:
+                return action()
+            except self._connection_errors as e:
+                if attempt == self._retry_attempts:
+                    raise
+                logging.warning(f'Database connection error (attempt {attempt}): {e}')
+                time.sleep(delay)
+                delay = min(delay * 2, self._max_retry_delay)
+                with self._stats_lock:
+                    self._reconnects += 1
+
+    def connect(self) -> None:
+        self._pool = self._retry(lambda: ThreadedConnectionPool(self._min_connections, self._max_connections,
+                                                                **self._connection_params()))
         logging.debug('Database is connected')
 
     def disconnect(self) -> None:
-        self._connection.close()
+        if self._pool is None:
+            return
+        self._pool.closeall()
+        self._pool = None
+        self._listen_connection = None
+        self._prepared.clear()
         logging.debug('Database is disconnected')
 
-    def insert_image(self, img_data: bytes) -> None:
-        sql = 'INSERT INTO images (image) VALUES (%s)'
-        with self._connection.cursor() as cursor:
-            cursor.execute(sql, (img_data,))
-        self._connection.commit()
+    def _prepare(self, connection: Connection) -> None:
+        with connection.cursor() as cursor:
+            for name, (types, sql) in self._statements.items():
+                cursor.execute(f'PREPARE {name} ({types}) AS {sql}')
+        connection.commit()
+        self._prepared.add(connection)
+
+    @contextmanager
+    def _connection(self) -> Iterator[Connection]:
+        """Соединение из пула. Транзакция фиксируется при успешном выходе и откатывается при ошибке."""
+        start = time.monotonic()
+        self._available.acquire()
+        with self._stats_lock:
+            self._wait_time += time.monotonic() - start
+            self._acquisitions += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        connection = None
+        broken = False
+        try:
+            connection = self._pool.getconn()
+            if connection not in self._prepared:
+                self._prepare(connection)
+            yield connection
+            connection.commit()
+        except self._connection_errors:
+            broken = True
+            raise
+        except Exception:
+            if connection is not None:
+                connection.rollback()
+            raise
+        finally:
+            if connection is not None:
+                if broken or connection.closed:
+                    self._prepared.discard(connection)
+                self._pool.putconn(connection, close=broken or bool(connection.closed))
+            with self._stats_lock:
+                self._in_use -= 1
+            self._available.release()
+
+    def _execute(self, action: Callable[[Connection], T]) -> T:
+        def attempt() -> T:
+            with self._connection() as connection:
+                return action(connection)
+        return self._retry(attempt)
+
+    def insert_image(self, crop: Crop) -> None:
+        self.insert_images([crop])
+
+    def insert_images(self, crops: List[Crop]) -> None:
+        """
+        Метод записи нескольких изображений за одно обращение к БД в одной транзакции.
+        Изображения сохраняются в хранилище до записи метаданных, поэтому строки БД всегда ссылаются
+        на существующие данные.
+        """
+        rows = [(crop.timestamp, crop.stream_id, crop.frame_index, crop.track_index, *crop.bbox, crop.score,
+                 crop.pose, self._blob_store.put(crop.image)) for crop in crops]
+
+        def insert(connection: Connection) -> None:
+            with connection.cursor() as cursor:
+                execute_batch(cursor, 'EXECUTE insert_event (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)', rows,
+                              page_size=len(rows))
+        self._execute(insert)
+
+    def get_events(self, start: datetime = None, end: datetime = None, stream_id: str = None,
+                   track_index: int = None, after: EventCursor = None, limit: int = 100,
+                   descending: bool = False) -> Tuple[List[Event], Optional[EventCursor]]:
+        """
+        Метод постраничного чтения событий за интервал [start, end) с фильтрами по потоку и треку
+        (номер трека уникален только в пределах потока). Страницы читаются по ключу (время, id),
+        а не со смещением, поэтому чтение любой страницы использует индекс и не зависит от её номера.
+        Возвращает события и позицию для чтения следующей страницы (after) или None, если страница последняя.
+        """
+        conditions, params = [], []
+        for condition, value in (('created_at >= %s', start), ('created_at < %s', end),
+                                 ('stream_id = %s', stream_id), ('track_index = %s', track_index)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if after is not None:
+            conditions.append(f'(created_at, id) {"<" if descending else ">"} (%s, %s)')
+            params.extend(after)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        order = 'DESC' if descending else 'ASC'
+        sql = f'SELECT {self._event_columns} FROM events {where} ORDER BY created_at {order}, id {order} LIMIT %s'
+
+        def select(connection: Connection) -> List[tuple]:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, (*params, limit))
+                return cursor.fetchall()
+
+        events = [Event(event_id, timestamp, stream, frame_index, track, (min_x, min_y, max_x, max_y), score, pose,
+                        key)
+                  for event_id, timestamp, stream, frame_index, track, min_x, min_y, max_x, max_y, score, pose, key
+                  in self._execute(select)]
+        cursor = (events[-1].timestamp, events[-1].id) if events and len(events) == limit else None
+        return events, cursor
+
+    def get_latest_blob_keys(self, after_id: int, n: int) -> List[Tuple[int, str]]:
+        """Метод получения id и ключей изображений не более n последних событий с id больше after_id."""
+        def select_keys(connection: Connection) -> List[Tuple[int, str]]:
+            with connection.cursor() as cursor:
+                cursor.execute('EXECUTE blob_keys_after (%s, %s)', (after_id, n))
+                return cursor.fetchall()
+        return self._execute(select_keys)
+
+    def close_listen_connection(self) -> None:
+        """Метод закрытия соединения ожидания уведомлений. Следующий вызов wait_notification создаст его заново."""
+        if self._listen_connection is not None:
+            try:
+                self._listen_connection.close()
+            except psycopg2.Error:
+                pass
+            self._listen_connection = None
+
+    def wait_notification(self, channel: str, timeout: float) -> bool:
+        """
+        Метод ожидания уведомления NOTIFY на канале channel не дольше timeout секунд.
+        Использует отдельное соединение вне пула. Должен вызываться из одного потока.
+        Возвращает True, если уведомление получено; при ошибке соединения возвращает False
+        (соединение будет создано заново при следующем вызове).
+        """
+        try:
+            if self._listen_connection is None:
+                self._listen_connection = psycopg2.connect(**self._connection_params())
+                self._listen_connection.autocommit = True
+                with self._listen_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {channel}')
+            if select.select([self._listen_connection], [], [], timeout)[0]:
+                self._listen_connection.poll()
+            notified = bool(self._listen_connection.notifies)
+            self._listen_connection.notifies.clear()
+            return notified
+        except self._connection_errors as e:
+            logging.warning(f'Database notification connection error: {e}')
+            self.close_listen_connection()
+            time.sleep(timeout)
+            return False
+
+    def get_image(self, blob_key: str) -> bytes:
+        return self._blob_store.get(blob_key)
 
     def get_last_n_images(self, n: int) -> List[bytes]:
-        sql = 'SELECT image FROM images ORDER BY id DESC LIMIT %s'
-        with self._connection.cursor() as cursor:
-            cursor.execute(sql, (n,))
-            img_data = cursor.fetchall()
-        return [bytes(img[0]) for img in img_data]
+        def select(connection: Connection) -> List[str]:
+            with connection.cursor() as cursor:
+                cursor.execute('EXECUTE last_n_blob_keys (%s)', (n,))
+                return [key for key, in cursor.fetchall()]
+
+        images = []
+        for key in self._execute(select):
+            try:
+                images.append(self._blob_store.get(key))
+            except KeyError:
+                logging.warning(f'Image {key} is missing from the blob store')
+        return images
@@ -0,0 +1,50 @@
+import logging
+from threading import Condition, Thread
+from typing import Callable, List, Optional, Tuple
+
+from .tcp_client import TcpClient
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FrameBroadcaster(Thread):
+    """
+    Поток, получающий кадры от video_processing по одному соединению и раздающий их всем зрителям.
+    Каждый кадр один раз оформляется в часть ответа multipart/x-mixed-replace и публикуется с номером.
+    Зрители ждут кадр с номером больше последнего полученного, поэтому медленный зритель
+    пропускает промежуточные кадры и получает последний. Число зрителей не влияет на нагрузку на video_processing.
+    """
+
+    def __init__(self, stream_receiver: TcpClient, *args, **kwargs):
+        self._stream_receiver = stream_receiver
+        self._frame_part: bytes = b''
+        self._frame_index = 0
+        self._frame_condition = Condition()
+        self._listeners: List[Callable[[int, bytes], None]] = []
+        super().__init__(*args, **kwargs)
+
+    def add_listener(self, listener: Callable[[int, bytes], None]) -> None:
+        """Метод подписки на кадры: listener вызывается в потоке FrameBroadcaster с номером кадра и частью ответа."""
+        self._listeners.append(listener)
+
+    def run(self) -> None:
+        while True:
+            frame = self._stream_receiver.receive()
+            frame_part = b'--frame\r\n' + b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n'
+            with self._frame_condition:
+                self._frame_part = frame_part
+                self._frame_index += 1
+                frame_index = self._frame_index
+                self._frame_condition.notify_all()
+            for listener in self._listeners:
+                listener(frame_index, frame_part)
+
+    def wait_frame(self, last_index: int, timeout: float = None) -> Tuple[int, Optional[bytes]]:
+        """
+        Метод ожидания кадра новее кадра last_index. Возвращает номер кадра и часть ответа с кадром
+        или last_index и None, если за timeout секунд новый кадр не появился.
+        """
+        with self._frame_condition:
+            if not self._frame_condition.wait_for(lambda: self._frame_index > last_index, timeout):
+                return last_index, None
+            return self._frame_index, self._frame_part
@@ -0,0 +1,68 @@
+import logging
+from threading import Event, Thread
+from typing import Optional, Tuple
+
+from .database_handler.db_handler import DBHandler
+
+logging.basicConfig(level=logging.DEBUG)
+
+# Последние изображения: (id события, изображение), от новых к старым
+Gallery = Tuple[Tuple[int, bytes], ...]
+
+
+class GalleryCache(Thread):
+    """
+    Поток, поддерживающий в памяти последние size изображений из БД, общие для всех клиентов.
+    Обновление инкрементное: из БД читаются только события с id больше последнего известного,
+    старые изображения вытесняются новыми. Обновление запускается уведомлением NOTIFY от триггера
+    на вставку событий, а при его отсутствии - раз в poll_interval секунд.
+    Кэш хранится неизменяемым кортежем, который заменяется целиком, поэтому клиенты читают его без блокировок
+    и всегда видят согласованный набор изображений.
+    """
+    _channel = 'events'
+
+    @property
+    def gallery(self) -> Gallery:
+        return self._gallery
+
+    def __init__(self, db_handler: DBHandler, size: int = 10, poll_interval: float = 5., *args, **kwargs):
+        self._db_handler = db_handler
+        self._size = size
+        self._poll_interval = poll_interval
+        self._gallery: Gallery = ()
+        self._last_id = 0
+        self._stopped = Event()
+        super().__init__(*args, **kwargs)
+
+    def get(self, event_id: int) -> Optional[bytes]:
+        """Метод получения изображения события из кэша. Возвращает None, если изображение уже вытеснено."""
+        return dict(self._gallery).get(event_id)
+
+    def refresh(self) -> None:
+        """Метод загрузки событий, появившихся после последнего обновления."""
+        rows = self._db_handler.get_latest_blob_keys(self._last_id, self._size)
+        if not rows:
+            return
+        new_images = []
+        for event_id, blob_key in rows:
+            try:
+                new_images.append((event_id, self._db_handler.get_image(blob_key)))
+            except KeyError:
+                logging.warning(f'Image {blob_key} is missing from the blob store')
+        self._last_id = rows[0][0]
+        self._gallery = (*new_images, *self._gallery)[:self._size]
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+                self._db_handler.wait_notification(self._channel, self._poll_interval)
+            except Exception as e:
+                # Поток не должен завершаться из-за ошибки, иначе кэш перестанет обновляться. Соединение ожидания
+                # уведомлений могло остаться в неизвестном состоянии, поэтому оно создается заново.
+                logging.warning(f'Failed to refresh gallery: {e!r}')
+                self._db_handler.close_listen_connection()
+                self._stopped.wait(self._poll_interval)
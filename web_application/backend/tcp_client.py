@@ -1,22 +1,48 @@
+import logging
 import socket
+import time
+
+from .frame_protocol import VARIANT_FULL, VARIANTS, recv_frame
+
+logging.basicConfig(level=logging.DEBUG)
 
 
 class TcpClient:
-    """Класс TCP-клиента, опрашивающего сервер для получения результатов сегментации."""
+    """
+    Класс TCP-клиента, получающего кадры от сервера по постоянному соединению.
+    Сервер сам присылает каждый новый кадр; при разрыве соединения клиент переподключается.
+    Если задан вариант кадров (frame_protocol.VARIANTS), клиент запрашивает его после подключения.
+    """
+    # Пауза перед повторным подключением, с
+    _reconnect_interval = 1.
 
-    def __init__(self, ip: str, port: int):
+    def __init__(self, ip: str, port: int, variant: bytes = VARIANT_FULL):
+        if variant not in VARIANTS:
+            raise ValueError(f'Unknown frame variant: {variant}')
         self.ip = ip
         self.port = port
+        self._variant = variant
+        self._socket = None
+
+    def connect(self) -> None:
+        self._socket = socket.create_connection((self.ip, self.port))
+        if self._variant != VARIANT_FULL:
+            self._socket.sendall(self._variant)
+        logging.debug(f'Connected to stream {self.ip}:{self.port}')
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
 
     def receive(self) -> bytes:
-        """Метод получения данных от сервера."""
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((self.ip, self.port))
-            request = []
-            while True:
-                packet = s.recv(4096)
-                if not packet:
-                    break
-                request.append(packet)
-            package = b"".join(request)
-            return package
+        """Метод получения очередного кадра. Блокируется до получения кадра."""
+        while True:
+            try:
+                if self._socket is None:
+                    self.connect()
+                return recv_frame(self._socket)
+            except OSError as e:
+                logging.debug(f'Stream connection error: {e}')
+                self.close()
+                time.sleep(self._reconnect_interval)
@@ -1,43 +1,151 @@
+import asyncio
+import base64
+import json
 import logging
+from datetime import datetime
+from threading import Thread
 
-from flask import Flask, Response, render_template
+from flask import Flask, Response, abort, jsonify, render_template, request, url_for
 
+from .async_server import AsyncStreamServer
+from .database_handler.blob_store import FileBlobStore
 from .database_handler.db_handler import DBHandler
+from .frame_broadcaster import FrameBroadcaster
+from .frame_protocol import VARIANT_FULL, VARIANT_PREVIEW
+from .gallery_cache import GalleryCache
 from .tcp_client import TcpClient
 
 logging.basicConfig(level=logging.DEBUG)
 
 
 class WebApplication(Flask):
+    # Период проверки появления нового кадра для зрителя, с
+    _frame_wait_timeout = 1.
+    # Наибольшее число событий на странице /events
+    _max_events_limit = 1000
+
     def __init__(self, db_name: str, db_user: str, db_password: str, db_host: str, db_port: int,
-                 stream_host: str, stream_port: int,
+                 stream_host: str, stream_port: int, db_max_connections: int = 4,
+                 blob_store_path: str = 'blob_store', gallery_size: int = 10, gallery_poll_interval: float = 5.,
+                 async_port: int = None, async_max_clients: int = 1000, stream_preview: bool = False,
                  *args, **kwargs):
-        self._db_handler = DBHandler(db_name, db_user, db_password, db_host, db_port)
-        self._stream_receiver = TcpClient(stream_host, stream_port)
+        """
+        async_port - порт, на котором /video_feed и /db/<int:event_id> обслуживаются AsyncStreamServer
+        (страница ссылается на него); если не задан, эти адреса обслуживает Flask.
+        stream_preview - показывать уменьшенную копию видео, если video_processing ее создает.
+        """
+        self._db_handler = DBHandler(db_name, db_user, db_password, db_host, db_port, FileBlobStore(blob_store_path),
+                                     max_connections=db_max_connections)
+        self._frame_broadcaster = FrameBroadcaster(TcpClient(stream_host, stream_port,
+                                                             VARIANT_PREVIEW if stream_preview else VARIANT_FULL),
+                                                   name='frame_broadcaster_thread', daemon=True)
+        self._frame_broadcaster.start()
         self._db_handler.connect()
-        self._last_ten_images = None
+        self._gallery_cache = GalleryCache(self._db_handler, gallery_size, gallery_poll_interval,
+                                           name='gallery_cache_thread', daemon=True)
+        self._gallery_cache.start()
+        self._async_port = async_port
+        self._async_max_clients = async_max_clients
         super().__init__(*args, **kwargs)
         self.route("/")(self._index)
         self.route("/video_feed")(self._video_feed)
-        self.route("/db/<int:img_index>")(self._get_db_images)
+        self.route("/db/<int:event_id>")(self._get_db_images)
+        self.route("/db/stats")(self._get_db_stats)
+        self.route("/events")(self._get_events)
+        self.route("/events/image/<blob_key>")(self._get_event_image)
         logging.debug('Server is ready')
 
+    def run(self, host: str = None, port: int = None, *args, **kwargs) -> None:
+        if self._async_port:
+            async_server = AsyncStreamServer(self._frame_broadcaster, self._gallery_cache, host, self._async_port,
+                                             self._async_max_clients)
+            Thread(target=asyncio.run, args=(async_server.serve_forever(),), name='async_server_thread',
+                   daemon=True).start()
+        super().run(host, port, *args, **kwargs)
+
+    def _stream_url(self, endpoint: str, **values) -> str:
+        url = url_for(endpoint, **values)
+        if self._async_port:
+            url = f'{request.scheme}://{request.host.rsplit(":", 1)[0]}:{self._async_port}{url}'
+        return url
+
     def _index(self):
-        self._last_ten_images: list = self._db_handler.get_last_n_images(10)
-        return render_template('index.html')
+        # Страница ссылается на изображения по id событий, поэтому все изображения страницы - из одного снимка кэша.
+        gallery_urls = [self._stream_url('_get_db_images', event_id=event_id)
+                        for event_id, _ in self._gallery_cache.gallery]
+        return render_template('index.html', stream_url=self._stream_url('_video_feed'), gallery_urls=gallery_urls)
 
     def _get_video_stream(self) -> bytes:
+        frame_index = 0
         while True:
-            frame: bytes = self._stream_receiver.receive()
-            yield b'--frame\r\n' + b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n'
+            frame_index, frame_part = self._frame_broadcaster.wait_frame(frame_index, self._frame_wait_timeout)
+            if frame_part is not None:
+                yield frame_part
 
-    def _get_db_images(self, img_index):
-        try:
-            image = self._last_ten_images[img_index]
-        except IndexError:
-            image = b''
+    def _get_db_images(self, event_id):
+        image = self._gallery_cache.get(event_id) or b''
         response_str = b'--frame\r\n' + b'Content-Type: image/jpeg\r\n\r\n' + image + b'\r\n'
         return Response(response_str, mimetype='multipart/x-mixed-replace; boundary=frame')
 
     def _video_feed(self):
         return Response(self._get_video_stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+    def _get_db_stats(self):
+        return jsonify(self._db_handler.stats)
+
+    @staticmethod
+    def _encode_cursor(query: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(query).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> dict:
+        query = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(query, dict):
+            raise ValueError(f'Invalid cursor: {cursor}')
+        return query
+
+    def _get_events(self):
+        """
+        События обнаружения позы. Параметры: start, end (ISO 8601), stream, track, limit (1-1000), order (asc/desc)
+        и after - значение next из предыдущего ответа для чтения следующей страницы. Курсор next непрозрачный,
+        пригоден для вставки в URL и содержит фильтры и порядок первого запроса, поэтому следующая страница
+        запрашивается как /events?after=<next>; из остальных параметров вместе с курсором учитывается только limit.
+        """
+        args = request.args
+        try:
+            if 'after' in args:
+                query = self._decode_cursor(args['after'])
+                timestamp, event_id = query.pop('after')
+                after = (datetime.fromisoformat(timestamp), int(event_id))
+            else:
+                query = {name: args[name] for name in ('start', 'end', 'stream', 'track', 'order', 'limit')
+                         if name in args}
+                after = None
+            if 'limit' in args:
+                query['limit'] = args['limit']
+            start = datetime.fromisoformat(query['start']) if 'start' in query else None
+            end = datetime.fromisoformat(query['end']) if 'end' in query else None
+            track_index = int(query['track']) if 'track' in query else None
+            limit = int(query.get('limit', 100))
+            order = query.get('order', 'asc')
+            stream_id = query.get('stream')
+            if stream_id is not None and not isinstance(stream_id, str):
+                raise ValueError(f'Invalid stream: {stream_id}')
+        except (ValueError, TypeError, KeyError):
+            abort(400)
+        if not 1 <= limit <= self._max_events_limit or order not in ('asc', 'desc'):
+            abort(400)
+        events, cursor = self._db_handler.get_events(start=start, end=end, stream_id=stream_id,
+                                                     track_index=track_index, after=after, limit=limit,
+                                                     descending=order == 'desc')
+        next_cursor = None
+        if cursor:
+            next_cursor = self._encode_cursor({**query, 'after': (cursor[0].isoformat(), cursor[1])})
+        return jsonify(events=[dict(event._asdict(), timestamp=event.timestamp.isoformat()) for event in events],
+                       next=next_cursor)
+
+    def _get_event_image(self, blob_key: str):
+        try:
+            return Response(self._db_handler.get_image(blob_key), mimetype='image/jpeg')
+        except KeyError:
+            abort(404)
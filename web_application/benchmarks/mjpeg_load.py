@@ -0,0 +1,135 @@
+"""
+Нагрузочный тест видеопотока: открывает много одновременных MJPEG-клиентов /video_feed.
+Без --url поднимает локально AsyncStreamServer и заглушку video_processing, которая отдает синтетические
+кадры по протоколу frame_protocol с заданной частотой; в кадр записывается время отправки для измерения задержки.
+С --url нагружает уже запущенный сервер (задержка не измеряется).
+Запуск из директории web_application: python3 -m benchmarks.mjpeg_load --clients 500
+"""
+import argparse
+import asyncio
+import resource
+import statistics
+import time
+from threading import Thread
+from urllib.parse import urlsplit
+
+from backend.async_server import AsyncStreamServer
+from backend.frame_broadcaster import FrameBroadcaster
+from backend.frame_protocol import pack_frame
+from backend.tcp_client import TcpClient
+
+# Конец заголовка части с кадром
+_part_header_end = b'image/jpeg\r\n\r\n'
+_timestamp_size = 20
+
+
+class _EmptyGallery:
+    """Заглушка GalleryCache."""
+
+    @staticmethod
+    def get(event_id: int) -> None:
+        return None
+
+
+async def serve_frames(port: int, fps: float, frame_size: int) -> None:
+    """Заглушка video_processing: отправляет каждому подключенному клиенту кадры с временем отправки."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        filler = b'x' * (frame_size - _timestamp_size)
+        try:
+            while True:
+                writer.write(pack_frame(b'%*.6f' % (_timestamp_size, time.time()) + filler))
+                await writer.drain()
+                await asyncio.sleep(1 / fps)
+        except (ConnectionError, asyncio.CancelledError):
+            # Клиент отключился или тест завершен.
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', port)
+    async with server:
+        await server.serve_forever()
+
+
+def start_stand_in_stack(source_port: int, server_port: int) -> AsyncStreamServer:
+    frame_broadcaster = FrameBroadcaster(TcpClient('127.0.0.1', source_port), daemon=True)
+    frame_broadcaster.start()
+    async_server = AsyncStreamServer(frame_broadcaster, _EmptyGallery(), '127.0.0.1', server_port)
+    Thread(target=asyncio.run, args=(async_server.serve_forever(),), daemon=True).start()
+    return async_server
+
+
+async def run_client(host: str, port: int, path: str, deadline: float, frame_size: int, measure_latency: bool,
+                     stats: dict) -> None:
+    reader, writer = await asyncio.open_connection(host, port, limit=2 * frame_size + 1024)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    await reader.readuntil(b'\r\n\r\n')
+    frames = 0
+    try:
+        while time.monotonic() < deadline:
+            # Без известного размера кадра кадр пропускается при поиске заголовка следующей части.
+            await asyncio.wait_for(reader.readuntil(_part_header_end), deadline - time.monotonic())
+            frames += 1
+            if measure_latency:
+                frame = await reader.readexactly(frame_size)
+                stats['latencies'].append(time.time() - float(frame[:_timestamp_size]))
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        writer.close()
+    stats['frames'].append(frames)
+
+
+def percentile(values: list, q: float) -> float:
+    return sorted(values)[min(int(len(values) * q), len(values) - 1)] if values else float('nan')
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    async_server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port, path = url.hostname, url.port or 80, url.path or '/video_feed'
+    else:
+        host, port, path = '127.0.0.1', args.server_port, '/video_feed'
+        asyncio.create_task(serve_frames(args.source_port, args.fps, args.frame_size))
+        await asyncio.sleep(0.2)
+        async_server = start_stand_in_stack(args.source_port, args.server_port)
+        await asyncio.sleep(0.5)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats = {'frames': [], 'latencies': []}
+    deadline = time.monotonic() + args.duration
+    clients = [run_client(host, port, path, deadline, args.frame_size, async_server is not None, stats)
+               for _ in range(args.clients)]
+    clients_task = asyncio.gather(*clients, return_exceptions=True)
+    await asyncio.sleep(args.duration / 2)
+    connected = async_server.clients_count if async_server else None
+    results = await clients_task
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    fps = [frames / args.duration for frames in stats['frames']]
+    print(f'clients: {args.clients}, failed: {len(errors)}, connected to server mid-test: {connected}')
+    if fps:
+        print(f'fps per client: min {min(fps):.1f}, median {statistics.median(fps):.1f}, max {max(fps):.1f} '
+              f'(source {args.fps:.1f})')
+    if stats['latencies']:
+        latencies = [latency * 1e3 for latency in stats['latencies']]
+        print(f'latency, ms: p50 {percentile(latencies, 0.5):.1f}, p95 {percentile(latencies, 0.95):.1f}, '
+              f'p99 {percentile(latencies, 0.99):.1f}')
+    print(f'max RSS growth, MiB: {(rss_after - rss_before) / 1024:.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Адрес /video_feed запущенного сервера, например http://localhost:5002/video_feed')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10., help='Длительность теста, с')
+    parser.add_argument('--fps', type=float, default=25., help='Частота кадров заглушки')
+    parser.add_argument('--frame-size', type=int, default=50000, help='Размер кадра, байт')
+    parser.add_argument('--source-port', type=int, default=18600)
+    parser.add_argument('--server-port', type=int, default=18601)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
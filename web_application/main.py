@@ -10,5 +10,12 @@ if __name__ == "__main__":
                          db_port=config('DB_PORT', cast=int),
                          stream_host=config('STREAM_HOST'),
                          stream_port=config('STREAM_PORT', cast=int),
+                         db_max_connections=config('DB_MAX_CONNECTIONS', default=4, cast=int),
+                         blob_store_path=config('BLOB_STORE_PATH', default='blob_store'),
+                         gallery_size=config('GALLERY_SIZE', default=10, cast=int),
+                         gallery_poll_interval=config('GALLERY_POLL_INTERVAL', default=5., cast=float),
+                         async_port=config('ASYNC_PORT', default=0, cast=int),
+                         async_max_clients=config('ASYNC_MAX_CLIENTS', default=1000, cast=int),
+                         stream_preview=config('STREAM_PREVIEW', default=False, cast=bool),
                          import_name=__name__)
     app.run(config('HOST'), config('PORT', cast=int), config('DEBUG', cast=bool))
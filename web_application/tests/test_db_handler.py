@@ -0,0 +1,80 @@
+"""
+Тесты DBHandler без сервера Postgres: соединения пула заменяются поддельными.
+Запуск из директории web_application: python3 -m unittest discover tests
+"""
+import tempfile
+import unittest
+from unittest import mock
+
+import psycopg2
+from psycopg2 import extensions
+
+from backend.database_handler.blob_store import FileBlobStore
+from backend.database_handler.db_handler import DBHandler
+
+
+class FakeCursor:
+    def __init__(self, connection: 'FakeConnection'):
+        self._connection = connection
+
+    def __enter__(self) -> 'FakeCursor':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def execute(self, sql: str, params=None) -> None:
+        command, name = sql.split()[:2]
+        if command == 'PREPARE':
+            self._connection.prepared.add(name)
+        elif command == 'EXECUTE' and name not in self._connection.prepared:
+            raise psycopg2.ProgrammingError(f'prepared statement "{name}" does not exist')
+
+    def fetchall(self) -> list:
+        return []
+
+
+class FakeConnection:
+    """Соединение, которое, как Postgres, помнит подготовленные операторы только до закрытия."""
+    info = mock.Mock(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+
+    def __init__(self, *args, **kwargs):
+        self.prepared = set()
+        self.closed = 0
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = 1
+
+
+class DBHandlerTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('psycopg2.connect', FakeConnection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        blob_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(blob_dir.cleanup)
+        self.db_handler = DBHandler('db', 'user', 'password', blob_store=FileBlobStore(blob_dir.name),
+                                    min_connections=1, max_connections=4, retry_attempts=1)
+        self.db_handler.connect()
+        self.addCleanup(self.db_handler.disconnect)
+
+    def test_new_connections_are_prepared(self):
+        # Одновременно используются два соединения, поэтому пул закрывает одно из них при возврате,
+        # и новые соединения создаются на каждой итерации (их id могут совпадать с id закрытых).
+        for _ in range(200):
+            with self.db_handler._connection():
+                self.db_handler.get_latest_blob_keys(0, 10)
+            self.db_handler.get_latest_blob_keys(0, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Тесты GalleryCache с поддельным обработчиком БД.
+Запуск из директории web_application: python3 -m unittest discover tests
+"""
+import threading
+import unittest
+from unittest import mock
+
+import psycopg2
+
+from backend.gallery_cache import GalleryCache
+
+
+class GalleryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.db_handler = mock.Mock()
+        self.db_handler.get_latest_blob_keys.return_value = []
+        self.db_handler.get_image.side_effect = lambda blob_key: blob_key.encode()
+        self.gallery_cache = GalleryCache(self.db_handler, size=2, poll_interval=0.01, daemon=True)
+        self.addCleanup(self.stop)
+
+    def stop(self) -> None:
+        self.gallery_cache.stop()
+        if self.gallery_cache.is_alive():
+            self.gallery_cache.join(timeout=5.)
+
+    def test_refresh(self):
+        self.db_handler.get_latest_blob_keys.return_value = [(3, 'c'), (2, 'b')]
+        self.gallery_cache.refresh()
+        self.db_handler.get_latest_blob_keys.return_value = [(4, 'd')]
+        self.gallery_cache.refresh()
+        self.assertEqual(self.gallery_cache.gallery, ((4, b'd'), (3, b'c')))
+        self.db_handler.get_latest_blob_keys.assert_called_with(3, 2)
+        self.assertIsNone(self.gallery_cache.get(2))
+
+    def test_notification_error(self):
+        # Ошибка ожидания уведомлений не завершает поток: соединение закрывается, обновление продолжается.
+        recovered = threading.Event()
+        errors = [psycopg2.ProgrammingError('no results to fetch'), psycopg2.DatabaseError('unexpected message')]
+
+        def wait_notification(channel: str, timeout: float) -> bool:
+            if errors:
+                raise errors.pop(0)
+            recovered.set()
+            return False
+        self.db_handler.wait_notification.side_effect = wait_notification
+        self.gallery_cache.start()
+        self.assertTrue(recovered.wait(timeout=5.))
+        self.assertTrue(self.gallery_cache.is_alive())
+        self.assertEqual(self.db_handler.close_listen_connection.call_count, 2)
+        self.assertGreaterEqual(self.db_handler.get_latest_blob_keys.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Тесты API /events без сервера Postgres и video_processing: DBHandler и источники кадров заменяются поддельными.
+Запуск из директории web_application: python3 -m unittest discover tests
+"""
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from backend.database_handler.db_handler import Event
+from backend.web_app import WebApplication
+
+
+def make_events(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [Event(i, start + timedelta(seconds=i), 'cam', i, 0, (0, 0, 1, 1), 1., 'raised_arms', f'key{i}')
+            for i in range(count)]
+
+
+class EventsApiTest(unittest.TestCase):
+    def setUp(self):
+        for name in ('DBHandler', 'FrameBroadcaster', 'GalleryCache', 'TcpClient', 'FileBlobStore'):
+            patcher = mock.patch(f'backend.web_app.{name}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        app = WebApplication('db', 'user', 'password', None, None, 'localhost', 0, import_name=__name__)
+        self.db_handler = app._db_handler
+        self.db_handler.get_events.return_value = (make_events(2), None)
+        self.client = app.test_client()
+
+    def test_invalid_parameters(self):
+        for query in ('limit=0', 'limit=-1', 'limit=1001', 'limit=x', 'start=x', 'end=2024-13-01', 'track=x', 'order=up',
+                      'after=x', 'after=W10'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/events?{query}').status_code, 400)
+        self.db_handler.get_events.assert_not_called()
+
+    def test_max_limit(self):
+        self.assertEqual(self.client.get('/events?limit=1000').status_code, 200)
+        self.assertEqual(self.db_handler.get_events.call_args.kwargs['limit'], 1000)
+
+    def test_empty_page(self):
+        self.db_handler.get_events.return_value = ([], None)
+        response = self.client.get('/events')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'events': [], 'next': None})
+
+    def test_next_page_keeps_filters(self):
+        events = make_events(2)
+        self.db_handler.get_events.return_value = (events, (events[-1].timestamp, events[-1].id))
+        response = self.client.get('/events?start=2024-01-01T00:00:00%2B00:00&stream=cam&track=3&limit=2&order=desc')
+        self.assertEqual(response.status_code, 200)
+        cursor = response.json['next']
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+
+        self.db_handler.get_events.reset_mock()
+        self.db_handler.get_events.return_value = ([], None)
+        self.assertEqual(self.client.get(f'/events?after={cursor}').status_code, 200)
+        self.db_handler.get_events.assert_called_once_with(
+            start=datetime(2024, 1, 1, tzinfo=timezone.utc), end=None, stream_id='cam', track_index=3,
+            after=(events[-1].timestamp, events[-1].id), limit=2, descending=True)
+
+
+if __name__ == '__main__':
+    unittest.main()